@@ -112,7 +112,10 @@ def docs():
 @click.option(
     "-f", "--force", is_flag=True, help="Include spectra with feature parameters."
 )
-def features(args, feature, force):
+@click.option(
+    "--auto", is_flag=True, help="Fit the features without user interaction."
+)
+def features(args, feature, force, auto):
     """Run interactive feature detection for selected spectra."""
     if not args:
         raise ValueError("No query parameters were specified.")
@@ -125,7 +128,7 @@ def features(args, feature, force):
         sys.exit()
 
     feature = feature.split(",") if feature is not None else "all"
-    spectra.inspect_features(feature, force=force, progress=True)
+    spectra.fit_features(feature, auto=auto, force=force, progress=True)
 
 
 @cli_classy.command(context_settings=dict(ignore_unknown_options=True))
@@ -25,3 +25,25 @@ APP_MODE = False
 
 # Maximum missing wavelength range to extrapolate for classification
 EXTRAPOLATION_LIMIT = 4.7  # in percent
+
+# Number of processes to load spectra with
+WORKERS = 1
+
+# Maximum number of resolved targets kept in memory
+TARGET_CACHE_SIZE = 5000
+
+# Maximum number of missing-data patterns with MCFA factorizations kept in memory
+MCFA_CACHE_SIZE = 64
+
+# Cache the spectra preprocessed for classification in the data directory
+CACHE_PREPROCESSED = False
+
+# Miriade ephemeris service used to compute phase angles
+MIRIADE_URL = "http://vo.imcce.fr/webservices/miriade/ephemcc_query.php"
+
+# Maximum number of simultaneous queries to Miriade
+MIRIADE_CONCURRENCY = 20
+
+# Number of retries of failed Miriade queries and the initial delay between them
+MIRIADE_RETRIES = 3
+MIRIADE_BACKOFF = 1  # in seconds, doubled after each retry
@@ -8,6 +8,7 @@ import rocks
 
 from classy import config
 from classy import sources
+from classy import features
 from classy.features import Feature
 from classy import index
 from classy.taxonomies.mahlke import mixnorm
@@ -143,14 +144,11 @@ class Spectrum:
         if not hasattr(self, "filename"):
             return False
 
-        smoothing = preprocessing.load_smoothing()
-
-        if self.filename in smoothing.index.values:
-            return True
-        return False
+        smoothing = preprocessing.lookup_smoothing([self.filename])
+        return not smoothing.empty
 
     def load_smoothing_parameters(self):
-        smoothing = preprocessing.load_smoothing()
+        smoothing = preprocessing.lookup_smoothing([self.filename])
         return smoothing.loc[self.filename].to_dict()
 
     def smooth_interactive(self):
@@ -220,8 +218,7 @@ class Spectrum:
         self.is_smoothed = True
 
     def set_target(self, target):
-        rock = rocks.Rock(target)
-        self.target = rock
+        self.target = index.targets.get(target)
 
     def truncate(self, wave_min=None, wave_max=None):
         """Truncate wavelength range to minimum and maximum value.
@@ -292,18 +289,18 @@ class Spectrum:
             self.phase = np.nan
             return
 
-        ephem = index.phase.query_miriade_syncronously(
+        phases = index.phase.get_phase_angles(
             self.target.name, self.date_obs.split(",")
         )
 
-        if isinstance(ephem, bool):
+        if np.isnan(phases).all():
             self.phase = np.nan
             return
 
-        if len(ephem) == 1:
-            self.phase = ephem.phase.to_list()[0]
+        if len(phases) == 1:
+            self.phase = phases[0]
         else:
-            self.phase = ephem.phase.to_list()
+            self.phase = phases
 
     def classify(self, taxonomy="mahlke"):
         """Classify a spectrum in a given taxonomic system.
@@ -327,14 +324,23 @@ class Spectrum:
                 f"Unknown taxonomy '{taxonomy}'. Choose from {taxonomies.SYSTEMS}."
             )
 
+        self._classify(taxonomy)
+
+    def _classify(self, taxonomy):
+        """Classify a spectrum without writing the preprocessed spectrum to the cache."""
+
+        # Spectra preprocessed in an earlier run are classified without loading them
+        is_cached = _is_cached(self, taxonomy)
+
         # Can the spectrum be classified in the requested taxonomy?
-        if not self.is_classifiable(taxonomy):
+        if not is_cached and not self.is_classifiable(taxonomy):
             getattr(taxonomies, taxonomy).add_classification_results(self, results=None)
             return
 
         # Store for resetting after classification
-        self._wave_pre_class = self.wave.copy()
-        self._refl_pre_class = self.refl.copy()
+        if not is_cached:
+            self._wave_pre_class = self.wave.copy()
+            self._refl_pre_class = self.refl.copy()
 
         # Preprocess and classify as defined by scheme
         getattr(taxonomies, taxonomy).preprocess(self)
@@ -343,8 +349,12 @@ class Spectrum:
         # Reset wavelength and reflectance
         self._wave_preprocessed = self.wave.copy()
         self._refl_preprocessed = self.refl.copy()
-        self.wave = self._wave_pre_class
-        self.refl = self._refl_pre_class
+
+        if is_cached:
+            self.reset_data()
+        else:
+            self.wave = self._wave_pre_class
+            self.refl = self._refl_pre_class
 
     def is_classifiable(self, taxonomy):
         """Check if spectrum can be classified in taxonomic scheme based
@@ -388,7 +398,8 @@ class Spectrum:
         The reflectance will be after the continuum is removed.
         Use spectra._refl_original to get the original reflectance.
         """
-        self.refl /= self.compute_continuum()(self.wave)
+        self.compute_continuum()
+        self.refl /= self.continuum(self.wave)
 
     def inspect_features(self, feature="all", force=False):
         """Run interactive inspection of e-, h-, and/or k-feature.
@@ -465,7 +476,8 @@ class Spectrum:
 
         Notes
         -----
-        The continuum is stored as a callable in the 'continuum' attribute.
+        The continuum is stored as a callable preprocessing.Continuum in the
+        'continuum' attribute.
         """
         self.continuum = preprocessing.compute_convex_hull(self)
 
@@ -512,10 +524,161 @@ class Spectrum:
         data.to_csv(path, index=False)
 
 
+class LazySpectrum(Spectrum):
+    def __init__(self, idx, filename, skip_target=False):
+        """Create a Spectrum from a classy index row without loading its data.
+
+        Parameters
+        ----------
+        idx : dict
+            The row of the spectrum in the classy index.
+        filename : str
+            The filename of the spectrum, the index of the row.
+        skip_target : bool
+            Skip the resolution of the target. Default is False.
+
+        Notes
+        -----
+        The data is loaded on first access to an attribute that is not known
+        from the index, e.g. 'wave' or 'refl'. The target is resolved on first
+        access to 'target'. If the file is missing or unreadable, the error is
+        logged and the data attributes are missing.
+        """
+        self._idx = idx
+        self._skip_target = skip_target
+        self._is_loaded = False
+
+        # Metadata known from the index
+        self.filename = filename
+
+        for attr in [
+            "shortbib",
+            "bibcode",
+            "host",
+            "source",
+            "date_obs",
+            "phase",
+            "N",
+            "wave_min",
+            "wave_max",
+        ]:
+            if attr in idx:
+                setattr(self, attr, idx[attr])
+
+    def __getattr__(self, attr):
+        """Load the data or resolve the target on first access."""
+
+        # Internal and classification attributes are never loaded from file
+        if attr.startswith("__") or attr.startswith("class_") or attr in [
+            "_idx",
+            "_skip_target",
+            "_is_loaded",
+            "pV",
+        ]:
+            raise AttributeError(f"{type(self)} has no attribute '{attr}'")
+
+        if attr == "target":
+            # Skipped targets are not set by loading the data either
+            if self._skip_target:
+                raise AttributeError(f"{type(self)} has no attribute '{attr}'")
+
+            self.set_target(self._idx["name"])
+            return self.target
+
+        # Features access the data only when evaluated
+        if attr in ["e", "h", "k"]:
+            return super().__getattr__(attr)
+
+        if not self._is_loaded:
+            # Spectra with missing or unreadable files lack the data attributes
+            if "_load_error" not in self.__dict__:
+                try:
+                    self.load()
+                    return getattr(self, attr)
+                except (OSError, ValueError, KeyError) as error:
+                    logger.error(f"Could not load spectrum '{self.filename}': {error}")
+                    self._load_error = error
+
+            raise AttributeError(
+                f"{type(self)} has no attribute '{attr}', its data could not be loaded"
+            ) from self._load_error
+
+        return super().__getattr__(attr)
+
+    @property
+    def name(self):
+        """A dynamic short description of the spectrum."""
+
+        # Use the index name rather than resolving the target
+        if "target" in self.__dict__ and isinstance(self.target, rocks.Rock):
+            name = self.target.name
+        else:
+            name = self._idx["name"]
+        return f"{self.source}/{name}"
+
+    def reset_data(self):
+        """Reset the data of the spectrum to the data on file."""
+
+        # Data which is not loaded yet is loaded again on next access
+        if not self._is_loaded:
+            for attr in ["wave", "refl", "refl_err"]:
+                self.__dict__.pop(attr, None)
+            return
+
+        super().reset_data()
+
+    def load(self):
+        """Load the data of the spectrum from the classy data directory."""
+        spec = sources.load_spectrum(
+            pd.Series(self._idx, name=self.filename), skip_target=True
+        )
+
+        # Attributes set since the instantiation take precedence
+        for attr, value in spec.__dict__.items():
+            self.__dict__.setdefault(attr, value)
+
+        self._is_loaded = True
+
+
+def _features_to_fit(spec, feature, force):
+    """Select the features of a spectrum to fit automatically."""
+    return [
+        getattr(spec, f)
+        for f in feature
+        if getattr(spec, f).is_covered
+        and (force or not getattr(spec, f).has_parameters)
+    ]
+
+
+def _is_cached(spec, taxonomy):
+    """Check if a spectrum can be classified without loading its data.
+
+    Parameters
+    ----------
+    spec : classy.Spectrum
+        The spectrum to classify.
+    taxonomy : str
+        The taxonomic system to use.
+
+    Returns
+    -------
+    bool
+        True if the spectrum is not loaded yet and in the cache of preprocessed
+        spectra, else False.
+    """
+    return (
+        isinstance(spec, LazySpectrum)
+        and not spec._is_loaded
+        and index.preprocessed.contains(taxonomy, spec)
+    )
+
+
 class Spectra(list):
     """List of several spectra of individual asteroid."""
 
-    def __init__(self, id=None, skip_target=False, **kwargs):
+    def __init__(
+        self, id=None, skip_target=False, workers=None, lazy=False, **kwargs
+    ):
         """Select spectra from classy index using matching criteria.
 
         Parameters
@@ -523,6 +686,20 @@ class Spectra(list):
         id : int, str, or list
             One or many asteroid identifiers. Optional, default is None,
             in which case no selection based on target identity is done.
+        skip_target : bool
+            Skip the resolution of the targets of the spectra. Default is False.
+        workers : int
+            Number of processes to load the spectra with. Default is None, in
+            which case config.WORKERS is used.
+        lazy : bool
+            Defer loading the data and resolving the targets of the spectra until
+            they are accessed. Default is False.
+
+        Notes
+        -----
+        Spectra whose files are missing or unreadable are reported and left out,
+        so there can be fewer spectra than selected index rows. Compare the
+        'filename' attributes to the index to find the spectra which were left out.
         """
 
         # Check if argument is list of Spectrum instances
@@ -536,9 +713,14 @@ class Spectra(list):
             spectra = id
         else:
             spectra = index.query(id, **kwargs)
-        
 
-        spectra = index.data.load_spectra(spectra, skip_target)
+        if lazy:
+            spectra = [
+                LazySpectrum(idx, filename, skip_target)
+                for filename, idx in zip(spectra.index, spectra.to_dict("records"))
+            ]
+        else:
+            spectra = index.data.load_spectra(spectra, skip_target, workers)
 
         for spec in spectra:
             self.append(spec)
@@ -561,8 +743,74 @@ class Spectra(list):
         return plotting.plot_spectra(list(self), **kwargs)
 
     def classify(self, taxonomy="mahlke"):
+        """Classify the spectra in a given taxonomic system.
+
+        Parameters
+        ----------
+        taxonomy : str
+            The taxonomic system to use. Choose from ['mahlke', 'demeo', 'tholen'].
+            Default is 'mahlke'.
+
+        Notes
+        -----
+        Taxonomies which implement a batch classification preprocess and classify
+        all spectra at once. The results are the same as when calling
+        ``Spectrum.classify`` on each spectrum.
+        """
+
+        # Argument check
+        if taxonomy not in taxonomies.SYSTEMS:
+            raise ValueError(
+                f"Unknown taxonomy '{taxonomy}'. Choose from {taxonomies.SYSTEMS}."
+            )
+
+        system = getattr(taxonomies, taxonomy)
+
+        if not hasattr(system, "classify_batch"):
+            for spec in self:
+                spec._classify(taxonomy=taxonomy)
+
+            index.preprocessed.flush()
+            return
+
+        # Can the spectra be classified in the requested taxonomy?
+        spectra = []
+        cached = set()
+
         for spec in self:
-            spec.classify(taxonomy=taxonomy)
+            # Spectra preprocessed in an earlier run are classified without loading them
+            if _is_cached(spec, taxonomy):
+                cached.add(id(spec))
+                spectra.append(spec)
+                continue
+
+            if not spec.is_classifiable(taxonomy):
+                system.add_classification_results(spec, results=None)
+                continue
+
+            # Store for resetting after classification
+            spec._wave_pre_class = spec.wave.copy()
+            spec._refl_pre_class = spec.refl.copy()
+            spectra.append(spec)
+
+        if not spectra:
+            return
+
+        # Preprocess and classify as defined by scheme
+        system.preprocess_batch(spectra)
+        system.classify_batch(spectra)
+        index.preprocessed.flush()
+
+        # Reset wavelength and reflectance
+        for spec in spectra:
+            spec._wave_preprocessed = spec.wave.copy()
+            spec._refl_preprocessed = spec.refl.copy()
+
+            if id(spec) in cached:
+                spec.reset_data()
+            else:
+                spec.wave = spec._wave_pre_class
+                spec.refl = spec._refl_pre_class
 
     def smooth(self, method="interactive", force=False, progress=True, **kwargs):
         """Smooth spectrum using a Savitzky-Golay filter or univariate spline.
@@ -576,18 +824,100 @@ class Spectra(list):
             smoothing. Default is False. Smoothing parameters are applied in both cases.
         progress : bool
             Show progress bar. Default is True.
+
+        Notes
+        -----
+        Savitzky-Golay filters are applied to all spectra at once, both with the
+        passed parameters and with the parameters stored in the smoothing index.
+        The smoothing index is read once for all spectra.
         """
 
+        if method in ["savgol", "spline"]:
+            if not kwargs:
+                raise ValueError(
+                    "smooth needs to be called with the smoothing parameters specified if method != 'interactive'."
+                )
+
+        # Spectra to smooth with a Savitzky-Golay filter, and their parameters
+        savgol = []
+        remaining = list(self)
+
+        if method == "savgol":
+            savgol = [(spec, kwargs) for spec in self]
+            remaining = []
+
+        elif method == "interactive" and not force:
+            smoothing = preprocessing.lookup_smoothing(
+                [spec.filename for spec in self if hasattr(spec, "filename")]
+            )
+            remaining = []
+
+            for spec in self:
+                if getattr(spec, "filename", None) not in smoothing.index:
+                    remaining.append(spec)
+                    continue
+
+                params = smoothing.loc[spec.filename].to_dict()
+
+                params["polyorder"] = params["deg_savgol"]
+                params["window_length"] = params["window_savgol"]
+                params["k"] = params["deg_spline"]
+
+                spec.truncate(params["wave_min"], params["wave_max"])
+
+                # Should it even be smoothed?
+                if params["smooth"] and params["method"] == "savgol":
+                    savgol.append((spec, params))
+                elif params["smooth"]:
+                    spec.smooth(**params)
+                spec.is_smoothed = True
+
+        if savgol:
+            refls = preprocessing.savitzky_golay_batch(
+                [spec.refl for spec, _ in savgol],
+                [params.get("window_length") for _, params in savgol],
+                [params.get("polyorder") for _, params in savgol],
+            )
+
+            for (spec, _), refl in zip(savgol, refls):
+                spec.refl = refl
+                spec.is_smoothed = True
+
+        if not remaining:
+            return
+
         if progress:
             with utils.progress.mofn as mofn:
-                task = mofn.add_task("Smoothing..", total=len(self))
-                for spec in self:
+                task = mofn.add_task("Smoothing..", total=len(remaining))
+                for spec in remaining:
                     spec.smooth(method, force, **kwargs)
                     mofn.update(task, advance=1)
         else:
-            for spec in self:
+            for spec in remaining:
                 spec.smooth(method, force, **kwargs)
 
+    def compute_continuum(self):
+        """Compute the convex-hull continua of all spectra at once.
+
+        Notes
+        -----
+        The continua are stored as callable preprocessing.Continuum in the
+        'continuum' attribute of each spectrum.
+        """
+        continua = preprocessing.compute_convex_hull_batch(
+            [spec.wave for spec in self], [spec.refl for spec in self]
+        )
+
+        for spec, continuum in zip(self, continua):
+            spec.continuum = continuum
+
+    def remove_continuum(self):
+        """Remove the convex-hull continua from all spectra at once."""
+        self.compute_continuum()
+
+        for spec in self:
+            spec.refl /= spec.continuum(spec.wave)
+
     def inspect_features(self, feature="all", force=False, progress=True):
         """Smooth spectrum using a Savitzky-Golay filter or univariate spline.
 
@@ -617,6 +947,73 @@ class Spectra(list):
                     spec.smooth()
                 spec.inspect_features(feature, force)
 
+    def fit_features(self, feature="all", auto=False, force=False, progress=True):
+        """Fit the e-, h-, and/or k-feature of all spectra.
+
+        Parameters
+        ----------
+        feature: str of list of str
+            Features to fit. Choose from ['all', 'e', 'h', 'k']. Default is 'all'.
+        auto : bool
+            Fit the features without user interaction. Default is False, which
+            runs the interactive inspection like ``inspect_features``.
+        force : bool
+            Include spectra that already have fit parameters. Default is False.
+        progress : bool
+            Show progress bar. Default is True.
+
+        Notes
+        -----
+        In auto mode, spectra with smoothing parameters are smoothed first, like
+        in the interactive inspection. The features covered by the spectra are
+        then fit at once with features.fit_batch and the parameters are added to
+        the feature index in a single write. Spectra without filename are fit but
+        not stored. Features with too few valid points in their window are not fit
+        and not stored.
+        """
+        if not auto:
+            self.inspect_features(feature, force=force, progress=progress)
+            return
+
+        if feature == "all":
+            feature = ["e", "h", "k"]
+
+        feature = [feature] if isinstance(feature, str) else list(feature)
+
+        if not all(f in ["e", "h", "k"] for f in feature):
+            raise ValueError(
+                f"Passed feature is {feature}, expected one of: ['all', 'e', 'h', 'k']"
+            )
+
+        # Only spectra with smoothing parameters are smoothed, without interaction
+        smoothing = preprocessing.lookup_smoothing(
+            [spec.filename for spec in self if hasattr(spec, "filename")]
+        )
+        Spectra(
+            [
+                spec
+                for spec in self
+                if getattr(spec, "filename", None) in smoothing.index
+            ]
+        ).smooth(progress=False)
+
+        fits = []
+
+        if progress:
+            with utils.progress.mofn as mofn:
+                task = mofn.add_task("Fitting Features..", total=len(self))
+                for spec in self:
+                    fits += _features_to_fit(spec, feature, force)
+                    mofn.update(task, advance=1)
+        else:
+            for spec in self:
+                fits += _features_to_fit(spec, feature, force)
+
+        fits = features.fit_batch(fits)
+        features.store_parameters(
+            [feat for feat in fits if hasattr(feat.spec, "filename")]
+        )
+
     def export(self, path=None, columns=None):
         # TODO: Update doc: path no longer required
         def rgetattr(obj, attr, *args):
@@ -1,10 +1,10 @@
 import numpy as np
 import pandas as pd
-from scipy.spatial import ConvexHull
-from scipy import interpolate, signal
 
 from classy import config
 from classy import index
+from classy import preprocessing
+from classy import utils
 from classy.utils.logging import logger
 
 
@@ -32,17 +32,44 @@ FEATURE = {
     },
 }
 
+# Default degree of the polynomial fit to the continuum-removed feature
+DEG_POLY = 4
+
+# Maximum offset of an automatically fitted band center from the mean center, in std
+AUTO_CENTER_SIGMA = 3
+
+# Minimum ratio of the band depth to the noise of an automatically fitted feature
+AUTO_DEPTH_NOISE = 3
+
+
+# Columns of the feature index and their types
+COLUMNS = {
+    "type_continuum": str,
+    "deg_poly": int,
+    "is_present": bool,
+    "lower": float,
+    "upper": float,
+    "center": float,
+    "depth": float,
+    "noise": float,
+}
+
 
 def store(features):
     """Store the feature index after copying metadata from the spectra index."""
+    _migrate()
+
     with np.errstate(invalid="ignore"):
         features["number"] = features["number"].astype("Int64")
-    features.to_csv(config.PATH_DATA / "features.csv", index=True)
+    utils.store.replace(_path(), "features", features)
+    utils.cache.invalidate(_path())
 
 
 def load():
     """Load the feature index."""
-    if not (config.PATH_DATA / "features.csv").is_file():
+    _migrate()
+
+    if not _path().is_file():
         # Creating indices
         ind = pd.MultiIndex(
             levels=[[], []],
@@ -50,11 +77,328 @@ def load():
             names=["filename", "feature"],
         )
         return pd.DataFrame(index=ind, columns=["is_present"])
-    return pd.read_csv(
+    return utils.cache.read(
+        _path(),
+        lambda path: _restore(
+            utils.store.read(path, "features", ["filename", "feature"])
+        ),
+    )
+
+
+def lookup(keys):
+    """Look up entries of the feature index.
+
+    Parameters
+    ----------
+    keys : list of tuple
+        The (filename, feature) pairs to look up.
+
+    Returns
+    -------
+    pd.DataFrame
+        The entries of the feature index which match the keys.
+    """
+    _migrate()
+    return _restore(
+        utils.store.read(_path(), "features", ["filename", "feature"], keys=keys)
+    )
+
+
+def _path():
+    """Get the path to the feature index."""
+    return config.PATH_DATA / "features.db"
+
+
+def _migrate():
+    """Move the entries of the legacy features.csv into the feature index.
+
+    Notes
+    -----
+    The CSV file is left unchanged and ignored once the feature index exists.
+    """
+    if _path().is_file() or not (config.PATH_DATA / "features.csv").is_file():
+        return
+
+    features = pd.read_csv(
         config.PATH_DATA / "features.csv",
         index_col=["filename", "feature"],
         dtype={"is_present": bool},
     )
+    with np.errstate(invalid="ignore"):
+        features["number"] = features["number"].astype("Int64")
+    utils.store.replace(_path(), "features", features)
+    logger.debug("Moved features.csv into the feature index.")
+
+
+def _restore(features):
+    """Restore the types of the feature index columns."""
+    for column, type_ in COLUMNS.items():
+        if column not in features.columns:
+            continue
+        if type_ is float:
+            features[column] = features[column].astype(float)
+        elif type_ is bool:
+            features[column] = features[column].fillna(False).astype(bool)
+
+    if "number" in features.columns:
+        features["number"] = features["number"].astype("Int64")
+    return features
+
+
+def fit_batch(features):
+    """Fit many features at once without user interaction.
+
+    Parameters
+    ----------
+    features : list of Feature
+        The features to fit. They have to be covered by their spectra.
+
+    Returns
+    -------
+    list of Feature
+        The features which were fit.
+
+    Notes
+    -----
+    Each feature is fit in its default window from ``FEATURE``: a linear continuum
+    through the outermost points of the window is removed and a polynomial of
+    degree ``DEG_POLY`` is fit to the remaining band. Features sharing the
+    wavelength sampling are fit in a single least-squares solve. The band center,
+    depth, and noise are computed like in the interactive fit.
+
+    A feature is marked as present if the band center lies within
+    ``AUTO_CENTER_SIGMA`` standard deviations of the mean center of the feature
+    and the band depth is at least ``AUTO_DEPTH_NOISE`` times the noise.
+
+    Features with fewer than ``DEG_POLY + 1`` valid points in their window are
+    not fit. They are marked as not present, with NaN band parameters.
+    """
+    fits, waves, ratios = [], [], []
+
+    for feat in features:
+        feat.lower = FEATURE[feat.name]["lower"]
+        feat.upper = FEATURE[feat.name]["upper"]
+        feat.deg_poly = DEG_POLY
+        feat.type_continuum = "linear"
+
+        # There might be NaN values in the reflectance. They are ignored.
+        is_valid = ~np.isnan(feat.refl)
+
+        # The polynomial is underdetermined with too few points
+        if is_valid.sum() < DEG_POLY + 1:
+            logger.debug(
+                f"Not fitting the {feat.name}-feature: only {is_valid.sum()} valid "
+                "points in the window."
+            )
+            feat.center = feat.depth = feat.noise = np.nan
+            feat.is_present = False
+            continue
+
+        fits.append(feat)
+        waves.append(feat.wave[is_valid])
+        ratios.append(feat.refl[is_valid])
+
+    if not fits:
+        return fits
+
+    # Linear continua through the outermost points of all windows
+    lower = np.array([[wave[0], ratio[0]] for wave, ratio in zip(waves, ratios)])
+    upper = np.array([[wave[-1], ratio[-1]] for wave, ratio in zip(waves, ratios)])
+
+    slope = (upper[:, 1] - lower[:, 1]) / (upper[:, 0] - lower[:, 0])
+    intercept = lower[:, 1] - slope * lower[:, 0]
+
+    for i, (feat, wave) in enumerate(zip(fits, waves)):
+        feat.continuum = np.poly1d([slope[i], intercept[i]])
+        ratios[i] = ratios[i] / (slope[i] * wave + intercept[i])
+
+    coeffs = polyfit_batch(waves, ratios, DEG_POLY)
+    centers = compute_centers(
+        coeffs,
+        [feat.lower for feat in fits],
+        [feat.upper for feat in fits],
+    )
+
+    for feat, wave, ratio, coeffs_, center in zip(fits, waves, ratios, coeffs, centers):
+        feat.fit = np.poly1d(coeffs_)
+        feat.center = center
+        feat.depth = (1 - feat.fit(feat.center)) * 100
+        feat.noise = np.mean(np.abs(ratio - feat.fit(wave)))
+
+        mean, std = FEATURE[feat.name]["center"]
+        feat.is_present = bool(
+            abs(feat.center - mean) <= AUTO_CENTER_SIGMA * std
+            and feat.depth >= AUTO_DEPTH_NOISE * feat.noise * 100
+        )
+        feat.is_candidate = False
+
+    return fits
+
+
+def polyfit_batch(waves, values, deg):
+    """Fit polynomials to many arrays of values at once.
+
+    Parameters
+    ----------
+    waves : list of np.ndarray
+        The wavelengths of each array.
+    values : list of np.ndarray
+        The values to fit.
+    deg : int
+        The degree of the polynomials.
+
+    Returns
+    -------
+    np.ndarray
+        The polynomial coefficients, highest power first, one row per array.
+
+    Notes
+    -----
+    The least-squares problem is solved like in ``np.polyfit``. Arrays with the
+    same wavelengths share the Vandermonde matrix and are fit in a single solve.
+    Arrays with unique wavelengths are fit individually.
+    """
+    coeffs = np.empty((len(waves), deg + 1))
+    groups = {}
+
+    for i, wave in enumerate(waves):
+        groups.setdefault(np.asarray(wave, dtype=float).tobytes(), []).append(i)
+
+    for members in groups.values():
+        vander = np.vander(np.asarray(waves[members[0]], dtype=float), deg + 1)
+
+        # Scale the columns to improve the condition, like np.polyfit
+        scale = np.sqrt((vander * vander).sum(axis=0))
+
+        solution = np.linalg.lstsq(
+            vander / scale,
+            np.column_stack([values[i] for i in members]),
+            rcond=len(vander) * np.finfo(float).eps,
+        )[0]
+
+        coeffs[members] = solution.T / scale
+
+    return coeffs
+
+
+def compute_centers(coeffs, lower, upper):
+    """Compute the band centers of many polynomial fits at once.
+
+    Parameters
+    ----------
+    coeffs : np.ndarray
+        The polynomial coefficients, highest power first, one row per fit.
+    lower : float or np.ndarray
+        The lower wavelength limits of the features.
+    upper : float or np.ndarray
+        The upper wavelength limits of the features.
+
+    Returns
+    -------
+    np.ndarray
+        The band centers. NaN if a fit has no minimum within its limits.
+
+    Notes
+    -----
+    The band center is the shortest wavelength within the limits at which the
+    derivative of the fit vanishes and the second derivative is positive. The
+    roots of all derivatives are computed at once as the eigenvalues of their
+    companion matrices.
+    """
+    coeffs = np.atleast_2d(np.asarray(coeffs, dtype=float))
+    lower = np.broadcast_to(np.asarray(lower, dtype=float), len(coeffs))
+    upper = np.broadcast_to(np.asarray(upper, dtype=float), len(coeffs))
+
+    deg = coeffs.shape[1] - 1
+    centers = np.full(len(coeffs), np.nan)
+
+    if deg < 2:
+        return centers
+
+    # Derivative coefficients, highest power first
+    slope = coeffs[:, :-1] * np.arange(deg, 0, -1)
+    curvature = slope[:, :-1] * np.arange(deg - 1, 0, -1)
+
+    # Degenerate derivatives are solved individually
+    is_regular = slope[:, 0] != 0
+
+    companion = np.zeros((is_regular.sum(), deg - 1, deg - 1))
+    companion[:, 0, :] = -slope[is_regular, 1:] / slope[is_regular, :1]
+    companion[:, np.arange(1, deg - 1), np.arange(deg - 2)] = 1
+
+    roots = np.full((len(coeffs), deg - 1), np.nan, dtype=complex)
+    roots[is_regular] = np.linalg.eigvals(companion)
+
+    for i in np.flatnonzero(~is_regular):
+        roots_ = np.roots(slope[i])
+        roots[i, : len(roots_)] = roots_
+
+    # Real minima within the feature limits
+    real = roots.real
+    is_minimum = (
+        (np.abs(roots.imag) <= 1e-10 * np.maximum(1, np.abs(real)))
+        & (real > lower[:, None])
+        & (real < upper[:, None])
+    )
+
+    powers = np.arange(deg - 2, -1, -1)
+    is_minimum &= (curvature[:, None, :] * real[..., None] ** powers).sum(axis=-1) > 0
+
+    real = np.where(is_minimum, real, np.inf)
+    centers[is_minimum.any(axis=1)] = real.min(axis=1)[is_minimum.any(axis=1)]
+
+    return centers
+
+
+def store_parameters(features):
+    """Add the parameters of fitted features to the feature index.
+
+    Parameters
+    ----------
+    features : list of Feature
+        The fitted features. Their spectra need a filename.
+
+    Notes
+    -----
+    The entries of all features are written in a single transaction. Existing
+    entries of the features are replaced.
+    """
+    if not features:
+        return
+
+    entries = []
+
+    for feat in features:
+        entry = {
+            "filename": feat.spec.filename,
+            "feature": feat.name,
+            "type_continuum": feat.type_continuum,
+            "deg_poly": feat.deg_poly,
+            "is_present": feat.is_present,
+        }
+
+        for param in ["lower", "upper", "center", "depth", "noise"]:
+            entry[param] = getattr(feat, param)
+
+        # Store metadata
+        for param in ["source", "shortbib", "bibcode"]:
+            entry[param] = getattr(feat.spec, param, None)
+
+        target = getattr(feat.spec, "target", None)
+
+        for param in ["name", "number"]:
+            entry[param] = getattr(target, param, None)
+
+        entries.append(entry)
+
+    entries = pd.DataFrame(entries).set_index(["filename", "feature"])
+
+    _migrate()
+
+    with np.errstate(invalid="ignore"):
+        entries["number"] = entries["number"].astype("Int64")
+    utils.store.upsert(_path(), "features", entries)
+    utils.cache.invalidate(_path())
 
 
 class Feature:
@@ -78,7 +422,7 @@ class Feature:
         self.upper = FEATURE[name]["upper"]
         self.lower = FEATURE[name]["lower"]
 
-        self.deg_poly = 4
+        self.deg_poly = DEG_POLY
         self.type_continuum = "linear"
 
         self.is_candidate = True
@@ -138,20 +482,18 @@ class Feature:
         if not hasattr(self.spec, "filename"):
             return False
 
-        features = load()
         ind = (self.spec.filename, self.name)
-        return ind in features.index
+        return not lookup([ind]).empty
 
     def load_parameters(self):
         """Load and set previously stored fit parameters from index."""
-        features = load()
-
         ind = (self.spec.filename, self.name)
+        features = lookup([ind])
 
-        if ind not in features.index:
+        if features.empty:
             raise IndexError(f"Feature {self.name} has not been fit yet.")
 
-        for param, value in features.loc[ind].to_dict().items():
+        for param, value in features.iloc[0].to_dict().items():
             if param in ["name", "number", "source", "shortbib", "bibcode"]:
                 continue
             setattr(self, param, value)
@@ -189,25 +531,9 @@ class Feature:
         )
         return np.poly1d(continuum)
 
-    # TODO: This should be a method of the parent Spectrum class
     def _compute_hull_continuum(self):
         """Compute the continuum of a spectrum using convex-hull."""
-
-        # Ensure that there are no NaNs
-        x = self.wave[~np.isnan(self.refl)]
-        y = self.refl[~np.isnan(self.refl)]
-
-        points = np.c_[x, y]
-        augmented = np.concatenate(
-            [points, [(x[0], np.min(y) - 1), (x[-1], np.min(y) - 1)]], axis=0
-        )
-
-        hull = ConvexHull(augmented, qhull_options="")
-        continuum_points = points[
-            np.sort([v for v in hull.vertices if v < len(points)])
-        ]
-        continuum = interpolate.interp1d(*continuum_points.T, fill_value="extrapolate")
-        return continuum
+        return preprocessing.compute_convex_hull(self)
 
     def compute_fit(self, degree):
         """Fit the feature-region using a polynomial model.
@@ -231,7 +557,9 @@ class Feature:
     def _fit_polynomial(self, degree=3):
         """Fit a polynomial to parametrize the feature."""
 
-        poly = np.polyfit(self.wave, self.refl / self.continuum(self.wave), deg=degree)
+        poly = polyfit_batch(
+            [self.wave], [self.refl / self.continuum(self.wave)], degree
+        )[0]
 
         # Turn into callable polynomial function
         self.fit = np.poly1d(poly)
@@ -242,14 +570,7 @@ class Feature:
 
     def _compute_center(self):
         """Compute center wavelength of fit function."""
-        wave_interp = np.arange(self.lower, self.upper, 0.001)
-        peak = signal.find_peaks(-self.fit(wave_interp))  # '-' to find the minimum
-        try:
-            peak_x = wave_interp[peak[0]][0]
-        except IndexError:
-            peak_x = np.nan
-
-        return peak_x
+        return compute_centers(self.fit.coeffs, self.lower, self.upper)[0]
 
     def inspect(self):
         """Run GUI to fit feature interactively."""
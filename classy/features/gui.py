@@ -2,6 +2,8 @@
 
 import sys
 
+import pandas as pd
+
 import classy
 from classy.utils.logging import logger
 
@@ -399,30 +401,12 @@ class InteractiveFeatureFit(QtWidgets.QMainWindow):
 
             if ret == qm.No:
                 return
-        # Load feature index
-        features = classy.features.load()
-
-        # Use classy index number as identifier
-        id_ = (self.feat.spec.filename, self.feat.name)
-
-        # Add feature parameters
-        for param in ["lower", "upper", "center", "depth", "noise"]:
-            features.loc[id_, f"{param}"] = getattr(self.feat, param)
-
-        features.loc[id_, "type_continuum"] = self.feat.type_continuum
-        features.loc[id_, "deg_poly"] = self.feat.deg_poly
-        features.loc[id_, "is_present"] = (
+        self.feat.is_present = (
             True if self.select_present.currentText() == "Yes" else False
         )
 
-        # Store metadata
-        for param in ["source", "shortbib", "bibcode"]:
-            features.loc[id_, param] = getattr(self.feat.spec, param)
-        for param in ["name", "number"]:
-            features.loc[id_, param] = getattr(self.feat.spec.target, param)
-
-        # Store feature index
-        classy.index.store_features(features)
+        # Add feature parameters and metadata to feature index
+        classy.features.store_parameters([self.feat])
         logger.debug("Feature parameters saved to file.")
         self.notify.setText("Feature parameters stored.")
 
@@ -679,30 +663,31 @@ class InteractiveSmoothing(QtWidgets.QMainWindow):
         self.plotted_spec.setData(*data_spec)
 
     def _store_smoothing(self):
-        # Load smoothing index
-        smoothing = classy.index.load_smoothing()
-
         # Use classy index number as identifier
         id_ = self.spec.filename
 
         # Add smoothing parameters
-        for param in [
-            "smooth",
-            "method",
-            "deg_savgol",
-            "window_savgol",
-            "deg_spline",
-            "wave_min",
-            "wave_max",
-        ]:
-            smoothing.loc[id_, f"{param}"] = getattr(self, param)
+        smoothing = {
+            param: getattr(self, param)
+            for param in [
+                "smooth",
+                "method",
+                "deg_savgol",
+                "window_savgol",
+                "deg_spline",
+                "wave_min",
+                "wave_max",
+            ]
+        }
 
         # Store metadata
         for param in ["name", "number", "source", "shortbib", "bibcode"]:
-            smoothing.loc[id_, param] = getattr(self.spec, param)
+            smoothing[param] = getattr(self.spec, param)
 
-        # Store smoothing index
-        classy.index.store_smoothing(smoothing)
+        # Update the entry of the spectrum in the smoothing index
+        classy.preprocessing.upsert_smoothing(
+            pd.DataFrame(smoothing, index=pd.Index([id_], name="filename"))
+        )
         logger.debug("Smoothing Parameters saved to file.")
         self.notify.setText("Smoothing parameters stored.")
 
@@ -11,7 +11,7 @@ from classy import sources
 from classy import utils
 from classy.utils.logging import logger
 
-from . import data, phase  # noqa
+from . import data, phase, preprocessed, targets  # noqa
 
 COLUMNS = [
     "name",
@@ -30,6 +30,9 @@ COLUMNS = [
     "wave_max",
 ]
 
+# Columns stored as categoricals in the index
+CATEGORICAL = ["source", "host", "module"]
+
 BFT_SHORT = {
     "albedo": "albedo.value",
     "diameter": "diameter.value",
@@ -50,14 +53,14 @@ def load():
 
     # In APP mode, we always want the added bft to avoid rocks queries
     if config.APP_MODE:
-        idx = pd.read_parquet(
-            config.PATH_DATA / "idx_extended.parquet",
-        )
-        idx = idx.set_index("filename")
-        idx = idx.rename(columns={v: k for k, v in BFT_SHORT.items()})
-        return idx
+        return utils.cache.read(config.PATH_DATA / "idx_extended.parquet", _read_app)
+
+    PATH_INDEX = config.PATH_DATA / "index.parquet"
 
-    if not (config.PATH_DATA / "index.csv").is_file():
+    if not PATH_INDEX.is_file() and (config.PATH_DATA / "index.csv").is_file():
+        _migrate_csv()
+
+    if not PATH_INDEX.is_file():
         if "status" not in sys.argv and "add" not in sys.argv:
             logger.error(
                 "No spectra available. Run '$ classy status' to retrieve them."
@@ -66,13 +69,31 @@ def load():
             data={key: [] for key in ["name", "source", "filename", "host"]}, index=[]
         )
 
+    return utils.cache.read(PATH_INDEX, pd.read_parquet)
+
+
+def _read_app(path):
+    """Read the index extended with the BFT in APP mode."""
+    idx = pd.read_parquet(path)
+    idx = idx.set_index("filename")
+    idx = idx.rename(columns={v: k for k, v in BFT_SHORT.items()})
+    return idx
+
+
+def _migrate_csv():
+    """Convert the global spectra index from CSV to Parquet format."""
+    PATH_CSV = config.PATH_DATA / "index.csv"
+
+    logger.info("Migrating the spectra index from CSV to Parquet format.")
+
     index = pd.read_csv(
-        config.PATH_DATA / "index.csv",
+        PATH_CSV,
         dtype={"number": "Int64"},
         low_memory=False,
         index_col="filename",
     )
-    return index
+    save(index)
+    PATH_CSV.unlink()
 
 
 def query(id=None, **kwargs):
@@ -218,7 +239,13 @@ def save(index):
     with np.errstate(invalid="ignore"):
         index["number"] = index["number"].astype("Int64")
         index["N"] = index["N"].astype(int)
-    index.to_csv(config.PATH_DATA / "index.csv", index=True, index_label="filename")
+
+    for column in CATEGORICAL:
+        index[column] = index[column].astype("category")
+
+    index.index.name = "filename"
+    index.to_parquet(config.PATH_DATA / "index.parquet", index=True)
+    utils.cache.invalidate(config.PATH_DATA / "index.parquet")
 
 
 def add(entries):
@@ -5,14 +5,15 @@ if sys.version_info[1] < 9:
     import importlib_resources as resources
 else:
     import importlib.resources as resources
-from functools import lru_cache
 import pickle
+import time
 
 import pandas as pd
 import rocks
 from sklearn.mixture import GaussianMixture
 
 from classy.taxonomies.mahlke import gmm
+from classy.taxonomies.mahlke import mcfa
 from classy.utils.logging import logger
 from classy import index
 
@@ -58,6 +59,14 @@ from classy import utils
 
 # ------
 # Products of Mahlke+ 2022
+
+# Process-wide registry of loaded model artifacts and their load statistics
+REGISTRY = {}
+STATS = {}
+
+RESOURCES = ["gmm", "mcfa", "mixnorm"]
+
+
 def load(resource, cluster=None):
     """Load a classy package resource.
 
@@ -68,6 +77,11 @@ def load(resource, cluster=None):
 
     cluster : int
         If loading a GMM, specify which cluster should be loaded. Default is None.
+
+    Notes
+    -----
+    The model artifacts 'gmm', 'mcfa', and 'mixnorm' are loaded once per process
+    and served from the registry afterwards. See ``warm``, ``clear``, and ``stats``.
     """
 
     if resource == "classy":
@@ -78,13 +92,96 @@ def load(resource, cluster=None):
             raise ValueError(
                 "The cluster number has to be specified when loading a GMM."
             )
-        return _load_gmm(cluster)
+        return _load_registered(resource, cluster)
 
-    elif resource == "mcfa":
-        return _load_mcfa()
+    elif resource in ["mcfa", "mixnorm"]:
+        return _load_registered(resource)
+
+
+def _load_registered(resource, cluster=None):
+    """Return a model artifact from the registry, loading it on first access.
+
+    Parameters
+    ----------
+    resource : str
+        Type of resource to load. Choose from ['gmm', 'mcfa', 'mixnorm'].
+    cluster : int or str
+        The cluster of the GMM to load. Default is None.
 
+    Returns
+    -------
+    object
+        The loaded resource.
+    """
+    key = (resource, cluster)
+
+    if key in REGISTRY:
+        STATS[key]["hits"] += 1
+        return REGISTRY[key]
+
+    start = time.perf_counter()
+
+    if resource == "gmm":
+        artifact = _load_gmm(cluster)
+    elif resource == "mcfa":
+        artifact = _load_mcfa()
     elif resource == "mixnorm":
-        return _load_mixnorm()
+        artifact = _load_mixnorm()
+
+    REGISTRY[key] = artifact
+    STATS[key] = {"load_time": time.perf_counter() - start, "hits": 0}
+
+    logger.debug(f"Loaded {resource} in {STATS[key]['load_time']:.2f}s")
+    return artifact
+
+
+def warm(resources=None):
+    """Load model artifacts into the registry ahead of their first use.
+
+    Parameters
+    ----------
+    resources : list of str
+        The resources to load. Choose from ['gmm', 'mcfa', 'mixnorm'].
+        Default is None, which loads all of them.
+    """
+    if resources is None:
+        resources = RESOURCES
+
+    for resource in resources:
+        if resource not in RESOURCES:
+            raise ValueError(
+                f"Unknown resource '{resource}'. Choose from {RESOURCES}."
+            )
+
+        if resource == "gmm":
+            for cluster in gmm.GMM:
+                load("gmm", cluster=cluster)
+        else:
+            load(resource)
+
+
+def clear():
+    """Remove all model artifacts from the registry."""
+    REGISTRY.clear()
+    STATS.clear()
+
+
+def stats():
+    """Return the load statistics of the model artifacts in the registry.
+
+    Returns
+    -------
+    pd.DataFrame
+        The resource, cluster, load time in seconds, and number of registry
+        hits of each loaded artifact.
+    """
+    return pd.DataFrame(
+        [
+            {"resource": resource, "cluster": cluster, **stats_}
+            for (resource, cluster), stats_ in STATS.items()
+        ],
+        columns=["resource", "cluster", "load_time", "hits"],
+    )
 
 
 def _get_path_data():
@@ -103,22 +200,15 @@ def _load_classy():
     return pd.read_csv(_get_path_data() / "classy/classy_data.csv")
 
 
-@lru_cache()
 def _load_mcfa():
     """Load the trained MCFA model of the classy taxonomy.
 
     Returns
     -------
-    mcfa.MCFA
+    classy.taxonomies.mahlke.mcfa.MCFA
         The MCFA model instance trained for the classy taxonomy.
     """
-    import tensorflow as tf
-
-    tf.get_logger().setLevel("ERROR")
-
-    import mcfa  # skip the heavy tensorflow import if it can be avoided
-
-    return mcfa.from_file(_get_path_data() / "mcfa/mcfa.pkl")
+    return mcfa.load(_get_path_data() / "mcfa/mcfa.npz")
 
 
 def _load_gmm(cluster):
@@ -193,18 +283,24 @@ def load_mahlke_index():
 
 # ------
 # Load spectra from cache
-def load_spectra(idx_spectra, skip_target):
-    """Load a spectrum from a known source.
+def load_spectra(idx_spectra, skip_target, workers=None):
+    """Load spectra from known sources.
+
+    Parameters
+    ----------
+    idx_spectra : pd.DataFrame
+        Rows from the classy spectra index.
+    skip_target : bool
+        Skip the resolution of the targets of the spectra.
+    workers : int
+        Number of processes to load the spectra with. Default is None, in which
+        case config.WORKERS is used.
 
     Returns
     -------
     list of classy.core.Spectrum
     """
-    spectra = [
-        sources.load_spectrum(spec, skip_target) for _, spec in idx_spectra.iterrows()
-    ]
-
-    return spectra
+    return sources.load_spectra(idx_spectra, skip_target, workers)
 
 
 def remove():
@@ -229,7 +325,7 @@ def echo_inventory():
 
     if sources_:
         for i, (source, obs) in enumerate(
-            idx.sort_values("source").groupby("source"), 1
+            idx.sort_values("source").groupby("source", observed=True), 1
         ):
             public = obs.host.values[0] != "Private"
             highlight = "dim" if not public else "bold"
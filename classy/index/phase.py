@@ -6,6 +6,7 @@ import numpy as np
 import pandas as pd
 import requests
 
+from classy import config
 from classy import index
 from classy import utils
 from classy.utils.logging import logger
@@ -21,26 +22,205 @@ def add_phase_to_index():
     # Run async loop to get phase info while displaying progress
     with utils.progress.mofn as mofn:
         print("")
-        task = mofn.add_task("Querying Miriade", total=len(idx_phase))
-
-        loop = get_or_create_eventloop()
-        phases = loop.run_until_complete(_run_async_loop(idx_phase, mofn, task))
+        task = mofn.add_task("Querying Miriade", total=idx_phase["name"].nunique())
+        phases = get_phases(idx_phase, mofn, task)
 
     # Store results in index
-    for i, phase, err_phase in phases:
-        idx.loc[i, "phase"] = phase
-        idx.loc[i, "err_phase"] = err_phase
+    idx.loc[phases.index, "phase"] = phases.phase
+    idx.loc[phases.index, "err_phase"] = phases.err_phase
 
     index.save(idx)
 
 
-async def _run_async_loop(idx_phase, mofn, progress):
+def get_phases(obs, mofn=None, progress=None):
+    """Get the phase angles of many observations from Miriade.
+
+    Parameters
+    ----------
+    obs : pd.DataFrame
+        The observations with the asteroid name and the comma-separated
+        observation epochs in the 'name' and 'date_obs' columns.
+    mofn : rich.progress.Progress
+        Progress bar instance showing progress. Default is None.
+    progress : progress task
+        Progress task ID for external updates, advanced once per asteroid.
+
+    Returns
+    -------
+    pd.DataFrame
+        The mean phase angle of the epochs of each observation and its standard
+        deviation in the 'phase' and 'err_phase' columns, indexed like obs.
+
+    Notes
+    -----
+    Phase angles in the ephemeris cache are not queried again. The remaining
+    epochs are grouped by asteroid and each asteroid is queried once. At most
+    config.MIRIADE_CONCURRENCY queries are sent at the same time.
+    """
+    epochs = {}
+
+    for name, date_obs in zip(obs["name"], obs.date_obs):
+        epochs.setdefault(name, set()).update(_split_epochs(date_obs))
+
+    ephemerides = _lookup_cache(epochs)
+
+    missing = {
+        name: {epoch for epoch in epochs_ if (name, epoch) not in ephemerides}
+        for name, epochs_ in epochs.items()
+    }
+    missing = {name: epochs_ for name, epochs_ in missing.items() if epochs_}
+
+    _report_cache(epochs, missing, log=logger.info)
+
+    # Asteroids with all epochs in the cache are done
+    if mofn is not None:
+        mofn.update(progress, advance=len(epochs) - len(missing))
+
+    if missing:
+        loop = get_or_create_eventloop()
+        queried = loop.run_until_complete(_run_async_loop(missing, mofn, progress))
+
+        queried = {
+            (name, epoch): phase
+            for name, phases_ in queried.items()
+            for epoch, phase in phases_.items()
+        }
+        _store_cache(queried)
+        ephemerides.update(queried)
+
+    phases = []
+
+    for name, date_obs in zip(obs["name"], obs.date_obs):
+        phases_ = [
+            ephemerides.get((name, epoch), np.nan) for epoch in _split_epochs(date_obs)
+        ]
+
+        with warnings.catch_warnings():  # hides warnings if phase = [np.nan]
+            warnings.simplefilter("ignore")
+            phases.append((np.nanmean(phases_), np.nanstd(phases_)))
+
+    return pd.DataFrame(phases, index=obs.index, columns=["phase", "err_phase"])
+
+
+def get_phase_angles(name, epochs):
+    """Get the phase angles of an asteroid at several epochs.
+
+    Parameters
+    ----------
+    name : str
+        Name or designation of asteroid.
+    epochs : list of str
+        The observation epochs in iso format.
+
+    Returns
+    -------
+    list of float
+        The phase angles at the epochs. NaN if the query failed.
+
+    Notes
+    -----
+    Only epochs which are not in the ephemeris cache are queried from Miriade.
+    """
+    epochs = [epoch.strip() for epoch in epochs]
+    ephemerides = _lookup_cache({name: epochs})
+
+    missing = {epoch for epoch in epochs if epoch and (name, epoch) not in ephemerides}
+    _report_cache({name: set(epochs)}, {name: missing} if missing else {})
+
+    if missing:
+        missing = sorted(missing)
+        ephem = query_miriade_syncronously(name, missing)
+
+        # Ephemerides are returned in the order of the sorted epochs
+        if not isinstance(ephem, bool) and len(ephem) == len(missing):
+            queried = {
+                (name, epoch): phase for epoch, phase in zip(missing, ephem.phase)
+            }
+            _store_cache(queried)
+            ephemerides.update(queried)
+
+    return [ephemerides.get((name, epoch), np.nan) for epoch in epochs]
+
+
+def clear_cache():
+    """Remove all phase angles from the ephemeris cache."""
+    _path_cache().unlink(missing_ok=True)
+
+
+def _path_cache():
+    """Get the path to the ephemeris cache."""
+    return config.PATH_DATA / "ephemerides.db"
+
+
+def _lookup_cache(epochs):
+    """Look up phase angles in the ephemeris cache.
+
+    Parameters
+    ----------
+    epochs : dict
+        The observation epochs to look up, keyed by asteroid name.
+
+    Returns
+    -------
+    dict
+        The cached phase angles, keyed by (name, epoch).
+    """
+    keys = [(str(name), epoch) for name, epochs_ in epochs.items() for epoch in epochs_]
+    cached = utils.store.read(_path_cache(), "phase", ["name", "epoch"], keys=keys)
+
+    # Map the names back to the identifiers given by the caller
+    names = {str(name): name for name in epochs}
+
+    if "phase" not in cached:
+        return {}
+    return {
+        (names[name], epoch): phase for (name, epoch), phase in cached["phase"].items()
+    }
+
+
+def _store_cache(phases):
+    """Add phase angles to the ephemeris cache.
+
+    Parameters
+    ----------
+    phases : dict
+        The phase angles, keyed by (name, epoch). Missing values are not stored.
+    """
+    phases = {
+        (str(name), epoch): phase
+        for (name, epoch), phase in phases.items()
+        if phase is not None and not pd.isna(phase)
+    }
+
+    if not phases:
+        return
+
+    entries = pd.DataFrame(
+        {"phase": list(phases.values())},
+        index=pd.MultiIndex.from_tuples(list(phases), names=["name", "epoch"]),
+    )
+    utils.store.upsert(_path_cache(), "phase", entries)
+
+
+def _report_cache(epochs, missing, log=logger.debug):
+    """Log the number of epochs answered by the ephemeris cache."""
+    total = sum(len(epochs_) for epochs_ in epochs.values())
+    misses = sum(len(epochs_) for epochs_ in missing.values())
+    log(f"Ephemeris cache: {total - misses} hits, {misses} misses for {total} epochs.")
+
+
+def _split_epochs(date_obs):
+    """Split the comma-separated observation epochs of a spectrum."""
+    return [epoch.strip() for epoch in str(date_obs).split(",") if epoch.strip()]
+
+
+async def _run_async_loop(epochs, mofn, progress):
     """Run the asyncronous phase-query event loop.
 
     Parameters
     ----------
-    idx_phase : pd.DataFrame
-        Subset of classy index that contains date_obs information.
+    epochs : dict
+        The observation epochs to query, keyed by asteroid name.
     mofn : rich.progress.Progress
         Progress bar instance showing progress.
     task : progress task
@@ -48,33 +228,40 @@ async def _run_async_loop(idx_phase, mofn, progress):
 
     Returns
     -------
-    list of [idx_phase, phase, err_phase]
+    dict
+        The phase angles at the epochs, keyed by asteroid name and epoch.
     """
+    # Limit number of simultaneous queries
+    semaphore = asyncio.Semaphore(config.MIRIADE_CONCURRENCY)
+
     async with aiohttp.ClientSession(
         timeout=aiohttp.ClientTimeout(sock_connect=10)
     ) as session:
         tasks = [
             asyncio.ensure_future(
-                _get_phase_asyncronous(ind, obs, session, mofn, progress)
+                _get_phases_asyncronous(
+                    name, sorted(epochs_), session, semaphore, mofn, progress
+                )
             )
-            # NOTE: Grouping by asteroid and sending multiple epochs not possible with async framework
-            for ind, obs in idx_phase.iterrows()
+            for name, epochs_ in epochs.items()
         ]
         results = await asyncio.gather(*tasks)
-    return results
+    return dict(zip(epochs, results))
 
 
-async def _get_phase_asyncronous(idx, obs, session, mofn, progress):
-    """Get phase angle asynchronously from Miriade.
+async def _get_phases_asyncronous(name, epochs, session, semaphore, mofn, progress):
+    """Get the phase angles of one asteroid at many epochs asynchronously from Miriade.
 
     Parameters
     ----------
-    idx : float
-        Index number from classy index referring to this spectrum.
-    obs : pd.Series
-        Row from classy index containing one asteroid and one or more epochs.
+    name : str
+        Name or designation of asteroid.
+    epochs : list of str
+        Sorted list of observation epochs in iso format.
     session : aiohttp.ClientSession
         The ongoing http session.
+    semaphore : asyncio.Semaphore
+        Semaphore limiting the number of simultaneous queries.
     mofn : rich.progress.Progress
         Progress bar instance showing progress.
     task : progress task
@@ -82,74 +269,96 @@ async def _get_phase_asyncronous(idx, obs, session, mofn, progress):
 
     Returns
     -------
-    idx, float, float
-        The unchanged obervation index and the corresponding phase and uncertainty.
-    """
+    dict
+        The phase angles keyed by epoch. Empty if the query failed.
 
-    # There might be more than one epochs
-    epoch = obs.date_obs
-    epochs = epoch.split(",")
+    Notes
+    -----
+    Failed queries are retried config.MIRIADE_RETRIES times, waiting
+    config.MIRIADE_BACKOFF seconds before the first retry and twice as long before
+    each following one. Client errors other than rate limits are not retried.
+    """
+    phases = {}
+
+    for attempt in range(config.MIRIADE_RETRIES + 1):
+        try:
+            async with semaphore:
+                phases = await _get_phase_angles(name, epochs, session)
+            break
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            KeyError,
+            ValueError,
+        ) as error:
+            is_final = (
+                attempt == config.MIRIADE_RETRIES
+                or isinstance(error, (KeyError, ValueError))
+                or (
+                    isinstance(error, aiohttp.ClientResponseError)
+                    and error.status < 500
+                    and error.status != 429
+                )
+            )
 
-    # Limit number of simultaneous queries
-    async with asyncio.Semaphore(50):
-        phases = []
-        for epoch in epochs:
-            try:
-                phase = await _get_phase_angle(obs["name"], epoch, session)
-            except (
-                aiohttp.client_exceptions.ClientConnectorError,
-                aiohttp.client_exceptions.ContentTypeError,
-                aiohttp.client_exceptions.ServerTimeoutError,
-                KeyError,
-            ):
+            if is_final:
                 logger.error(
-                    f"The following Miriade query failed (phase is set to NaN): {obs['name']} - {epoch}"
+                    f"The following Miriade query failed (phase is set to NaN): {name} - {len(epochs)} epochs"
                 )
-                phase = np.nan
-            phases.append(phase)
+                break
+
+            await asyncio.sleep(config.MIRIADE_BACKOFF * 2**attempt)
 
-    mofn.update(progress, advance=1)
+    if mofn is not None:
+        mofn.update(progress, advance=1)
 
-    with warnings.catch_warnings():  # hides warnings if phase = [np.nan]
-        warnings.simplefilter("ignore")
-        return idx, np.nanmean(phases), np.nanstd(phases)
+    return phases
 
 
-async def _get_phase_angle(name, epochs, session):
-    """Query quaero and parse result for a single object.
+async def _get_phase_angles(name, epochs, session):
+    """Query Miriade and parse the phase angles for a single object.
 
     Parameters
     ----------
-    id_ssodnet : str
-        Asteroid ID from SsODNet.
-    catalogue : str
-        Datacloud catalogue name.
+    name : str
+        Name or designation of asteroid.
+    epochs : list of str
+        Sorted list of observation epochs in iso format.
     session : aiohttp.ClientSession
         asyncio session
 
     Returns
     -------
     dict
-        SsODNet response as dict if successful. Empty if query failed.
+        The phase angles keyed by epoch.
     """
-    # Pass sorted list of epochs to speed up query
-
-    # ------
-    # Query Miriade for phase angles
-    URL = "http://ssp.imcce.fr/webservices/miriade/api/ephemcc.php"
+    # Upload the epochs as file like in query_miriade_syncronously
+    data = aiohttp.FormData()
+    data.add_field("epochs", "\n".join(epochs), filename="epochs")
 
     params = {
         "-name": f"a:{name}",
         "-mime": "json",
         "-tcoor": "5",
         "-tscale": "UTC",
-        "-ep": epochs,
     }
 
-    async with session.post(url=URL, params=params) as response:
-        response_json = await response.json()
+    async with session.post(
+        url=config.MIRIADE_URL, params=params, data=data
+    ) as response:
+        response.raise_for_status()
+        response_json = await response.json(content_type=None)
+
+    ephem = response_json["data"]
 
-    return response_json["data"][0]["Phase"]
+    # Ephemerides are returned in the order of the epochs
+    if len(ephem) != len(epochs):
+        raise ValueError(f"Expected {len(epochs)} ephemerides, got {len(ephem)}.")
+
+    return {
+        epoch: entry.get("phase", entry.get("Phase"))
+        for epoch, entry in zip(epochs, ephem)
+    }
 
 
 def get_or_create_eventloop():
@@ -189,7 +398,7 @@ def query_miriade_syncronously(name, epochs):
 
     # ------
     # Query Miriade for phase angles
-    url = "http://vo.imcce.fr/webservices/miriade/ephemcc_query.php"
+    url = config.MIRIADE_URL
 
     params = {
         "-name": f"a:{name}",
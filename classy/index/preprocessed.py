@@ -0,0 +1,369 @@
+"""Optional on-disk cache of spectra preprocessed for classification."""
+import atexit
+from contextlib import contextmanager
+import hashlib
+import os
+
+import numpy as np
+
+from classy import config
+from classy import preprocessing
+from classy import utils
+
+# taxonomy : ((inode, mtime, size), contents of the cache file)
+CACHE = {}
+
+# taxonomy : {filename : entry}, preprocessed spectra not yet written to disk
+PENDING = {}
+
+# The smoothing parameters which are part of the cache key
+SMOOTHING = [
+    "smooth",
+    "method",
+    "wave_min",
+    "wave_max",
+    "deg_savgol",
+    "window_savgol",
+    "deg_spline",
+]
+
+
+def load(taxonomy, spectra, attributes=None):
+    """Restore spectra from the cache of preprocessed spectra.
+
+    Parameters
+    ----------
+    taxonomy : str
+        The taxonomic system the spectra are preprocessed for.
+    spectra : list of classy.Spectrum
+        The spectra to preprocess.
+    attributes : dict
+        Further attributes set by the preprocessing, mapped to the function
+        restoring them from an array. Default is no attributes.
+
+    Returns
+    -------
+    list of classy.Spectrum
+        The spectra which are not in the cache and have to be preprocessed.
+
+    Notes
+    -----
+    Cached spectra get the preprocessed wavelength, reflectance, and the
+    attributes recorded by the taxonomy. Only spectra with unmodified data from
+    the classy data directory are cached. Their cache key is recorded for ``store``.
+    The cache is only used if config.CACHE_PREPROCESSED is True.
+    """
+    if not config.CACHE_PREPROCESSED:
+        return list(spectra)
+
+    keys = _keys(spectra)
+    cache = _read(taxonomy)
+    pending = PENDING.get(taxonomy, {})
+
+    missing = []
+
+    for spec, key in zip(spectra, keys):
+        if key is None:
+            missing.append(spec)
+            continue
+
+        entry = pending.get(spec.filename)
+
+        if entry is None and spec.filename in cache["rows"]:
+            row = cache["rows"][spec.filename]
+
+            if cache["key"][row] == key:
+                entry = {name: values[row] for name, values in cache["arrays"].items()}
+
+        if (
+            entry is None
+            or entry["key"] != key
+            or not set(attributes or {}) <= set(entry)
+        ):
+            spec._preprocessed_key = key
+            missing.append(spec)
+            continue
+
+        spec.wave = np.array(
+            cache["wave"] if entry.get("wave") is None else entry["wave"]
+        )
+        spec.refl = np.array(entry["refl"], dtype=float)
+        spec.refl_err = None
+
+        for name, restore in (attributes or {}).items():
+            setattr(spec, name, restore(entry[name]))
+
+    return missing
+
+
+def store(taxonomy, spectra, attributes=None):
+    """Add preprocessed spectra to the cache.
+
+    Parameters
+    ----------
+    taxonomy : str
+        The taxonomic system the spectra are preprocessed for.
+    spectra : list of classy.Spectrum
+        The preprocessed spectra.
+    attributes : dict
+        Further attributes set by the preprocessing, mapped to the function
+        restoring them from an array. Default is no attributes.
+
+    Notes
+    -----
+    Only spectra which received a cache key in ``load`` are added. The entries
+    are written to disk by ``flush``, which runs after classifying Spectra and
+    when the interpreter exits.
+    """
+    for spec in spectra:
+        key = spec.__dict__.pop("_preprocessed_key", None)
+
+        if key is None:
+            continue
+
+        entry = {"key": key, "wave": spec.wave.copy(), "refl": spec.refl.copy()}
+
+        for name in attributes or {}:
+            entry[name] = np.array(getattr(spec, name), dtype=float)
+
+        PENDING.setdefault(taxonomy, {})[spec.filename] = entry
+
+
+def contains(taxonomy, spec):
+    """Check if a spectrum can be restored from the cache.
+
+    Parameters
+    ----------
+    taxonomy : str
+        The taxonomic system.
+    spec : classy.Spectrum
+        The spectrum to look up.
+
+    Returns
+    -------
+    bool
+        True if the spectrum is in the cache, else False.
+    """
+    if not config.CACHE_PREPROCESSED:
+        return False
+
+    key = _keys([spec])[0]
+
+    if key is None:
+        return False
+
+    if spec.filename in PENDING.get(taxonomy, {}):
+        return PENDING[taxonomy][spec.filename]["key"] == key
+
+    cache = _read(taxonomy)
+    row = cache["rows"].get(spec.filename)
+    return row is not None and cache["key"][row] == key
+
+
+def flush():
+    """Write the pending preprocessed spectra to the cache files.
+
+    Notes
+    -----
+    The cache file of a taxonomy is locked while it is read, merged with the
+    pending spectra, and replaced, so that concurrent processes do not drop
+    each other's entries.
+    """
+    for taxonomy, entries in PENDING.items():
+        if not entries:
+            continue
+
+        with _lock(taxonomy):
+            _merge(taxonomy, entries)
+
+    PENDING.clear()
+
+
+# Spectra classified one by one are written once instead of after each spectrum
+atexit.register(flush)
+
+
+def clear(taxonomy=None):
+    """Remove preprocessed spectra from the cache.
+
+    Parameters
+    ----------
+    taxonomy : str
+        The taxonomic system to remove the spectra of. Default is None, which
+        removes the spectra of all taxonomies.
+    """
+    for PATH in (config.PATH_DATA / "preprocessed").glob(f"{taxonomy or '*'}.npz"):
+        PATH.unlink()
+
+    CACHE.clear()
+    PENDING.clear()
+
+
+def _path(taxonomy):
+    """Get the path to the cache file of a taxonomy."""
+    return config.PATH_DATA / "preprocessed" / f"{taxonomy}.npz"
+
+
+@contextmanager
+def _lock(taxonomy):
+    """Lock the cache file of a taxonomy against writes of other processes.
+
+    Notes
+    -----
+    The lock is the write lock of an empty SQLite file next to the cache file.
+    Other processes wait up to ``classy.utils.store.TIMEOUT`` seconds for it.
+    """
+    con = utils.store.connect(_path(taxonomy).with_suffix(".lock"))
+
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        yield
+    finally:
+        con.close()
+
+
+def _merge(taxonomy, entries):
+    """Merge pending spectra into the cache file of a taxonomy."""
+    cache = _read(taxonomy)
+    arrays = cache["arrays"]
+
+    names = [name for name in next(iter(entries.values())) if name != "wave"]
+
+    # Drop outdated entries and entries of a different layout
+    if set(arrays) != set(names):
+        arrays = {name: [] for name in names}
+        filenames = []
+    else:
+        keep = [
+            row for filename, row in cache["rows"].items() if filename not in entries
+        ]
+        arrays = {name: list(values[keep]) for name, values in arrays.items()}
+        filenames = list(cache["filename"][keep])
+
+    for filename, entry in entries.items():
+        filenames.append(filename)
+
+        for name in names:
+            arrays[name].append(entry[name])
+
+    wave = next(iter(entries.values()))["wave"]
+
+    PATH = _path(taxonomy)
+    PATH.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first to not corrupt the cache if interrupted
+    PATH_TMP = PATH.with_name(f".{PATH.name}.{os.getpid()}.tmp")
+
+    with open(PATH_TMP, "wb") as file_:
+        np.savez(
+            file_,
+            filename=np.array(filenames, dtype=str),
+            wave=wave,
+            **{name: np.array(values) for name, values in arrays.items()},
+        )
+
+    os.replace(PATH_TMP, PATH)
+
+
+def _read(taxonomy):
+    """Read the cache file of a taxonomy, if it changed since the last read.
+
+    Returns
+    -------
+    dict
+        The filenames, the cache keys, the wavelength grid, the arrays with the
+        preprocessed data, and the rows of the filenames in the arrays.
+    """
+    PATH = _path(taxonomy)
+
+    if not PATH.is_file():
+        return {
+            "filename": np.array([], dtype=str),
+            "key": np.array([], dtype=str),
+            "wave": None,
+            "arrays": {},
+            "rows": {},
+        }
+
+    stat = PATH.stat()
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    if taxonomy not in CACHE or CACHE[taxonomy][0] != key:
+        with np.load(PATH) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        filenames = arrays.pop("filename")
+        wave = arrays.pop("wave")
+
+        cache = {
+            "filename": filenames,
+            "key": arrays["key"],
+            "wave": wave,
+            "arrays": arrays,
+            "rows": {filename: row for row, filename in enumerate(filenames)},
+        }
+        CACHE[taxonomy] = (key, cache)
+
+    return CACHE[taxonomy][1]
+
+
+def _keys(spectra):
+    """Compute the cache keys of spectra.
+
+    Parameters
+    ----------
+    spectra : list of classy.Spectrum
+        The spectra to compute the keys for.
+
+    Returns
+    -------
+    list of str
+        The cache keys. None for spectra which cannot be cached.
+
+    Notes
+    -----
+    The key combines the classy version and the smoothing parameters of the
+    spectrum. Spectra without filename or with data modified since loading them
+    cannot be cached.
+    """
+    import classy
+
+    smoothing = preprocessing.lookup_smoothing(
+        [
+            spec.filename
+            for spec in spectra
+            if isinstance(getattr(spec, "filename", None), str)
+        ]
+    )
+    columns = [column for column in SMOOTHING if column in smoothing.columns]
+
+    keys = []
+
+    for spec in spectra:
+        if not isinstance(getattr(spec, "filename", None), str) or not _is_original(
+            spec
+        ):
+            keys.append(None)
+            continue
+
+        if spec.filename in smoothing.index:
+            params = smoothing.loc[spec.filename, columns].to_dict()
+        else:
+            params = {}
+
+        key = repr((classy.__version__, sorted(params.items())))
+        keys.append(hashlib.sha1(key.encode()).hexdigest())
+
+    return keys
+
+
+def _is_original(spec):
+    """Check if the data of a spectrum is unmodified since loading it."""
+
+    # Spectra which are not loaded yet are unmodified by definition
+    if not getattr(spec, "_is_loaded", True):
+        return "wave" not in spec.__dict__ and "refl" not in spec.__dict__
+
+    return np.array_equal(spec.wave, spec._wave_original) and np.array_equal(
+        spec.refl, spec._refl_original, equal_nan=True
+    )
@@ -0,0 +1,186 @@
+"""Resolve the targets of spectra in bulk using the rocks ssoBFT."""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import rocks
+
+from classy import config
+from classy.utils.logging import logger
+
+# name : rocks.Rock, ordered from least to most recently used
+CACHE = OrderedDict()
+
+# BFT columns mapped to the ssoCard fields
+IDENTIFIERS = {
+    "sso_id": "id",
+    "sso_name": "name",
+    "sso_number": "number",
+    "sso_type": "type",
+    "sso_class": "class",
+    "id": "id",
+    "name": "name",
+    "number": "number",
+    "type": "type",
+    "class": "class",
+}
+
+PARAMETERS = {}
+
+for group in ["physical", "dynamical"]:
+    for path, alias in rocks.config.ALIASES[group].items():
+        if path.startswith("parameters."):
+            PARAMETERS[path.split(".")[-1]] = path
+            PARAMETERS[alias] = path
+
+
+def get(id_):
+    """Get the rocks.Rock of a target.
+
+    Parameters
+    ----------
+    id_ : str or int
+        The target identifier.
+
+    Returns
+    -------
+    rocks.Rock
+        The target.
+    """
+    return resolve([id_])[id_]
+
+
+def resolve(ids):
+    """Resolve many targets at once.
+
+    Parameters
+    ----------
+    ids : list of str or int
+        The target identifiers.
+
+    Returns
+    -------
+    dict
+        The rocks.Rock instances of the targets, keyed by identifier.
+
+    Notes
+    -----
+    Targets are looked up in the local ssoBFT in one read. Identifiers that are
+    not in the ssoBFT, or all identifiers if the ssoBFT is not cached, are
+    resolved with rocks.Rock. Resolved targets are kept in a cache of at most
+    config.TARGET_CACHE_SIZE targets, which are shared between spectra.
+    """
+    targets = {}
+
+    for id_ in ids:
+        if id_ in CACHE:
+            CACHE.move_to_end(id_)
+            targets[id_] = CACHE[id_]
+
+    missing = list(dict.fromkeys(id_ for id_ in ids if id_ not in targets))
+
+    if missing:
+        targets.update(_lookup_bft(missing))
+
+    for id_ in missing:
+        if id_ not in targets:
+            targets[id_] = rocks.Rock(id_)
+
+        CACHE[id_] = targets[id_]
+
+    while len(CACHE) > config.TARGET_CACHE_SIZE:
+        CACHE.popitem(last=False)
+
+    return targets
+
+
+def clear():
+    """Remove all targets from the cache."""
+    CACHE.clear()
+
+
+def _lookup_bft(ids):
+    """Look up targets by name in the local ssoBFT.
+
+    Parameters
+    ----------
+    ids : list of str or int
+        The target identifiers.
+
+    Returns
+    -------
+    dict
+        The rocks.Rock instances of the targets found in the ssoBFT.
+    """
+    if not rocks.bft.PATH.is_file():
+        return {}
+
+    import pyarrow.parquet as pq
+
+    names = [id_ for id_ in ids if isinstance(id_, str)]
+
+    if not names:
+        return {}
+
+    # Unreadable or outdated ssoBFTs fall back to resolving targets with rocks
+    try:
+        # rocks renamed the identifier columns of the ssoBFT
+        columns = pq.read_schema(rocks.bft.PATH).names
+        column_name = "sso_name" if "sso_name" in columns else "name"
+
+        bft = rocks.load_bft(filters=[(column_name, "in", names)])
+    except (OSError, ValueError, KeyError) as error:
+        logger.warning(f"Could not look up targets in ssoBFT: {error}")
+        return {}
+
+    bft = bft.loc[:, ~bft.columns.duplicated()]
+
+    return {
+        row[column_name]: rocks.Rock(
+            row[column_name], ssocard=_to_ssocard(row), skip_id_check=True
+        )
+        for _, row in bft.drop_duplicates(column_name).iterrows()
+    }
+
+
+def _to_ssocard(row):
+    """Convert a row of the ssoBFT into a nested ssoCard.
+
+    Parameters
+    ----------
+    row : pd.Series
+        A row of the ssoBFT.
+
+    Returns
+    -------
+    dict
+        The ssoCard with the identifiers and parameters present in the row.
+    """
+    ssocard = {}
+
+    for column, value in row.items():
+        # Skip missing values and list-like entries
+        if not np.isscalar(value) or pd.isna(value):
+            continue
+
+        if column in IDENTIFIERS:
+            path = [IDENTIFIERS[column]]
+        elif column.split(".")[0] in PARAMETERS:
+            prefix, *rest = column.split(".")
+            path = PARAMETERS[prefix].split(".") + rest
+        else:
+            continue
+
+        if isinstance(value, np.generic):
+            value = value.item()
+
+        entry = ssocard
+        for key in path[:-1]:
+            entry = entry.setdefault(key, {})
+
+            if not isinstance(entry, dict):
+                break
+        else:
+            entry[path[-1]] = value
+
+    return ssocard
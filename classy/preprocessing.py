@@ -1,7 +1,6 @@
 import numpy as np
 import pandas as pd
-from scipy import interpolate, signal
-from scipy.spatial import ConvexHull
+from scipy import interpolate, ndimage, signal
 import sklearn
 
 from classy import config
@@ -59,6 +58,82 @@ def savitzky_golay(refl, **kwargs):
     return refl
 
 
+def savitzky_golay_batch(refls, window_length=None, polyorder=None):
+    """Apply Savitzky-Golay filters to several arrays of values at once.
+
+    Parameters
+    ----------
+    refls : list of np.ndarray
+        Arrays of reflectance values.
+    window_length : int or list of int
+        The window length of the filter, for all arrays or per array. Default is
+        None, which uses a fifth of the number of values of each array.
+    polyorder : int or list of int
+        The polynomial order of the filter, for all arrays or per array. Default
+        is None, which uses 3.
+
+    Returns
+    -------
+    list of np.ndarray
+        The smoothened reflectance values.
+
+    Notes
+    -----
+    The results are the same as when calling ``savitzky_golay`` on each array.
+    Arrays sharing the filter parameters are smoothed together: the filter
+    coefficients are computed once and convolved with all arrays of the group,
+    and the values at the edges are computed from the polynomial fit to the
+    outermost window expressed as a matrix.
+    """
+    refls = [np.array(refl, dtype=float) for refl in refls]
+
+    if window_length is None or np.isscalar(window_length):
+        window_length = [window_length] * len(refls)
+    if polyorder is None or np.isscalar(polyorder):
+        polyorder = [polyorder] * len(refls)
+
+    groups = {}
+
+    for i, (refl, window, order) in enumerate(zip(refls, window_length, polyorder)):
+        window = int(len(refl) // 5) if window is None else int(window)
+        order = 3 if order is None else int(order)
+        groups.setdefault((window, order), []).append(i)
+
+    for (window, order), members in groups.items():
+        # There might be NaN values in the reflectance. They should be ignored.
+        values = [refls[i][~np.isnan(refls[i])] for i in members]
+        sizes = np.array([len(value) for value in values])
+
+        # Raise the same errors as the filter of the individual arrays
+        for value in values:
+            if len(value) < window:
+                signal.savgol_filter(value, window, order)
+
+        coeffs = signal.savgol_coeffs(window, order)
+        edges = signal.savgol_filter(np.eye(window), window, order, axis=0)
+
+        # Zero-padding matches the constant mode of the convolution
+        padded = np.zeros((len(values), sizes.max()))
+        padded[sizes[:, None] > np.arange(sizes.max())] = np.concatenate(values)
+
+        smoothed = ndimage.convolve1d(padded, coeffs, axis=-1, mode="constant")
+
+        # Replace the values within half a window of the edges
+        half = window // 2
+        rows = np.arange(len(values))[:, None]
+        last = sizes[:, None] - window + np.arange(window)
+
+        smoothed[:, :half] = padded[:, :window] @ edges[:half].T
+        smoothed[rows, last[:, window - half :]] = (
+            padded[rows, last] @ edges[window - half :].T
+        )
+
+        for i, size, row in zip(members, sizes, smoothed):
+            refls[i][~np.isnan(refls[i])] = row[:size]
+
+    return refls
+
+
 def univariate_spline(wave, refl, **kwargs):
     """Apply a smoothing spline fit to an array of values.
 
@@ -127,60 +202,400 @@ def resample(wave, refl, grid, **kwargs):
     Notes
     -----
     Any additional parameters are passed to the ``scipy.interpoalte.interp1d`` function.
+    The input arrays are not modified.
     """
+    refl_interp = interpolate.interp1d(np.array(wave), np.array(refl), **kwargs)
+    return refl_interp(grid)
 
-    # Little hack: If the first or the last point are exactly
-    # on the edges, the spline regards it as extrapolation.
-    # Move it slightly outside to get a value there
-    if wave[0] == grid[0]:
-        wave[0] -= 0.0001
-    if wave[-1] == grid[-1]:
-        wave[-1] += 0.0001
 
-    refl_interp = interpolate.interp1d(wave, refl, **kwargs)
-    return refl_interp(grid)
+def pack(waves, refls):
+    """Pack many spectra of different lengths into concatenated arrays.
 
+    Parameters
+    ----------
+    waves : list of np.ndarray
+        The wavelength values of each spectrum.
+    refls : list of np.ndarray
+        The reflectance values of each spectrum.
 
-def compute_convex_hull(spec):
-    # from StackOverflow
-    x = spec.wave[~np.isnan(spec.refl)]
-    y = spec.refl[~np.isnan(spec.refl)]
+    Returns
+    -------
+    np.ndarray, np.ndarray, np.ndarray
+        The concatenated wavelengths, the concatenated reflectances, and the
+        offsets of the spectra. Spectrum i is at [offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(waves) + 1, dtype=int)
+    offsets[1:] = np.cumsum([len(wave) for wave in waves])
 
-    points = np.c_[x, y]
-    augmented = np.concatenate(
-        [points, [(x[0], np.min(y) - 1), (x[-1], np.min(y) - 1)]], axis=0
+    if not len(waves):
+        return np.empty(0), np.empty(0), offsets
+
+    return (
+        np.concatenate(waves).astype(float),
+        np.concatenate(refls).astype(float),
+        offsets,
     )
 
-    hull = ConvexHull(augmented, qhull_options="")
-    continuum_points = points[np.sort([v for v in hull.vertices if v < len(points)])]
-    continuum_function = interpolate.interp1d(
-        *continuum_points.T, fill_value="extrapolate"
+
+def resample_batch(wave, refl, offsets, grid, fill_value=np.nan):
+    """Resample many spectra to a shared wavelength grid at once.
+
+    Parameters
+    ----------
+    wave : np.ndarray
+        The concatenated wavelength values of the spectra, ascending per spectrum.
+    refl : np.ndarray
+        The concatenated reflectance values of the spectra.
+    offsets : np.ndarray
+        The offsets of the spectra in the concatenated arrays, see ``pack``.
+    grid : list
+        The target wavelength values.
+    fill_value : float or str
+        The value assigned outside of the wavelength range of a spectrum. If
+        'extrapolate', the first and last segments of the spectrum are
+        extrapolated linearly. Default is np.nan.
+
+    Returns
+    -------
+    np.ndarray
+        The reflectance values sampled on the target grid, shape (N, len(grid)).
+
+    Notes
+    -----
+    The spectra are linearly interpolated, giving the same results as
+    ``scipy.interpolate.interp1d``. Spectra with fewer than two points are NaN.
+    The input arrays are not modified.
+    """
+    grid = np.asarray(grid, dtype=float)
+    offsets = np.asarray(offsets, dtype=int)
+
+    N = len(offsets) - 1
+    start, end = offsets[:-1, None], offsets[1:, None]
+
+    if not N:
+        return np.empty((0, len(grid)))
+
+    if not len(wave):
+        return np.full((N, len(grid)), np.nan)
+
+    # Place each spectrum in its own wavelength interval to search all at once
+    lower = min(wave.min(), grid.min())
+    span = max(wave.max(), grid.max()) - lower + 1
+
+    ids = np.repeat(np.arange(N), np.diff(offsets))
+    key = ids * span + (wave - lower)
+    key_grid = np.arange(N)[:, None] * span + (grid - lower)[None, :]
+
+    # Interpolation segments, following interp1d
+    hi = np.searchsorted(key, key_grid, side="left")
+    hi = np.clip(hi, start + 1, np.maximum(end - 1, start + 1))
+    hi = np.minimum(hi, len(wave) - 1)
+    lo = np.maximum(hi - 1, 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (refl[hi] - refl[lo]) / (wave[hi] - wave[lo])
+        refl_grid = slope * (grid[None, :] - wave[lo]) + refl[lo]
+
+    if fill_value != "extrapolate":
+        outside = (grid[None, :] < wave[np.minimum(start, len(wave) - 1)]) | (
+            grid[None, :] > wave[np.maximum(end - 1, 0)]
+        )
+        refl_grid[outside] = fill_value
+
+    # Too few points to interpolate
+    refl_grid[(end - start).ravel() < 2] = np.nan
+    return refl_grid
+
+
+# Maximum number of vectorized passes before the convex-hull scan
+HULL_PASSES = 3
+
+
+def compute_convex_hull(spec):
+    """Compute the convex-hull continuum of a spectrum.
+
+    Parameters
+    ----------
+    spec : classy.Spectrum or classy.features.Feature
+        The spectrum or feature to compute the continuum of.
+
+    Returns
+    -------
+    Continuum
+        The continuum through the vertices of the upper convex hull.
+    """
+    return compute_convex_hull_batch([spec.wave], [spec.refl])[0]
+
+
+def compute_convex_hull_batch(waves, refls):
+    """Compute the convex-hull continua of many spectra at once.
+
+    Parameters
+    ----------
+    waves : list of np.ndarray
+        The sorted wavelength values of each spectrum.
+    refls : list of np.ndarray
+        The reflectance values of each spectrum.
+
+    Returns
+    -------
+    list of Continuum
+        The continua through the vertices of the upper convex hulls.
+
+    Notes
+    -----
+    NaN reflectances are ignored. As the wavelengths are sorted, the upper hull
+    is found with a monotone-chain scan of each spectrum. Before the scan, at most
+    HULL_PASSES vectorized passes over all spectra remove the points on or below
+    the line through their neighbouring points, which are not on the hull. This
+    keeps the total cost linear in the number of points. Spectra without
+    valid reflectances get continua without vertices, which evaluate to NaN.
+    """
+    waves = [np.asarray(wave, dtype=float) for wave in waves]
+    refls = [np.asarray(refl, dtype=float) for refl in refls]
+
+    # Ensure that there are no NaNs
+    wave, refl, offsets = pack(
+        [wave[~np.isnan(refl)] for wave, refl in zip(waves, refls)],
+        [refl[~np.isnan(refl)] for refl in refls],
     )
-    return continuum_function
+
+    # The first and last point of each spectrum are always on the hull
+    is_edge = np.zeros(len(wave), dtype=bool)
+    is_edge[offsets[:-1][np.diff(offsets) > 0]] = True
+    is_edge[offsets[1:][np.diff(offsets) > 0] - 1] = True
+
+    vertices = np.arange(len(wave))
+
+    for _ in range(HULL_PASSES):
+        if len(vertices) <= 2:
+            break
+
+        # Compare each vertex to the line through its neighbouring vertices
+        lo, mid, hi = vertices[:-2], vertices[1:-1], vertices[2:]
+
+        cross = (wave[hi] - wave[lo]) * (refl[mid] - refl[lo]) - (
+            refl[hi] - refl[lo]
+        ) * (wave[mid] - wave[lo])
+
+        is_below = (cross <= 0) & ~is_edge[mid]
+
+        if not is_below.any():
+            break
+
+        vertices = np.delete(vertices, np.flatnonzero(is_below) + 1)
+
+    # Scan the remaining points of each spectrum
+    ends = np.searchsorted(vertices, offsets)
+    continua = []
+
+    for start, end in zip(ends[:-1], ends[1:]):
+        # Spectra without valid reflectances have no hull
+        if start == end:
+            continua.append(Continuum(np.empty(0), np.empty(0)))
+            continue
+
+        hull = _upper_hull(wave[vertices[start:end]], refl[vertices[start:end]])
+        continua.append(
+            Continuum(wave[vertices[start:end]][hull], refl[vertices[start:end]][hull])
+        )
+
+    return continua
+
+
+def _upper_hull(wave, refl):
+    """Find the upper convex hull of points sorted by wavelength.
+
+    Parameters
+    ----------
+    wave : np.ndarray
+        The sorted wavelength values.
+    refl : np.ndarray
+        The reflectance values.
+
+    Returns
+    -------
+    list of int
+        The indices of the hull vertices, in ascending order.
+
+    Notes
+    -----
+    Andrew's monotone-chain scan: each point is pushed once onto a stack and the
+    points on or below the line from the second-to-last vertex to the new point
+    are popped, taking linear time.
+    """
+    wave, refl = wave.tolist(), refl.tolist()
+    hull = []
+
+    for i, (x, y) in enumerate(zip(wave, refl)):
+        while len(hull) >= 2:
+            lo, mid = hull[-2], hull[-1]
+
+            cross = (x - wave[lo]) * (refl[mid] - refl[lo]) - (y - refl[lo]) * (
+                wave[mid] - wave[lo]
+            )
+
+            if cross > 0:
+                break
+
+            hull.pop()
+
+        hull.append(i)
+
+    return hull
+
+
+class Continuum:
+    def __init__(self, wave, refl):
+        """Create a piecewise-linear continuum.
+
+        Parameters
+        ----------
+        wave : np.ndarray
+            The sorted wavelengths of the continuum vertices.
+        refl : np.ndarray
+            The reflectances of the continuum vertices.
+
+        Notes
+        -----
+        Calling the continuum interpolates linearly between the vertices and
+        extrapolates the outermost segments, like ``scipy.interpolate.interp1d``
+        with ``fill_value="extrapolate"``. Continua with fewer than two vertices
+        are NaN.
+        """
+        self.wave = np.asarray(wave, dtype=float)
+        self.refl = np.asarray(refl, dtype=float)
+
+    def __repr__(self):
+        return f"<Continuum with {len(self.wave)} vertices>"
+
+    def __call__(self, wave):
+        """Evaluate the continuum.
+
+        Parameters
+        ----------
+        wave : float or np.ndarray
+            The wavelengths to evaluate the continuum at.
+
+        Returns
+        -------
+        float or np.ndarray
+            The continuum reflectance at the wavelengths.
+        """
+        wave = np.asarray(wave, dtype=float)
+
+        if len(self.wave) < 2:
+            return np.full(wave.shape, np.nan)
+
+        hi = np.clip(np.searchsorted(self.wave, wave), 1, len(self.wave) - 1)
+        lo = hi - 1
+
+        slope = (self.refl[hi] - self.refl[lo]) / (self.wave[hi] - self.wave[lo])
+        return slope * (wave - self.wave[lo]) + self.refl[lo]
 
 
 def load_smoothing():
-    """Load the feature index."""
-    if not (config.PATH_DATA / "smoothing.csv").is_file():
+    """Load the smoothing index."""
+    _migrate_smoothing()
+
+    if not _path_smoothing().is_file():
         return pd.DataFrame()
-    return pd.read_csv(
-        config.PATH_DATA / "smoothing.csv",
-        index_col="filename",
-        dtype={
-            "deg_savgol": int,
-            "deg_spline": int,
-            "window_savgol": int,
-        },
+    return utils.cache.read(
+        _path_smoothing(),
+        lambda path: _restore_smoothing(
+            utils.store.read(path, "smoothing", ["filename"])
+        ),
+    )
+
+
+def lookup_smoothing(filenames):
+    """Look up entries of the smoothing index.
+
+    Parameters
+    ----------
+    filenames : list of str
+        The filenames of the spectra to look up.
+
+    Returns
+    -------
+    pd.DataFrame
+        The entries of the smoothing index which match the filenames.
+    """
+    _migrate_smoothing()
+    return _restore_smoothing(
+        utils.store.read(_path_smoothing(), "smoothing", ["filename"], keys=filenames)
     )
 
 
 def store_smoothing(smoothing):
-    """Store the feature index after copying metadata from the spectra index."""
+    """Store the smoothing index after copying metadata from the spectra index."""
+    _migrate_smoothing()
+
     with np.errstate(invalid="ignore"):
         smoothing["number"] = smoothing["number"].astype("Int64")
-    smoothing.to_csv(
-        config.PATH_DATA / "smoothing.csv", index=True, index_label="filename"
-    )
+    smoothing.index.name = "filename"
+    utils.store.replace(_path_smoothing(), "smoothing", smoothing)
+    utils.cache.invalidate(_path_smoothing())
+
+
+def upsert_smoothing(smoothing):
+    """Add or update entries of the smoothing index.
+
+    Parameters
+    ----------
+    smoothing : pd.DataFrame
+        The smoothing parameters, indexed by the filenames of the spectra.
+
+    Notes
+    -----
+    All entries are written in a single transaction, which is safe when several
+    processes write to the smoothing index. Other entries are left unchanged.
+    """
+    _migrate_smoothing()
+
+    if "number" in smoothing.columns:
+        with np.errstate(invalid="ignore"):
+            smoothing["number"] = smoothing["number"].astype("Int64")
+    smoothing.index.name = "filename"
+    utils.store.upsert(_path_smoothing(), "smoothing", smoothing)
+    utils.cache.invalidate(_path_smoothing())
+
+
+def _path_smoothing():
+    """Get the path to the smoothing index."""
+    return config.PATH_DATA / "smoothing.db"
+
+
+def _migrate_smoothing():
+    """Move the entries of the legacy smoothing.csv into the smoothing index.
+
+    Notes
+    -----
+    The CSV file is left unchanged and ignored once the smoothing index exists.
+    """
+    if (
+        _path_smoothing().is_file()
+        or not (config.PATH_DATA / "smoothing.csv").is_file()
+    ):
+        return
+
+    smoothing = pd.read_csv(config.PATH_DATA / "smoothing.csv", index_col="filename")
+    utils.store.replace(_path_smoothing(), "smoothing", smoothing)
+    logger.debug("Moved smoothing.csv into the smoothing index.")
+
+
+def _restore_smoothing(smoothing):
+    """Restore the types of the smoothing index columns."""
+    for column in ["deg_savgol", "deg_spline", "window_savgol"]:
+        if column in smoothing.columns and smoothing[column].notna().all():
+            smoothing[column] = smoothing[column].astype(int)
+
+    if "smooth" in smoothing.columns:
+        smoothing["smooth"] = smoothing["smooth"].fillna(False).astype(bool)
+
+    if "number" in smoothing.columns:
+        smoothing["number"] = smoothing["number"].astype("Int64")
+    return smoothing
 
 
 def _within_extrapolation_limit(wave_min, wave_max, grid_min, grid_max):
@@ -251,6 +666,60 @@ def remove_slope(wave, refl, translate_to=None):
     return refl, tuple(slope_params)
 
 
+def remove_slope_batch(wave, refl, offsets, translate_to=None):
+    """Fit linear functions to many spectra at once and divide by the fits.
+
+    Parameters
+    ----------
+    wave : np.ndarray
+        The concatenated wavelength values of the spectra.
+    refl : np.ndarray
+        The concatenated reflectance values of the spectra.
+    offsets : np.ndarray
+        The offsets of the spectra in the concatenated arrays, see ``pack``.
+    translate_to : float
+        Translate the fitted slopes to pass trough unity at given wavelength.
+        Default is None.
+
+    Returns
+    -------
+    np.ndarray
+        The concatenated slope-removed reflectance values.
+    np.ndarray
+        The parameters of the fitted 1d polynomials (slope, intercept), of shape N x 2.
+
+    Notes
+    -----
+    The least-squares lines are computed in closed form from the per-spectrum
+    sums of the centred values, giving the same results as ``remove_slope``.
+    The input arrays are not modified.
+    """
+    offsets = np.asarray(offsets, dtype=int)
+    counts = np.diff(offsets)
+    N = len(counts)
+
+    ids = np.repeat(np.arange(N), counts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_wave = np.bincount(ids, weights=wave, minlength=N) / counts
+        mean_refl = np.bincount(ids, weights=refl, minlength=N) / counts
+
+        dwave = wave - mean_wave[ids]
+        drefl = refl - mean_refl[ids]
+
+        slope = np.bincount(ids, weights=dwave * drefl, minlength=N) / np.bincount(
+            ids, weights=dwave**2, minlength=N
+        )
+
+    intercept = mean_refl - slope * mean_wave
+
+    if translate_to is not None:
+        intercept = 1 - slope * translate_to
+
+    slope_params = np.column_stack([slope, intercept])
+    return refl / (slope[ids] * wave + intercept[ids]), slope_params
+
+
 def _normalize_at(wave, refl, at):
     """Normalize at given wavelength."""
 
@@ -1,9 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 
 from classy import config
 from classy import core
+from classy import index
 from classy import sources
+from classy.utils.logging import logger
 
 from . import akari, cds, gaia, m4ast, manos, mithneos, pds, private, smass
 
@@ -83,23 +87,47 @@ def load_data(idx):
         The data and metadata. List-like attributes are in the dataframe,
         single-value attributes in the dictionary.
     """
-
-    host = (
-        getattr(sources, idx.host.lower())
-        if idx.host.lower() in ["pds", "cds"]
-        else sources
-    )
-    module = getattr(host, idx.module.lower())
+    module = _get_module(idx.host, idx.module)
 
     # Load spectrum data file
-    PATH_DATA = config.PATH_DATA / idx.name
-
-    if module is private:
-        data = _load_private_data(PATH_DATA)
-    elif module is gaia:
+    if module is gaia:
         data = gaia._load_virtual_file(idx)
     else:
-        data = pd.read_csv(PATH_DATA, **module.DATA_KWARGS)
+        data = _read_data_file(module, config.PATH_DATA / idx.name)
+
+    return _transform_data(module, idx, data)
+
+
+def _get_module(host, module):
+    """Get the source module of a spectrum from its index host and module."""
+    host = getattr(sources, host.lower()) if host.lower() in ["pds", "cds"] else sources
+    return getattr(host, module.lower())
+
+
+def _read_data_file(module, PATH_DATA):
+    """Read the data file of a spectrum using the module-specific parameters."""
+    if module is private:
+        return _load_private_data(PATH_DATA)
+    return pd.read_csv(PATH_DATA, **module.DATA_KWARGS)
+
+
+def _transform_data(module, idx, data):
+    """Remove invalid data points and apply module-specific data transforms.
+
+    Parameters
+    ----------
+    module : module
+        The source module of the spectrum.
+    idx : pd.Series
+        A row from the classy spectra index.
+    data : pd.DataFrame
+        The spectrum data as read from the data file.
+
+    Returns
+    -------
+    pd.DataFrame, dict
+        The data and metadata.
+    """
 
     # Remove invalid data points
     data = data[data.wave > 0]
@@ -147,11 +175,126 @@ def load_spectrum(idx, skip_target):
     # Load data and metadata
     data, meta = load_data(idx)
 
+    spec = _create_spectrum(idx, data, meta)
+
+    if not skip_target:
+        spec.set_target(idx["name"])
+    return spec
+
+
+def load_spectra(idx_spectra, skip_target, workers=None):
+    """Load many cached spectra at once.
+
+    Parameters
+    ----------
+    idx_spectra : pd.DataFrame
+        Rows from the classy spectra index.
+    skip_target : bool
+        Skip the resolution of the targets of the spectra.
+    workers : int
+        Number of processes to load the spectra with. Default is None, in which
+        case config.WORKERS is used.
+
+    Returns
+    -------
+    list of classy.Spectrum
+        The requested spectra, in the order of the index rows. Spectra whose
+        files are missing or unreadable are reported and left out.
+
+    Notes
+    -----
+    The index rows are grouped by source module, which is looked up once per
+    group. Gaia spectra are read from the store of each archive part at once.
+    All targets are resolved in one lookup, see index.targets.resolve.
+    """
+    if idx_spectra.empty:
+        return []
+
+    if workers is None:
+        workers = config.WORKERS
+
+    if workers > 1 and len(idx_spectra) > 1:
+        # Several chunks per worker to balance slow and fast sources
+        chunks = np.array_split(
+            np.arange(len(idx_spectra)), min(4 * workers, len(idx_spectra))
+        )
+
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(config.PATH_DATA,)
+        ) as pool:
+            spectra = pool.map(
+                _load_spectra, [idx_spectra.iloc[chunk] for chunk in chunks]
+            )
+            spectra = [spec for chunk in spectra for spec in chunk]
+    else:
+        spectra = _load_spectra(idx_spectra)
+
+    if not skip_target:
+        # Resolve each target once
+        targets = index.targets.resolve(idx_spectra["name"].unique())
+
+        for spec, name in zip(spectra, idx_spectra["name"]):
+            if spec is not None:
+                spec.target = targets[name]
+
+    return [spec for spec in spectra if spec is not None]
+
+
+def _init_worker(PATH_DATA):
+    """Use the data directory of the parent process in a loading worker."""
+    config.PATH_DATA = PATH_DATA
+    gaia.PATH = PATH_DATA / "gaia"
+
+
+def _load_spectra(idx_spectra):
+    """Load cached spectra without resolving their targets.
+
+    Parameters
+    ----------
+    idx_spectra : pd.DataFrame
+        Rows from the classy spectra index.
+
+    Returns
+    -------
+    list of classy.Spectrum
+        The requested spectra in the order of the index rows. None for spectra
+        whose files are missing or unreadable.
+    """
+    spectra = {}
+
+    for (host, module), entries in idx_spectra.groupby(
+        ["host", "module"], observed=True, sort=False
+    ):
+        module = _get_module(host, module)
+
+        if module is gaia:
+            data = gaia._load_virtual_files(entries)
+        else:
+            data = [config.PATH_DATA / filename for filename in entries.index]
+
+        for (filename, idx), data_ in zip(entries.iterrows(), data):
+            try:
+                if data_ is None:
+                    raise FileNotFoundError("Spectrum is not in the Gaia store.")
+
+                if module is not gaia:
+                    data_ = _read_data_file(module, data_)
+
+                data_, meta = _transform_data(module, idx, data_)
+                spectra[filename] = _create_spectrum(idx, data_, meta)
+            # Missing or unreadable files, other errors are raised
+            except (OSError, ValueError) as error:
+                logger.error(f"Could not load spectrum '{filename}': {error}")
+                spectra[filename] = None
+
+    return [spectra[filename] for filename in idx_spectra.index]
+
+
+def _create_spectrum(idx, data, meta):
+    """Create a Spectrum from its index row, data, and metadata."""
+
     # Add list-type attributes when instantiating
-    spec = core.Spectrum(
-        target=idx["name"] if not skip_target else None,
-        **{col: data[col].values for col in data.columns},
-    )
+    spec = core.Spectrum(**{col: data[col].values for col in data.columns})
 
     # Add metadata from index
     for attr in ["shortbib", "bibcode", "host", "source", "date_obs"]:
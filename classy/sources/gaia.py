@@ -1,5 +1,8 @@
+from functools import lru_cache
+import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import rocks
 
@@ -13,6 +16,23 @@ DATA_KWARGS = {}
 
 PATH = config.PATH_DATA / "gaia"
 
+# Per-asteroid metadata stored alongside the spectra arrays
+META = [
+    "source_id",
+    "number_mp",
+    "solution_id",
+    "denomination",
+    "nb_samples",
+    "num_of_spectra",
+]
+
+# Spectral columns stored as (N, 16) arrays
+ARRAYS = {
+    "refl": "reflectance_spectrum",
+    "refl_err": "reflectance_spectrum_err",
+    "flag": "reflectance_spectrum_flag",
+}
+
 
 def _build_index():
     # Retrieve the spectra
@@ -25,6 +45,8 @@ def _build_index():
         PATH_PART = PATH / f"part{idx:02}"
         PATH_PART.mkdir(exist_ok=True)
 
+        _build_store(part, PATH_PART)
+
         # Create list of identifiers from number and name columns
         ids = part.number_mp.fillna(part.denomination).values
         names, numbers = zip(*rocks.id(ids))
@@ -53,30 +75,161 @@ def _build_index():
     entries = pd.concat(entries)
     index.add(entries)
 
+    # Drop memory maps of the stores which were replaced
+    _load_store.cache_clear()
+
+
+def _build_store(part, PATH_PART):
+    """Convert a Gaia archive part into a memory-mappable array store.
+
+    Parameters
+    ----------
+    part : pd.DataFrame
+        The contents of one Gaia archive part, one row per asteroid and wavelength.
+    PATH_PART : pathlib.Path
+        The directory to write the store to.
+
+    Notes
+    -----
+    The store consists of the wavelength grid 'wave.npy', the (N, 16) float32
+    arrays 'refl.npy', 'refl_err.npy', 'flag.npy', and the per-asteroid
+    metadata 'meta.parquet', whose 'row' column points into the arrays.
+
+    Each file is written under a temporary name and moved into place, so that
+    memory maps of a previous store remain valid and concurrent builds do not
+    corrupt each other. 'meta.parquet' is written last and marks the store as
+    complete.
+    """
+    wave = np.unique(part.wavelength.values)
+
+    denominations, rows = np.unique(part.denomination.values, return_inverse=True)
+    cols = np.searchsorted(wave, part.wavelength.values)
+
+    for column, column_archive in ARRAYS.items():
+        values = np.full((len(denominations), len(wave)), np.nan, dtype=np.float32)
+        values[rows, cols] = part[column_archive].values
+        _write(PATH_PART / f"{column}.npy", lambda file_: np.save(file_, values))
+
+    meta = part.drop_duplicates(subset="denomination").set_index("denomination")
+    meta = meta.loc[denominations, [m for m in META if m != "denomination"]]
+    meta["row"] = np.arange(len(denominations))
+
+    _write(
+        PATH_PART / "wave.npy", lambda file_: np.save(file_, wave.astype(np.float32))
+    )
+    _write(PATH_PART / "meta.parquet", meta.to_parquet)
+
+
+def _write(PATH, write):
+    """Write a file of the store under a temporary name and move it into place."""
+    PATH_TMP = PATH.with_name(f".{PATH.name}.{os.getpid()}.tmp")
+
+    with open(PATH_TMP, "wb") as file_:
+        write(file_)
+
+    os.replace(PATH_TMP, PATH)
+
+
+@lru_cache(maxsize=None)
+def _load_store(part):
+    """Memory-map the array store of a Gaia archive part.
+
+    Parameters
+    ----------
+    part : str
+        The two-digit number of the archive part.
+
+    Returns
+    -------
+    dict
+        The wavelength grid, the memory-mapped spectral arrays, and the
+        metadata indexed by denomination.
+    """
+    PATH_PART = PATH / f"part{part}"
+
+    # Convert archives that were cached before the store was introduced
+    if not (PATH_PART / "meta.parquet").is_file():
+        PATH_PART.mkdir(exist_ok=True)
+        _build_store(
+            pd.read_csv(PATH / f"{part}.csv.gz", compression="gzip", comment="#"),
+            PATH_PART,
+        )
+
+    store = {
+        column: np.load(PATH_PART / f"{column}.npy", mmap_mode="r")
+        for column in ["wave", *ARRAYS]
+    }
+    store["meta"] = pd.read_parquet(PATH_PART / "meta.parquet")
+    return store
+
 
 def _load_virtual_file(idx):
     """Make Gaia archive compatible with one-file-one-spectrum approach
     without creating 65k actual files.
     """
+    data = _load_virtual_files(pd.DataFrame([idx]))[0]
 
-    # Load part and select asteroid
-    part = str(Path(idx.name).parent.name).strip("part")
-    part = pd.read_csv(PATH / f"{part}.csv.gz", compression="gzip", comment="#")
-    part = part[(part.denomination == idx["name"]) | (part.number_mp == idx.number)]
-
-    # Adapt to classy naming scheme
-    part = part.rename(
-        columns={
-            "wavelength": "wave",
-            "reflectance_spectrum": "refl",
-            "reflectance_spectrum_err": "refl_err",
-            "reflectance_spectrum_flag": "flag",
-        }
-    )
+    if data is None:
+        raise KeyError(f"Spectrum '{idx.name}' is not in the Gaia store.")
+    return data
+
+
+def _load_virtual_files(entries):
+    """Load the virtual files of many Gaia spectra.
+
+    Parameters
+    ----------
+    entries : pd.DataFrame
+        Rows from the classy spectra index, all pointing to Gaia spectra.
+
+    Returns
+    -------
+    list of pd.DataFrame
+        The spectra data in the order of the index rows. None for spectra
+        which are not in the store.
+
+    Notes
+    -----
+    The spectra of each archive part are read from its store in one go.
+    """
+    filenames = [Path(filename) for filename in entries.index]
+    parts = np.array([filename.parent.name.strip("part") for filename in filenames])
+
+    data = [None] * len(filenames)
+
+    for part in np.unique(parts):
+        store = _load_store(part)
+
+        # Look up asteroids in the store of their part
+        indices = np.flatnonzero(parts == part)
+        denominations = [filenames[i].stem for i in indices]
+
+        # Spectra missing from the store are returned as None
+        meta = store["meta"].reindex(denominations)
+        found = ~pd.isna(meta["row"]).values
+
+        meta = meta[found]
+        indices = indices[found]
+        denominations = list(meta.index)
+
+        rows = meta["row"].values.astype(int)
+
+        arrays = {column: store[column][rows].astype(float) for column in ARRAYS}
+        wave = store["wave"].astype(float) / 1000  # to micron
+
+        for j, (i, denomination) in enumerate(zip(indices, denominations)):
+            data_ = pd.DataFrame(
+                {"wave": wave, **{column: arrays[column][j] for column in ARRAYS}}
+            )
+
+            for column in META:
+                data_[column] = (
+                    denomination if column == "denomination" else meta[column].iloc[j]
+                )
+
+            data[i] = data_[~pd.isna(data_.refl)].reset_index(drop=True)
 
-    part = part[~pd.isna(part.refl)]
-    part.wave /= 1000  # to micron
-    return part
+    return data
 
 
 def _transform_data(_, data):
@@ -84,7 +237,7 @@ def _transform_data(_, data):
 
     # Apply correction by Tinaut-Ruano+ 2023
     CORR = [1.07, 1.05, 1.02, 1.01, 1.00]
-    refl = data.refl.values
+    refl = data.refl.values.copy()
     refl[: len(CORR)] *= CORR
     data.refl = refl
 
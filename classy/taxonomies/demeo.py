@@ -1,12 +1,13 @@
 """Classification of asteroids following DeMeo+ 2009."""
 
-from functools import lru_cache
+from functools import lru_cache, partial
 
 import numpy as np
 import pandas as pd
 
 from classy import config
 from classy import core
+from classy import index
 from classy.utils.logging import logger
 from classy import preprocessing
 from classy import utils
@@ -38,6 +39,9 @@ CLASSES = [
     "V",
 ]
 
+# Attributes of the preprocessed spectra to cache, see index.preprocessed
+PREPROCESSED = {"slope": tuple}
+
 
 def is_classifiable(spec):
     """Check if spectrum can be classified based on the wavelength range.
@@ -70,245 +74,300 @@ def is_classifiable(spec):
 # ------
 # Functions for preprocessing
 def preprocess(spec):
-    """Preprocess a spectrum for classification following DeMeo+ 2009.
+    preprocess_batch([spec])
+
+
+def preprocess_batch(spectra):
+    """Preprocess several spectra for classification following DeMeo+ 2009.
 
     Parameters
     ----------
-    spec : classy.Spectrum
-        The spectrum to preprocess.
-
-    Returns
-    -------
-    classy.Spectrum
-        The preprocessed spectrum.
+    spectra : list of classy.Spectrum
+        The spectra to preprocess.
 
     Notes
     -----
     Preprocessing steps include slope removal, renormalization, and resampling.
+    The slopes of all spectra are fit at once in closed form and all spectra are
+    resampled to the classification grid at once. Spectra in the cache of
+    preprocessed spectra are restored instead, see config.CACHE_PREPROCESSED.
     """
+    missing = index.preprocessed.load("demeo", spectra, attributes=PREPROCESSED)
 
-    # Remove slope and renormalize
-    spec.normalize(at=0.55)
-    spec.remove_slope(translate_to=0.55)
+    if missing:
+        for spec in missing:
+            spec.normalize(at=0.55)
 
-    # Resample to DeMeo+ 2009 wavelength grid
-    spec.resample(WAVE, fill_value="extrapolate")
-    # spec.detect_features()
+        wave, refl, offsets = preprocessing.pack(
+            [spec.wave for spec in missing], [spec.refl for spec in missing]
+        )
+
+        # Remove slope and renormalize
+        refl, slopes = preprocessing.remove_slope_batch(
+            wave, refl, offsets, translate_to=0.55
+        )
+
+        # Resample to DeMeo+ 2009 wavelength grid
+        refl = preprocessing.resample_batch(
+            wave, refl, offsets, WAVE, fill_value="extrapolate"
+        )
+
+        for spec, refl_, slope in zip(missing, refl, slopes):
+            spec.refl = refl_
+            spec.wave = np.array(WAVE)
+            spec.refl_err = None
+            spec.slope = tuple(slope)
+
+    index.preprocessed.store("demeo", missing, attributes=PREPROCESSED)
 
 
 # ------
 # Functions for classification
 def classify(spec):
-    """Classify a spectrum in the system of DeMeo+ 2009.
+    classify_batch([spec])
+
+
+def classify_batch(spectra):
+    """Classify several preprocessed spectra at once in the system of DeMeo+ 2009.
 
     Parameters
     ----------
-    spec : classy.Spectrum
-        The spectrum to classify.
+    spectra : list of classy.Spectrum
+        The preprocessed spectra to classify.
 
-    Returns
-    ----------
-    classy.Spectrum
-        The spectrum which added classification attributes: ['class_demeo', 'scores_demeo'].
+    Notes
+    -----
+    The spectra receive the classification attributes ['class_demeo', 'scores_demeo'].
+    The scores of all spectra are computed with a single projection onto the
+    eigenvectors and the classes with the vectorized decision tree.
     """
 
-    # Check if it can be classified in this scheme
-    # Check if it has been preprocessed for this scheme
+    refl = np.array([spec.refl for spec in spectra], dtype=float)
+    slope = np.array([spec.slope[0] for spec in spectra], dtype=float)
 
     # Extract the reflectance and demean following DeMeo+ 2009
-    refl = np.concatenate([spec.refl[:2], spec.refl[3:]])
-    refl -= DATA_MEAN.T
+    demeaned = np.delete(refl, 2, axis=1) - DATA_MEAN
 
     # Compute scores
-    spec.scores_demeo = EIGENVECTORS @ refl.T
+    scores = demeaned @ EIGENVECTORS.T
 
     # And compute the class
-    class_ = decision_tree(spec)
-    add_classification_results(
-        spec, results={"class_demeo": class_, "scores_demeo": spec.scores_demeo}
-    )
+    classes = decision_tree(spectra, refl, scores, slope)
+
+    for spec, class_, scores_ in zip(spectra, classes, scores):
+        add_classification_results(
+            spec, results={"class_demeo": class_, "scores_demeo": scores_}
+        )
 
 
-def decision_tree(spec):
-    """Implements the class decision tree given in Table B in Appendix B of DeMeo+ 2009."""
+def decision_tree(spectra, refl, scores, slope):
+    """Implements the class decision tree given in Table B in Appendix B of DeMeo+ 2009.
+
+    Parameters
+    ----------
+    spectra : list of classy.Spectrum
+        The preprocessed spectra to classify.
+    refl : np.ndarray
+        The preprocessed reflectances of the spectra, of shape N x len(WAVE).
+    scores : np.ndarray
+        The principal component scores of the spectra, of shape N x 5.
+    slope : np.ndarray
+        The slopes of the spectra, of shape N.
+
+    Returns
+    -------
+    np.ndarray
+        The classes of the spectra, of shape N.
+
+    Notes
+    -----
+    The decision regions are evaluated as boolean masks for all spectra at once.
+    Only spectra in regions which depend on the presence of the e-, h-, or
+    k-feature or on the correlation with class templates are resolved one by one.
+    """
 
     # Align with DeMeo's notation but dropping the '
-    pc1, pc2, pc3, pc4 = spec.scores_demeo[:4]
-    slope = spec.slope[0]
+    pc1, pc2, pc3, pc4, pc5 = scores[:, :5].T
 
     # Lines
-    alpha = lambda pc2: -3 * pc2 - 0.28  # = pc1
-    beta = lambda pc2: -3 * pc2 + 0.35  # = pc1
-    gamma = lambda pc2: -3 * pc2 + 1.0  # = pc1
-    delta = lambda pc2: -3 * pc2 + 1.5  # = pc1
-    epsilon = lambda pc2: 1 / 3 * pc2 + 0.55  # = pc1
-    zeta = lambda pc2: 1 / 3 * pc2 - 0.10  # = pc1
-    eta = lambda pc2: 1 / 3 * pc2 - 0.40  # = pc1
-    theta = lambda pc2: -3 * pc2 + 0.7  # = pc1
+    alpha = -3 * pc2 - 0.28  # = pc1
+    beta = -3 * pc2 + 0.35  # = pc1
+    gamma = -3 * pc2 + 1.0  # = pc1
+    delta = -3 * pc2 + 1.5  # = pc1
+    epsilon = 1 / 3 * pc2 + 0.55  # = pc1
+    zeta = 1 / 3 * pc2 - 0.10  # = pc1
+    eta = 1 / 3 * pc2 - 0.40  # = pc1
+    theta = -3 * pc2 + 0.7  # = pc1
 
     # Vis-IR step 1
-    if (pc1 < -0.3) and (pc3 >= 0.2) and (slope >= 0.4):
-        if 0.55 <= slope < 1.5:
-            return "A"
-        elif 0.4 <= slope < 0.55:
-            return "Sa"
-        else:
-            logger.warning("DeMeo class is indeterminate after VisIR step 1")
-            spec.class_demeo = ""
+    step_1 = (pc1 < -0.3) & (pc3 >= 0.2) & (slope >= 0.4)
+
+    for i in np.flatnonzero(step_1 & ~((0.4 <= slope) & (slope < 1.5))):
+        logger.warning(
+            f"[{spectra[i].name}]: DeMeo class is indeterminate after VisIR step 1"
+        )
 
     # Vis-IR step 2
-    if pc1 > alpha(pc2):  # lies above alpha line
-        if pc1 >= gamma(pc2):
-            if slope >= 0.25:
-                return "Vw"
-            else:
-                return "V"
-
-        if pc1 <= eta(pc2) and pc1 >= theta(pc2) and pc1 < delta(pc2):
-            return "O"
-        if pc1 <= eta(pc2) and pc1 >= alpha(pc2) and pc1 < theta(pc2):
-            if slope >= 0.25:
-                return "Qw"
-            else:
-                return "Q"
-        if pc1 >= eta(pc2) and pc1 >= gamma(pc2) and pc1 < delta(pc2):
-            return "R"
-        return demeo_s_complex(spec)
-
-    # Vis-IR step 3
-    if 0.38 <= slope < 1.5 and -0.44 < pc1 < 0.4:
-        corr_A, corr_D = _compute_template_correlation(spec, ["A", "D"])
-
-        if corr_A > corr_D:
-            return "A"
-        return "D"
-
-    if 0.25 < slope < 0.38 and -0.28 < pc2 < -0.2 and -0.2 < pc3 < -0.12:
-        return "T"
-
-    if 0.07 < pc1 < 1.0 and -0.5 < pc2 < -0.15:
-        if spec.e.is_present:
-            return "Xe"
-        return "L"
-
-    if -0.075 < pc3 < 0.14 and -0.2 <= pc2 < 0.1 and -0.8 < pc1 < 0.1:
-        if spec.e.is_present:
-            return "Xe"
-        return "K"
-
-    return demeo_c_and_x_complexes(spec)
-
-
-def demeo_s_complex(spec):
-    # Align with DeMeo's notation but dropping the '
-    pc1, pc2, pc3, pc4 = spec.scores_demeo[:4]
-    slope = spec.slope[0]
+    above = pc1 > alpha  # lies above alpha line
+
+    # Regions in order of precedence and their classes
+    regions = [
+        (step_1 & (0.55 <= slope) & (slope < 1.5), "A"),
+        (step_1 & (0.4 <= slope) & (slope < 0.55), "Sa"),
+        (above & (pc1 >= gamma), _weathered("V", slope)),
+        (above & (pc1 <= eta) & (pc1 >= theta) & (pc1 < delta), "O"),
+        (above & (pc1 <= eta) & (pc1 >= alpha) & (pc1 < theta), _weathered("Q", slope)),
+        (above & (pc1 >= eta) & (pc1 >= gamma) & (pc1 < delta), "R"),
+        # S-complex
+        (above & (pc1 < beta) & (pc1 > zeta), _weathered("S", slope)),
+        (
+            above & (pc1 >= alpha) & (pc1 < beta) & (pc1 > eta) & (pc1 <= zeta),
+            _weathered("Sq", slope),
+        ),
+        (
+            above & (pc1 >= beta) & (pc1 < gamma) & (pc1 > eta) & (pc1 <= epsilon),
+            _weathered("Sr", slope),
+        ),
+        (
+            above & (pc1 >= beta) & (pc1 > epsilon) & (pc1 < gamma),
+            _weathered("Sv", slope),
+        ),
+        (above, "S"),
+        # Vis-IR step 3
+        (
+            (0.38 <= slope) & (slope < 1.5) & (-0.44 < pc1) & (pc1 < 0.4),
+            partial(_closest_template, classes=["A", "D"]),
+        ),
+        (
+            (0.25 < slope)
+            & (slope < 0.38)
+            & (-0.28 < pc2)
+            & (pc2 < -0.2)
+            & (-0.2 < pc3)
+            & (pc3 < -0.12),
+            "T",
+        ),
+        (
+            (0.07 < pc1) & (pc1 < 1.0) & (-0.5 < pc2) & (pc2 < -0.15),
+            partial(_feature_class, features={"e": "Xe"}, default="L"),
+        ),
+        (
+            (-0.075 < pc3)
+            & (pc3 < 0.14)
+            & (-0.2 <= pc2)
+            & (pc2 < 0.1)
+            & (-0.8 < pc1)
+            & (pc1 < 0.1),
+            partial(_feature_class, features={"e": "Xe"}, default="K"),
+        ),
+        # C- and X-complexes
+        ((-0.2 < slope) & (slope < 0) & (-1.2 < pc1) & (pc1 < 0) & (pc4 < 0), "B"),
+        (
+            (0.2 < slope) & (slope < 0.38),
+            partial(
+                _feature_class,
+                features={"k": "Xk", "e": "C"},
+                default=partial(_closest_template, classes=["C", "X"]),
+            ),
+        ),
+        (
+            (0.01 < pc4)
+            & (pc4 < 0.14)
+            & (-0.75 < pc1)
+            & (pc1 < -0.27)
+            & (refl[:, 0] < 0.92),
+            partial(_feature_class, features={"h": "Cgh"}, default="Xk"),
+        ),
+        # Ch is a smaller class -> return Ch if h is present,
+        # else retrun Xk, even if no k feature is present
+        (
+            (0.01 < pc4) & (pc4 < 0.14) & (-0.75 < pc1) & (pc1 < -0.27),
+            partial(_feature_class, features={"h": "Ch", "k": "Xk"}, default="X"),
+        ),
+        ((-0.04 < pc4) & (pc4 < 0.02) & (-0.07 < pc5) & (pc5 < -0.04), "Cb"),
+        (
+            (-0.85 < pc1) & (pc1 < -0.45) & (-0.06 < pc5) & (pc5 < 0.02),
+            partial(_feature_class, features={"h": "Ch", "k": "Xk"}, default="C"),
+        ),
+        (
+            (0.02 <= pc5) & (pc5 < 0.1) & (-0.6 < pc1) & (pc1 < -0.16),
+            partial(_feature_class, features={"h": "Cgh", "k": "Xk"}, default="Cg"),
+        ),
+        (
+            (-0.45 <= pc1) & (pc1 < 0.1) & (-0.06 < pc5) & (pc5 < 0.05),
+            partial(
+                _feature_class, features={"h": "Ch", "e": "Xe", "k": "Xk"}, default="Xc"
+            ),
+        ),
+        (
+            (-0.1 <= pc1) & (pc1 < 0.3) & (-0.5 < pc2) & (pc2 < -0.2),
+            partial(_feature_class, features={"e": "Xe"}, default="L"),
+        ),
+    ]
 
-    # Lines
-    alpha = lambda pc2: -3 * pc2 - 0.28  # = pc1
-    beta = lambda pc2: -3 * pc2 + 0.35  # = pc1
-    gamma = lambda pc2: -3 * pc2 + 1.0  # = pc1
-    delta = lambda pc2: -3 * pc2 + 1.5  # = pc1
-    epsilon = lambda pc2: 1 / 3 * pc2 + 0.55  # = pc1
-    zeta = lambda pc2: 1 / 3 * pc2 - 0.10  # = pc1
-    eta = lambda pc2: 1 / 3 * pc2 - 0.40  # = pc1
-    theta = lambda pc2: -3 * pc2 + 0.7  # = pc1
-
-    if pc1 < beta(pc2) and pc1 > zeta(pc2):
-        if slope >= 0.25:
-            return "Sw"
-        else:
-            return "S"
-    if pc1 >= alpha(pc2) and pc1 < beta(pc2) and pc1 > eta(pc2) and pc1 <= zeta(pc2):
-        if slope >= 0.25:
-            return "Sqw"
-        else:
-            return "Sq"
-    if pc1 >= beta(pc2) and pc1 < gamma(pc2) and pc1 > eta(pc2) and pc1 <= epsilon(pc2):
-        if slope >= 0.25:
-            return "Srw"
-        else:
-            return "Sr"
-    if pc1 >= beta(pc2) and pc1 > epsilon(pc2) and pc1 < gamma(pc2):
-        if slope >= 0.25:
-            return "Svw"
+    classes = np.full(len(spectra), "CX", dtype=object)
+    unassigned = np.ones(len(spectra), dtype=bool)
+
+    for region, class_ in regions:
+        rows = np.flatnonzero(unassigned & region)
+        unassigned[rows] = False
+
+        if callable(class_):
+            classes[rows] = [class_(spectra[i]) for i in rows]
+        elif isinstance(class_, np.ndarray):
+            classes[rows] = class_[rows]
         else:
-            return "Sv"
-    return "S"
+            classes[rows] = class_
 
+    for i in np.flatnonzero(unassigned):
+        logger.warning(
+            f"[{spectra[i].name}]: DeMeo class is indeterminate C/X-complex member "
+            "after VisIR resolution"
+        )
 
-def demeo_c_and_x_complexes(spec):
-    # Align with DeMeo's notation but dropping the '
-    pc1, pc2, pc3, pc4, pc5 = spec.scores_demeo[:5]
-    slope = spec.slope[0]
+    return classes
 
-    # Lines
-    alpha = lambda pc2: -3 * pc2 - 0.28  # = pc1
-    beta = lambda pc2: -3 * pc2 + 0.35  # = pc1
-    gamma = lambda pc2: -3 * pc2 + 1.0  # = pc1
-    delta = lambda pc2: -3 * pc2 + 1.5  # = pc1
-    epsilon = lambda pc2: 1 / 3 * pc2 + 0.55  # = pc1
-    zeta = lambda pc2: 1 / 3 * pc2 - 0.10  # = pc1
-    eta = lambda pc2: 1 / 3 * pc2 - 0.40  # = pc1
-    theta = lambda pc2: -3 * pc2 + 0.7  # = pc1
-
-    if -0.2 < slope < 0 and -1.2 < pc1 < 0 and pc4 < 0:
-        return "B"
-    if 0.2 < slope < 0.38:
-        if spec.k.is_present:
-            return "Xk"
-        elif spec.e.is_present:
-            return "C"
-        else:
-            corr_C, corr_X = _compute_template_correlation(spec, ["C", "X"])
 
-            if corr_C > corr_X:
-                return "C"
-            return "X"
+def _weathered(class_, slope):
+    """Add the 'w' suffix to the class of spectra with slopes of weathered surfaces."""
+    return np.where(slope >= 0.25, f"{class_}w", class_).astype(object)
 
-    if 0.01 < pc4 < 0.14 and -0.75 < pc1 < -0.27 and spec.refl[0] < 0.92:
-        if spec.h.is_present:
-            return "Cgh"
-        return "Xk"
 
-    if 0.01 < pc4 < 0.14 and -0.75 < pc1 < -0.27:
-        # Ch is a smaller class -> return Ch if h is present,
-        # else retrun Xk, even if no k feature is present
-        if spec.h.is_present:
-            return "Ch"
-        elif spec.k.is_present:
-            return "Xk"
-        return "X"
-    if -0.04 < pc4 < 0.02 and -0.07 < pc5 < -0.04:
-        return "Cb"
-    if -0.85 < pc1 < -0.45 and -0.06 < pc5 < 0.02:
-        if spec.h.is_present:
-            return "Ch"
-        elif spec.k.is_present:
-            return "Xk"
-        return "C"
-    if 0.02 <= pc5 < 0.1 and -0.6 < pc1 < -0.16:
-        if spec.h.is_present:
-            return "Cgh"
-        elif spec.k.is_present:
-            return "Xk"
-        return "Cg"
-    if -0.45 <= pc1 < 0.1 and -0.06 < pc5 < 0.05:
-        if spec.h.is_present:
-            return "Ch"
-        elif spec.e.is_present:
-            return "Xe"
-        elif spec.k.is_present:
-            return "Xk"
-        return "Xc"
-    if -0.1 <= pc1 < 0.3 and -0.5 < pc2 < -0.2:
-        if spec.e.is_present:
-            return "Xe"
-        return "L"
-    logger.warning(
-        "DeMeo class is indeterminate C/X-complex member after VisIR resolution"
-    )
-    return "CX"
+def _feature_class(spec, features, default):
+    """Resolve the class of a spectrum based on the presence of its features.
+
+    Parameters
+    ----------
+    spec : classy.Spectrum
+        The spectrum to classify.
+    features : dict
+        The features to check in order of precedence, mapped to the class if
+        the feature is present.
+    default : str or callable
+        The class if none of the features is present, or the function
+        resolving it from the spectrum.
+
+    Returns
+    -------
+    str
+        The class of the spectrum.
+    """
+    for feature, class_ in features.items():
+        if getattr(spec, feature).is_present:
+            return class_
+
+    if callable(default):
+        return default(spec)
+    return default
+
+
+def _closest_template(spec, classes):
+    """Choose the first of two classes if its template correlates better with the spectrum."""
+    corr_first, corr_second = _compute_template_correlation(spec, classes)
+
+    if corr_first > corr_second:
+        return classes[0]
+    return classes[1]
 
 
 def add_classification_results(spec, results=None):
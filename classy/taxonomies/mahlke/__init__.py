@@ -8,13 +8,18 @@ from classy import config
 from classy import core
 from classy import features
 from classy import index
+from classy import preprocessing
 from . import defs
 from classy.taxonomies.mahlke import decision_tree
+from classy.taxonomies.mahlke import mixnorm
 from classy.utils.logging import logger
 from classy import utils
 
 CLASSES = defs.CLASSES
 
+# Attributes of the preprocessed spectra to cache, see index.preprocessed
+PREPROCESSED = {"_alpha": float}
+
 EIGENVECTORS = np.array(
     [
         [-2.94253796e-01, -1.72717974e-01, 4.60812896e-02, 1.45581633e-01],
@@ -102,52 +107,121 @@ def is_classifiable(spec):
 
 
 def preprocess(spec):
+    preprocess_batch([spec])
+
+
+def preprocess_batch(spectra):
+    """Preprocess several spectra for classification following Mahlke+ 2022.
+
+    Parameters
+    ----------
+    spectra : list of classy.Spectrum
+        The spectra to preprocess.
+
+    Notes
+    -----
+    All spectra are resampled to the classification grid at once. Spectra in the
+    cache of preprocessed spectra are restored instead, see config.CACHE_PREPROCESSED.
+    """
     # spec._wave_pre_norm = spec.wave.copy()  # Doesn't seem like these two are requried anymore
     # spec._refl_pre_norm = spec.refl.copy()
-    spec.resample(WAVE, fill_value=np.nan, bounds_error=False)
-    spec.normalize(method="mixnorm")
+    missing = index.preprocessed.load("mahlke", spectra, attributes=PREPROCESSED)
+
+    if missing:
+        refl = preprocessing.resample_batch(
+            *preprocessing.pack(
+                [spec.wave for spec in missing], [spec.refl for spec in missing]
+            ),
+            WAVE,
+        )
 
-    if hasattr(spec, "pV"):
-        spec.pV = np.log10(spec.pV)
-    elif hasattr(spec, "target") and isinstance(spec.target, rocks.Rock):
-        spec.pV = np.log10(spec.target.albedo.value)
-    else:
-        spec.pV = np.nan
+        for spec, refl_ in zip(missing, refl):
+            spec.refl = refl_
+            spec.wave = np.array(WAVE)
+            spec.refl_err = None
+
+        # Normalize all spectra with a single nearest-neighbour search
+        alphas = mixnorm.normalize_spectra(missing)
+
+        for spec, alpha in zip(missing, alphas):
+            spec.refl = np.log(spec.refl) - alpha
+            spec._alpha = alpha
+
+    index.preprocessed.store("mahlke", missing, attributes=PREPROCESSED)
+
+    for spec in spectra:
+        if hasattr(spec, "pV"):
+            spec.pV = np.log10(spec.pV)
+        elif not getattr(spec, "_skip_target", False) and isinstance(
+            getattr(spec, "target", None), rocks.Rock
+        ):
+            # Spectra without target are not loaded to look it up
+            spec.pV = np.log10(spec.target.albedo.value)
+        else:
+            spec.pV = np.nan
 
 
 def classify(spec):
+    classify_batch([spec])
+
+
+def classify_batch(spectra):
+    """Classify several preprocessed spectra at once following Mahlke+ 2022.
+
+    Parameters
+    ----------
+    spectra : list of classy.Spectrum
+        The preprocessed spectra to classify.
+
+    Notes
+    -----
+    The reflectances and log-albedos of all spectra are stacked into a single
+    input matrix, which is passed once through the MCFA model, the decision
+    tree, and the feature flagging.
+    """
     # Instantiate MCFA model instance if not done yet
     model = index.data.load("mcfa")
 
     # Get only the classification columns
-    data_input = np.concatenate([spec.refl, [spec.pV]])[:, np.newaxis].T
-
-    input_data = pd.DataFrame(
-        {col: val for col, val in zip(defs.COLUMNS["all"], data_input[0])},
-        index=[0],
+    data_input = np.array(
+        [np.concatenate([spec.refl, [spec.pV]]) for spec in spectra], dtype=float
     )
 
+    input_data = pd.DataFrame(data_input, columns=defs.COLUMNS["all"])
+
     # Compute responsibility matrix based on observed values only
-    spec.responsibility = model.predict_proba(data_input)
+    responsibility = model.predict_proba(data_input)
 
     # Compute latent scores
-    spec.data_imputed = model.impute(data_input)
-    spec.data_latent = model.transform(spec.data_imputed)
+    data_imputed = model.impute(data_input)
+    data_latent = model.transform(data_imputed)
 
     # Add latent scores and responsibility to input data
     for factor in range(model.n_factors):
-        input_data[f"z{factor}"] = spec.data_latent[:, factor]
+        input_data[f"z{factor}"] = data_latent[:, factor]
 
-    input_data["cluster"] = np.argmax(spec.responsibility, axis=1)
+    input_data["cluster"] = np.argmax(responsibility, axis=1)
 
     for i in range(model.n_components):
-        input_data[f"cluster_{i}"] = spec.responsibility[:, i]
+        input_data[f"cluster_{i}"] = responsibility[:, i]
 
     # Add asteroid classes based on decision tree
-    spec.data_classified = decision_tree.assign_classes(input_data)
+    data_classified = decision_tree.assign_classes(input_data)
 
     # Detect features
-    spec.data_classified = add_feature_flags(spec, spec.data_classified)
+    data_classified = add_feature_flags(spectra, data_classified)
+
+    for i, spec in enumerate(spectra):
+        spec.responsibility = responsibility[i : i + 1]
+        spec.data_imputed = data_imputed[i : i + 1]
+        spec.data_latent = data_latent[i : i + 1]
+        spec.data_classified = data_classified.iloc[[i]].reset_index(drop=True)
+
+        _add_class_probabilities(spec)
+
+
+def _add_class_probabilities(spec):
+    """Set the class probabilities and the most likely class of a classified spectrum."""
     setattr(spec, "class_", spec.data_classified["class_"].values[0])
 
     for class_ in defs.CLASSES:
@@ -234,23 +308,46 @@ def load_templates():
     return templates
 
 
-def add_feature_flags(spec, data_classified):
-    """Detect features in spectra and amend the classification."""
-
-    for i, sample in data_classified.reset_index(drop=True).iterrows():
-        for feature, props in features.FEATURE.items():
-            if sample.class_ in props["candidates"]:
-                if (
-                    getattr(spec, feature).is_covered
-                    and getattr(spec, feature).is_present
-                ):
-                    if feature == "h":
-                        data_classified.loc[i, "class_"] = "Ch"
-                        break
-                    else:
-                        data_classified.loc[i, "class_"] = (
-                            data_classified.loc[i, "class_"] + feature
-                        )
+def add_feature_flags(spectra, data_classified):
+    """Detect features in spectra and amend the classification.
+
+    Parameters
+    ----------
+    spectra : list of classy.Spectrum
+        The classified spectra, in the same order as the rows of data_classified.
+    data_classified : pd.DataFrame
+        The classification results of the spectra.
+
+    Returns
+    -------
+    pd.DataFrame
+        The classification results with the feature flags added to the classes.
+    """
+    data_classified = data_classified.reset_index(drop=True)
+    classes = data_classified["class_"].values.astype(str)
+
+    flags = {}
+
+    for feature, props in features.FEATURE.items():
+        # Only candidate spectra need their features to be checked
+        is_candidate = np.isin(classes, props["candidates"])
+
+        flags[feature] = np.array(
+            [
+                is_candidate[i]
+                and getattr(spec, feature).is_covered
+                and getattr(spec, feature).is_present
+                for i, spec in enumerate(spectra)
+            ],
+            dtype=bool,
+        )
+
+    # e and k are appended to the class, h turns the class into Ch
+    classes = np.char.add(classes, np.where(flags["e"], "e", ""))
+    classes = np.char.add(classes, np.where(flags["k"], "k", ""))
+    classes = np.where(flags["h"], "Ch", classes)
+
+    data_classified["class_"] = classes.astype(object)
     return data_classified
 
 
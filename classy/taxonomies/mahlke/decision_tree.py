@@ -4,7 +4,6 @@ import pandas as pd
 from sklearn.mixture import GaussianMixture
 
 from . import defs
-from classy import index
 from classy.taxonomies.mahlke import gmm
 
 
@@ -39,282 +38,235 @@ def assign_classes(data):
     for cluster, class_ in defs.CORE_CLUSTER.items():
         data[f"class_{class_}"] += data[f"cluster_{cluster}"]
 
+    # The albedo-based E/M/P probabilities are shared by all X-complex clusters
+    HAS_PV = ~pd.isna(data["pV"]).values
+    PROBS_EMP = _predict_proba(GMMS["emp"], data.loc[HAS_PV, ["pV"]])
+
     # 2. Continuum cluster follow decision tree
     for cluster in defs.X_COMPLEX:
-        if cluster == 37 and (
-            pd.isna(data["pV"].values[0]) or data["pV"].values[0] > -1
-        ):
-            # Split L from M in cluster 37
+        if cluster == 37:
+            # Split L from M in cluster 37 if there is no albedo or pV > 0.1
+            SPLIT = (pd.isna(data["pV"]) | (data["pV"] > -1)).values
             MASK_37 = GMMS[37].predict(data[["z1", "z3"]])
 
             # Let's just say explicit is better than implicit
-            LMASK = (
-                [True if m == 0 else False for m in MASK_37]
-                if CLASSES[37][0] == "L"
-                else [False if m == 0 else True for m in MASK_37]
+            LMASK = SPLIT & (
+                (MASK_37 == 0) if CLASSES[37][0] == "L" else (MASK_37 != 0)
             )
-            MMASK = (
-                [True if m == 0 else False for m in MASK_37]
-                if CLASSES[37][0] == "M"
-                else [False if m == 0 else True for m in MASK_37]
+            MMASK = SPLIT & (
+                (MASK_37 == 0) if CLASSES[37][0] == "M" else (MASK_37 != 0)
             )
 
-            # Classify M-types
-            data.loc[MMASK] = data.loc[MMASK].apply(
-                lambda sample: resolve_emp_classes(
-                    sample, cluster, GMMS["emp"], CLASSES["emp"]
-                ),
-                axis=1,
+            # Classify M-types and the remaining low-albedo spectra
+            resolve_emp_classes(
+                data, cluster, PROBS_EMP, HAS_PV, CLASSES["emp"], MMASK | ~SPLIT
             )
+
             # Rest goes to L-Types
             data.loc[LMASK, "class_L"] += data.loc[LMASK, "cluster_37"].astype(float)
             continue
 
-        data = data.apply(
-            lambda sample: resolve_emp_classes(
-                sample, cluster, GMMS["emp"], CLASSES["emp"]
-            ),
-            axis=1,
-        )
+        resolve_emp_classes(data, cluster, PROBS_EMP, HAS_PV, CLASSES["emp"])
 
     for cluster in defs.CONTINUUM_CLUSTER:
         if cluster == 29:  # taken care of below
             continue
         elif cluster == 30:
-            data = data.apply(resolve_cluster_30, axis=1)
+            resolve_cluster_30(data)
         else:
-            data = data.apply(
-                lambda sample: RESOLVE_CLUSTER_FUNCTIONS[cluster](
-                    sample, GMMS[cluster], CLASSES[cluster]
-                ),
-                axis=1,
-            )
+            RESOLVE_CLUSTER_FUNCTIONS[cluster](data, GMMS[cluster], CLASSES[cluster])
 
     # Get E types from K and L clusters
-    data = data.apply(
-        lambda sample: resolve_E(sample, GMMS["emp"], CLASSES["emp"]), axis=1
-    )
+    resolve_E(data, GMMS["emp"], CLASSES["emp"])
 
-    data["class_"] = data.apply(
-        lambda sample: defs.CLASSES[
-            np.argmax([sample[f"class_{class_}"] for class_ in defs.CLASSES])
-        ],
-        axis=1,
-    )
+    # Cluster 29 is resolved after the E types
+    resolve_cluster_29(data, GMMS[29], CLASSES[29])
 
-    # Build class GMM for cluster 29 resolution
-    GMM_29, CLASSES_29 = index.data.load("gmm", 29)
-
-    data = data.apply(
-        lambda sample: resolve_cluster_29(sample, GMM_29, CLASSES_29), axis=1
-    )
-
-    # Redo this after 29 was assigned, should not change much
-    data["class_"] = data.apply(
-        lambda sample: defs.CLASSES[
-            np.argmax([sample[f"class_{class_}"] for class_ in defs.CLASSES])
-        ],
-        axis=1,
-    )
+    # Most likely class
+    columns = [f"class_{class_}" for class_ in defs.CLASSES]
+    data["class_"] = np.array(defs.CLASSES)[np.argmax(data[columns].values, axis=1)]
 
     data["DIFFUSE"] = data["cluster"].isin(defs.DIFFUSE_CLUSTER)
 
     return data
 
 
-def resolve_E(sample, GMM_EMP, CLASSES_EMP):
-    """Resolve spectral similarity between K, L, M and E using albedo"""
-
-    if pd.isna(sample.pV):
-        return sample
+def _predict_proba(gmm, X):
+    """Compute the component probabilities of all rows of X at once.
 
-    # If albedo wise it's an E-type, sort the K and L probability to E
-    label = GMM_EMP.predict(np.array([sample.pV]).reshape(-1, 1))
-
-    if CLASSES_EMP[label[0]] == "E":
-        for class_ in ["K", "L", "M"]:
-            sample["class_E"] += 2 * sample[f"class_{class_}"] / 3
-            sample[f"class_{class_}"] /= 3
+    Parameters
+    ----------
+    gmm : sklearn.mixture.GaussianMixture
+        The trained mixture model.
+    X : pd.DataFrame
+        The input features, one row per observation.
 
-    return sample
+    Returns
+    -------
+    np.ndarray
+        The component probabilities, shape (len(X), gmm.n_components).
+    """
+    if not len(X):
+        return np.empty((0, gmm.n_components))
+    return gmm.predict_proba(np.asarray(X, dtype=float))
 
 
-def resolve_emp_classes(sample, cluster, GMM_EMP, CLASSES):
-    if pd.isna(sample.pV):
-        sample["class_X"] += sample[f"cluster_{cluster}"]
-        return sample
+def _add_class_probabilities(data, cluster, probs, CLASSES, mask=slice(None)):
+    """Add component probabilities scaled by the cluster probability to the class columns.
 
-    # Class probabilities for E, M, P
-    probs = GMM_EMP.predict_proba(np.array(sample.pV).reshape(1, -1))
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The observations. Modified in-place.
+    cluster : int
+        The cluster whose probability is distributed among the classes.
+    probs : np.ndarray
+        The class probabilities of the masked rows, in order of CLASSES.
+    CLASSES : list of str
+        The classes represented in order by the columns of probs.
+    mask : np.ndarray or slice
+        The rows which the probabilities refer to. Default is all rows.
+    """
+    weight = data[f"cluster_{cluster}"].values[mask].astype(float)
 
     for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample[f"cluster_{cluster}"]
+        column = data.columns.get_loc(f"class_{class_}")
+        data.iloc[mask, column] += probs[:, j] * weight
 
-    return sample
 
+def resolve_E(data, GMM_EMP, CLASSES_EMP):
+    """Resolve spectral similarity between K, L, M and E using albedo"""
 
-def resolve_cluster_4(sample, GMM_23_40, CLASSES):
-    """
-    Notes
-    -----
-    The objects are resolved based on their distance to clusters 23 and 40 in z2-z3 (0-indexed).
-    """
-
-    # Class probabilities for E, M, P
-    probs = GMM_23_40.predict_proba(np.array(sample[["z2", "z3"]]).reshape(1, -1))
+    HAS_PV = ~pd.isna(data["pV"]).values
+    labels = np.full(len(data), -1)
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_4"]
+    if HAS_PV.any():
+        labels[HAS_PV] = GMM_EMP.predict(data.loc[HAS_PV, ["pV"]].values)
 
-    return sample
+    # If albedo wise it's an E-type, sort the K and L probability to E
+    IS_E = HAS_PV & (np.array(CLASSES_EMP)[labels] == "E")
 
+    for class_ in ["K", "L", "M"]:
+        data.loc[IS_E, "class_E"] += 2 * data.loc[IS_E, f"class_{class_}"] / 3
+        data.loc[IS_E, f"class_{class_}"] /= 3
 
-def resolve_cluster_8(sample, GMM_0_34, CLASSES):
-    # Class probabilities for E, M, P
-    probs = GMM_0_34.predict_proba(np.array(sample[["z1", "z3"]]).reshape(1, -1))
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_8"]
+def resolve_emp_classes(data, cluster, PROBS_EMP, HAS_PV, CLASSES, mask=None):
+    """Resolve X-complex cluster into E, M, P based on albedo, or X without albedo.
 
-    return sample
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The observations. Modified in-place.
+    cluster : int
+        The X-complex cluster to resolve.
+    PROBS_EMP : np.ndarray
+        The E/M/P component probabilities of all rows with albedo.
+    HAS_PV : np.ndarray
+        Boolean mask of the rows with albedo.
+    CLASSES : list of str
+        The classes represented in order by the EMP mixture model components.
+    mask : np.ndarray
+        Boolean mask of the rows to resolve. Default is all rows.
+    """
+    if mask is None:
+        mask = np.ones(len(data), dtype=bool)
 
+    # Without albedo -> X
+    NO_PV = mask & ~HAS_PV
+    data.loc[NO_PV, "class_X"] += data.loc[NO_PV, f"cluster_{cluster}"]
 
-def resolve_cluster_10(sample, GMM, CLASSES):
     # Class probabilities for E, M, P
-    probs = GMM.predict_proba(np.array(sample[["z0", "z1"]]).reshape(1, -1))
-
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_10"]
+    probs = PROBS_EMP[mask[HAS_PV]]
+    _add_class_probabilities(data, cluster, probs, CLASSES, mask & HAS_PV)
 
-    return sample
 
+def resolve_cluster_4(data, GMM_23_40, CLASSES):
+    """
+    Notes
+    -----
+    The objects are resolved based on their distance to clusters 23 and 40 in z2-z3 (0-indexed).
+    """
+    probs = _predict_proba(GMM_23_40, data[["z2", "z3"]])
+    _add_class_probabilities(data, 4, probs, CLASSES)
 
-def resolve_cluster_13(sample, GMM_13, CLASSES):
-    # Class probabilities for E, M, P
-    probs = GMM_13.predict_proba(np.array(sample[["z1", "z3"]]).reshape(1, -1))
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_13"]
+def resolve_cluster_8(data, GMM_0_34, CLASSES):
+    probs = _predict_proba(GMM_0_34, data[["z1", "z3"]])
+    _add_class_probabilities(data, 8, probs, CLASSES)
 
-    return sample
 
+def resolve_cluster_10(data, GMM, CLASSES):
+    probs = _predict_proba(GMM, data[["z0", "z1"]])
+    _add_class_probabilities(data, 10, probs, CLASSES)
 
-def resolve_cluster_19(sample, GMM_19, CLASSES):
-    # No albedo -> assign to default class, C
-    # if pd.isna(sample.pV):
-    #     sample[f"class_C"] += sample[f"cluster_19"]
-    #     return sample
 
-    # Class probabilities for E, M, P
-    probs = GMM_19.predict_proba(np.array([sample[["z0", "z3"]]]))
+def resolve_cluster_13(data, GMM_13, CLASSES):
+    probs = _predict_proba(GMM_13, data[["z1", "z3"]])
+    _add_class_probabilities(data, 13, probs, CLASSES)
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_19"]
 
-    return sample
+def resolve_cluster_19(data, GMM_19, CLASSES):
+    probs = _predict_proba(GMM_19, data[["z0", "z3"]])
+    _add_class_probabilities(data, 19, probs, CLASSES)
 
 
-def resolve_cluster_23(sample, GMM_23, CLASSES):
+def resolve_cluster_23(data, GMM_23, CLASSES):
     # hard cut based on z3, following Mahlke+ 2025
-    if sample.z3 < -0.25:
-        sample.class_L += sample.cluster_23
-        return sample
-    else:
-        sample.class_M += sample.cluster_23
-        return sample
+    IS_L = (data["z3"] < -0.25).values
+
+    data.loc[IS_L, "class_L"] += data.loc[IS_L, "cluster_23"]
+    data.loc[~IS_L, "class_M"] += data.loc[~IS_L, "cluster_23"]
 
     # ------
-    # The code below was applied in the original version
+    # The original version resolved this cluster with the GMM in z0-z3.
     # In Mahlke+ 2025, it is concluded that this cluster is mostly L types
     # and the cluster split in L versus M was changed. The code below is
     # kept here for reference.
 
-    # Class probabilities for L, M
-    # probs = GMM_23.predict_proba(np.array(sample[["z0", "z3"]]).reshape(1, -1))
-    # for j, class_ in enumerate(CLASSES):
-    #     # Add class probabilites scaled by cluster probability
-    #     sample[f"class_{class_}"] += probs[0][j] * sample["cluster_23"]
-
-    return sample
-
-
-def resolve_cluster_24(sample, GMM_24, CLASSES):
-    # Class probabilities for L, M
-    probs = GMM_24.predict_proba(np.array(sample[["z2", "z3"]]).reshape(1, -1))
-
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_24"]
-
-    return sample
+    # probs = _predict_proba(GMM_23, data[["z0", "z3"]])
+    # _add_class_probabilities(data, 23, probs, CLASSES)
 
 
-def resolve_cluster_31(sample, GMM_31, CLASSES):
-    # Class probabilities for L, M
-    probs = GMM_31.predict_proba(np.array(sample[["z2", "z3"]]).reshape(1, -1))
-
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_31"]
+def resolve_cluster_24(data, GMM_24, CLASSES):
+    probs = _predict_proba(GMM_24, data[["z2", "z3"]])
+    _add_class_probabilities(data, 24, probs, CLASSES)
 
-    return sample
-
-
-def resolve_cluster_41(sample, GMM_41, CLASSES):
-    # Class probabilities for L, M
-    probs = GMM_41.predict_proba(np.array(sample[["z0", "z1"]]).reshape(1, -1))
-
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_41"]
 
-    return sample
+def resolve_cluster_31(data, GMM_31, CLASSES):
+    probs = _predict_proba(GMM_31, data[["z2", "z3"]])
+    _add_class_probabilities(data, 31, probs, CLASSES)
 
 
-def resolve_cluster_43(sample, GMM_43, CLASSES):
-    # Class probabilities for L, M
-    probs = GMM_43.predict_proba(np.array(sample[["z1", "z3"]]).reshape(1, -1))
+def resolve_cluster_41(data, GMM_41, CLASSES):
+    probs = _predict_proba(GMM_41, data[["z0", "z1"]])
+    _add_class_probabilities(data, 41, probs, CLASSES)
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_43"]
 
-    return sample
+def resolve_cluster_43(data, GMM_43, CLASSES):
+    probs = _predict_proba(GMM_43, data[["z1", "z3"]])
+    _add_class_probabilities(data, 43, probs, CLASSES)
 
 
-def resolve_cluster_44(sample, GMM_44, CLASSES):
-    if pd.isna(sample.pV):
-        # Default if no albedo present is S
-        probs = [[1, 0]] if CLASSES[0] == "S" else [[0, 1]]
-    else:
-        # Class probabilities for S, E
-        probs = GMM_44.predict_proba(np.array(sample["pV"]).reshape(1, -1))
+def resolve_cluster_44(data, GMM_44, CLASSES):
+    HAS_PV = ~pd.isna(data["pV"]).values
 
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_44"]
+    # Default if no albedo present is S
+    probs = np.zeros((len(data), 2))
+    probs[~HAS_PV, 0 if CLASSES[0] == "S" else 1] = 1
 
-    return sample
+    # Class probabilities for S, E
+    probs[HAS_PV] = _predict_proba(GMM_44, data.loc[HAS_PV, ["pV"]])
+    _add_class_probabilities(data, 44, probs, CLASSES)
 
 
 LM23 = {}
 
 
-def resolve_cluster_29(sample, GMM, CLASSES):
+def resolve_cluster_29(data, GMM, CLASSES):
     """ """
-
-    probs = GMM.predict_proba(np.array(sample[["z0", "z1"]]).reshape(1, -1))
-
-    for j, class_ in enumerate(CLASSES):
-        # Add class probabilites scaled by cluster probability
-        sample[f"class_{class_}"] += probs[0][j] * sample["cluster_29"]
-    return sample
+    probs = _predict_proba(GMM, data[["z0", "z1"]])
+    _add_class_probabilities(data, 29, probs, CLASSES)
 
 
 def resolve_cluster_37():
@@ -360,20 +312,18 @@ def resolve_complex_emp():
     return gmm, CLASSES
 
 
-def resolve_cluster_30(sample):
+def resolve_cluster_30(data):
     """Heurisitc decision tree branch added after publication. This cluster contains D-types."""
 
-    if not pd.isna(sample.pV):
-        if sample.pV > np.log10(0.14):
-            sample.class_S += sample.cluster_30
-        else:
-            sample.class_D += sample.cluster_30
-    else:
-        if sample.z1 > 0:
-            sample.class_S += sample.cluster_30
-        else:
-            sample.class_D += sample.cluster_30
-    return sample
+    # With albedo, split on pV. Without albedo, split on z1
+    IS_S = np.where(
+        pd.isna(data["pV"]).values,
+        (data["z1"] > 0).values,
+        (data["pV"] > np.log10(0.14)).values,
+    )
+
+    data.loc[IS_S, "class_S"] += data.loc[IS_S, "cluster_30"]
+    data.loc[~IS_S, "class_D"] += data.loc[~IS_S, "cluster_30"]
 
 
 RESOLVE_CLUSTER_FUNCTIONS = {
@@ -0,0 +1,390 @@
+"""Inference with the trained MCFA model of the Mahlke+ 2022 taxonomy using NumPy.
+
+The computations follow the mcfa package used to train the model, without
+requiring tensorflow.
+"""
+
+from collections import OrderedDict
+import pickle
+
+import numpy as np
+from scipy import special
+
+from classy import config
+
+# The trained model parameters
+PARAMETERS = ["Xi", "pi", "W", "Omega", "Psi", "mu"]
+
+
+class MCFA:
+    def __init__(self, Xi, pi, W, Omega, Psi, mu):
+        """Mixture of common factor analyzers with fixed, trained parameters.
+
+        Parameters
+        ----------
+        Xi : np.ndarray
+            The component means in latent space, of shape g x q.
+        pi : np.ndarray
+            The unnormalized component weights, of shape g.
+        W : np.ndarray
+            The factor loadings, of shape p x q.
+        Omega : np.ndarray
+            The Cholesky factors of the component covariances in latent space
+            with unconstrained diagonals, of shape g x q x q.
+        Psi : np.ndarray
+            The unconstrained noise variances, of shape p.
+        mu : np.ndarray
+            The data mean, of shape p.
+
+        Notes
+        -----
+        The parameters are stored unconstrained like in the mcfa package: the
+        weights are the softmax of pi, the noise variances and the diagonals of
+        the Cholesky factors are the softplus of Psi and of the diagonals of Omega.
+        """
+        self.Xi = np.asarray(Xi, dtype=float)
+        self.pi = np.asarray(pi, dtype=float)
+        self.W = np.asarray(W, dtype=float)
+        self.Omega = np.asarray(Omega, dtype=float)
+        self.Psi = np.asarray(Psi, dtype=float)
+        self.mu = np.asarray(mu, dtype=float)
+
+        self.n_components, self.n_factors = self.Xi.shape
+        self.p = len(self.mu)
+
+        # Undo the parametrization
+        self.weights = special.softmax(self.pi)
+        self.noise = np.logaddexp(0, self.Psi)
+
+        Omega = self.Omega.copy()
+        diagonal = np.arange(self.n_factors)
+        Omega[:, diagonal, diagonal] = np.logaddexp(0, Omega[:, diagonal, diagonal])
+
+        # Cluster moments in data and latent space
+        self.mean_data = self.mu + self.Xi @ self.W.T
+        self.cov_latent = Omega @ Omega.transpose(0, 2, 1)
+
+        # The likelihoods use the covariances implied by the Cholesky factors
+        W_Omega = self.W @ Omega
+        self.cov_marginal = W_Omega @ W_Omega.transpose(0, 2, 1) + np.diag(self.noise)
+
+        # The imputation uses the data covariances of the mcfa package, which
+        # project the latent covariances instead of their Cholesky factors
+        W_Omega = self.W @ self.cov_latent
+        self.cov_data = W_Omega @ W_Omega.transpose(0, 2, 1) + np.diag(self.noise)
+
+        # pattern of observed features : Cholesky factors and log-determinants
+        self.factorizations = OrderedDict()
+
+    def __repr__(self):
+        return f"<MCFA g={self.n_components} q={self.n_factors} p={self.p}>"
+
+    def predict_proba(self, Y):
+        """Compute the probability of each sample to belong to each component.
+
+        Parameters
+        ----------
+        Y : np.ndarray
+            The samples, of shape N x p. Missing values are NaN.
+
+        Returns
+        -------
+        np.ndarray
+            The responsibility matrix, of shape N x g.
+
+        Notes
+        -----
+        The likelihoods are computed from the marginal distributions of the
+        observed values of each sample. Samples with the same observed features
+        share the factorizations of the marginal covariances and are scored together.
+        """
+        Y = np.atleast_2d(np.asarray(Y, dtype=float))
+
+        if Y.shape[1] != self.p:
+            raise ValueError(
+                f"The number of passed input features ({Y.shape[1]}) has to be equal "
+                f"to the number of learned input features ({self.p})."
+            )
+
+        log_prob = np.empty((len(Y), self.n_components))
+
+        for observed, rows in _group_patterns(np.isfinite(Y)):
+            log_prob[rows] = self._log_prob(Y[np.ix_(rows, observed)], observed)
+
+        return special.softmax(log_prob + np.log(self.weights), axis=1)
+
+    def predict(self, Y):
+        """Compute the most likely component of each sample.
+
+        Parameters
+        ----------
+        Y : np.ndarray
+            The samples, of shape N x p. Missing values are NaN.
+
+        Returns
+        -------
+        np.ndarray
+            The most likely component of each sample, of shape N.
+        """
+        return np.argmax(self.predict_proba(Y), axis=1)
+
+    def impute(self, Y):
+        """Impute the missing values given the most likely components.
+
+        Parameters
+        ----------
+        Y : np.ndarray
+            The samples, of shape N x p. Missing values are NaN.
+
+        Returns
+        -------
+        np.ndarray
+            The samples with the missing values replaced by their conditional
+            means given the observed values, following Wang 2013, Equ. 10.
+        """
+        Y = np.atleast_2d(np.asarray(Y, dtype=float))
+        Y_imp = Y.copy()
+
+        cluster = np.argmax(self.predict_proba(Y), axis=1)
+
+        for observed, rows in _group_patterns(np.isfinite(Y)):
+            if observed.all():
+                continue
+
+            missing = ~observed
+
+            for k in np.unique(cluster[rows]):
+                rows_k = rows[cluster[rows] == k]
+
+                mean = self.mean_data[k]
+                sigma = self.cov_data[k]
+
+                sigma_oo = sigma[np.ix_(observed, observed)]
+                sigma_mo = sigma[np.ix_(missing, observed)]
+
+                Y_imp[np.ix_(rows_k, missing)] = (
+                    mean[missing]
+                    + np.linalg.solve(
+                        sigma_oo, (Y[np.ix_(rows_k, observed)] - mean[observed]).T
+                    ).T
+                    @ sigma_mo.T
+                )
+
+        return Y_imp
+
+    def transform(self, Y, which="zmean"):
+        """Transform samples from data into latent space.
+
+        Parameters
+        ----------
+        Y : np.ndarray
+            The complete samples, of shape N x p.
+        which : str
+            Which type of factor scores to return, see Baek+ 2011, section 4.
+            Choose from ['z', 'zclust', 'zmean']. Default is 'zmean'.
+
+        Returns
+        -------
+        np.ndarray
+            If which is 'z': The factor scores in each component, of shape g x N x q.
+            If which is 'zclust': The factor scores in the most probable component.
+            If which is 'zmean': The factor scores averaged over the components.
+
+        Notes
+        -----
+        Like in the mcfa package, the responsibilities used to combine the
+        component scores are computed from the centred samples.
+        """
+        if which not in ["z", "zclust", "zmean"]:
+            raise ValueError(
+                f"Unknown score '{which}'. Choose from ['z', 'zclust', 'zmean']."
+            )
+
+        Y = np.atleast_2d(np.asarray(Y, dtype=float)) - self.mu
+
+        D_inv = np.diag(1 / self.noise)
+        I = np.eye(self.n_factors)
+
+        Z = np.empty((self.n_components, len(Y), self.n_factors))
+
+        for k in range(self.n_components):
+            Omega = self.cov_latent[k]
+
+            # Regularize ill-conditioned covariance matrices
+            if np.linalg.cond(Omega) > 1e4:
+                Omega = Omega + I * 1e-5
+
+            # Woodbury identity for the matrix inversion
+            C = np.linalg.solve(
+                np.linalg.solve(Omega, I) + self.W.T @ D_inv @ self.W, I
+            )
+            gamma = (D_inv - D_inv @ self.W @ C @ self.W.T @ D_inv) @ self.W @ Omega
+
+            Z[k] = self.Xi[k] + (Y - self.W @ self.Xi[k]) @ gamma
+
+        if which == "z":
+            return Z
+
+        tau = self.predict_proba(Y)
+
+        if which == "zclust":
+            return Z[np.argmax(tau, axis=1), np.arange(len(Y))]
+        return np.einsum("kiq,ik->iq", Z, tau)
+
+    def _log_prob(self, Y, observed):
+        """Compute the component log-likelihoods of samples with the same observed values.
+
+        Parameters
+        ----------
+        Y : np.ndarray
+            The observed values of the samples, of shape N x observed.sum().
+        observed : np.ndarray of bool
+            The observed features, of shape p.
+
+        Returns
+        -------
+        np.ndarray
+            The log-likelihoods under the marginal distribution of each
+            component, of shape N x g.
+        """
+        cholesky, log_det = self._factorize(observed)
+
+        # Whitened residuals of each sample in each component
+        residuals = Y[None, :, :] - self.mean_data[:, None, observed]
+        whitened = np.linalg.solve(cholesky, residuals.transpose(0, 2, 1))
+
+        return (
+            -0.5 * (whitened**2).sum(axis=1).T
+            - log_det
+            - 0.5 * observed.sum() * np.log(2 * np.pi)
+        )
+
+    def _factorize(self, observed):
+        """Factorize the marginal covariances of the observed features.
+
+        Parameters
+        ----------
+        observed : np.ndarray of bool
+            The observed features, of shape p.
+
+        Returns
+        -------
+        np.ndarray, np.ndarray
+            The Cholesky factors of the marginal covariances of each component,
+            of shape g x observed.sum() x observed.sum(), and half of their
+            log-determinants, of shape g.
+
+        Notes
+        -----
+        The factorizations of the last config.MCFA_CACHE_SIZE patterns are
+        kept in memory.
+        """
+        key = np.packbits(observed).tobytes()
+
+        if key in self.factorizations:
+            self.factorizations.move_to_end(key)
+        else:
+            cholesky = np.linalg.cholesky(
+                self.cov_marginal[:, observed][:, :, observed]
+            )
+            log_det = np.log(np.diagonal(cholesky, axis1=1, axis2=2)).sum(axis=1)
+
+            self.factorizations[key] = (cholesky, log_det)
+
+        factorization = self.factorizations[key]
+
+        while len(self.factorizations) > config.MCFA_CACHE_SIZE:
+            self.factorizations.popitem(last=False)
+
+        return factorization
+
+
+def _group_patterns(observed):
+    """Group samples by their observed features.
+
+    Parameters
+    ----------
+    observed : np.ndarray of bool
+        The observed features of the samples, of shape N x p.
+
+    Returns
+    -------
+    list of tuple
+        The observed features of each pattern, of shape p, and the rows of the
+        samples with this pattern.
+    """
+    patterns, inverse = np.unique(observed, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    return [
+        (pattern, np.flatnonzero(inverse == i)) for i, pattern in enumerate(patterns)
+    ]
+
+
+def load(path):
+    """Load the trained model parameters exported with ``export``.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the .npz file.
+
+    Returns
+    -------
+    MCFA
+        The model instance.
+    """
+    with np.load(path) as parameters:
+        return MCFA(**{param: parameters[param] for param in PARAMETERS})
+
+
+def export(path_pickle, path):
+    """Export the parameters of a model stored with the mcfa package.
+
+    Parameters
+    ----------
+    path_pickle : pathlib.Path
+        The path to the pickled parameters written by ``mcfa.MCFA.to_file``.
+    path : pathlib.Path
+        The path to the .npz file to write.
+
+    Notes
+    -----
+    The pickled parameters are tensorflow variables. They are read as arrays
+    without importing tensorflow.
+    """
+    with open(path_pickle, "rb") as file_:
+        parameters = _Unpickler(file_).load()
+
+    np.savez(path, **{param: np.asarray(parameters[param]) for param in PARAMETERS})
+
+
+class _Unpickler(pickle.Unpickler):
+    """Read pickled tensorflow variables as numpy arrays."""
+
+    def find_class(self, module, name):
+        if module == "tensorflow.python.ops.resource_variable_ops":
+            if name == "ResourceVariable":
+                return _to_array
+        elif module == "tensorflow.python.framework.dtypes":
+            if name == "as_dtype":
+                return lambda dtype: dtype
+        elif module == "tensorflow.python.framework.ops":
+            if name == "convert_to_tensor":
+                return _to_array
+
+        # numpy 2 moved the array reconstruction functions
+        if module == "numpy.core.multiarray" and int(np.__version__[0]) >= 2:
+            module = "numpy._core.multiarray"
+
+        if module.startswith("tensorflow"):
+            raise pickle.UnpicklingError(
+                f"Cannot read {module}.{name} without tensorflow."
+            )
+
+        return super().find_class(module, name)
+
+
+def _to_array(initial_value=None, *args, **kwargs):
+    """Replace a tensorflow variable or tensor by its value."""
+    return np.asarray(initial_value)
@@ -1,5 +1,6 @@
 import numpy as np
-from sklearn import preprocessing
+import scipy.special as scisp
+from sklearn import neighbors, preprocessing
 
 from classy import index
 from . import defs
@@ -8,6 +9,12 @@ from . import defs
 COLORS = []
 HATCHES = []
 
+# Minimum number of spectra sharing the observed bins to search them with a KD-tree
+TREE_MIN_QUERIES = 200
+
+# The neighbour search of the loaded reference spectra
+SEARCH = {}
+
 
 def normalize(spec):
     """Normalize a spectrum using the mixnorm algorithm.
@@ -22,149 +29,277 @@ def normalize(spec):
     alpha : float
         The normalization constat to subtract from the spectrum after log-transform.
     """
-    if all(np.isnan(r) for r in spec.refl):
-        return np.nan
+    return normalize_spectra([spec])[0]
+
+
+def normalize_spectra(spectra):
+    """Normalize several spectra using the mixnorm algorithm.
+
+    Parameters
+    ----------
+    spectra : list of classy.spectra.Spectrum
+        The spectra to normalize. They have to be resampled to the wavelength grid
+        of the taxonomy.
+
+    Returns
+    -------
+    np.ndarray
+        The normalization constants to subtract from the spectra after log-transform.
+
+    Notes
+    -----
+    The nearest neighbours of all spectra are searched in a single call, see
+    ``find_nearest_neighbours``.
+    """
+    alphas = np.full(len(spectra), np.nan)
+
+    spectra = [
+        (i, spec) for i, spec in enumerate(spectra) if not np.isnan(spec.refl).all()
+    ]
+
+    if not spectra:
+        return alphas
 
     # Load the trained normalization instance
     normalization, neighbours = index.data.load("mixnorm")
 
     # Compute model initalization parameters by nearest neighbour search among classy spectra
-    neighbours_spectra = neighbours[defs.WAVE_GRID_STR].values
-    idx_nearest_neighbours = _find_nearest_neighbours(spec, neighbours_spectra, N=5)
+    for spec in spectra:
+        spec[1].mask = np.isfinite(spec[1].refl)
+
+    idx_nearest_neighbours = find_nearest_neighbours(
+        np.array([spec.refl for _, spec in spectra]), N=5
+    )
 
     # Compute most probable alpha as weighted average of the nearest neighbours
-    alpha = neighbours.loc[idx_nearest_neighbours, "alpha"].mean()
+    alphas[[i for i, _ in spectra]] = (
+        neighbours["alpha"].values[idx_nearest_neighbours].mean(axis=1)
+    )
 
     # Shift spectral reflectance to the mean level of the reference spectra
-    # import matplotlib.pyplot as plt
-
-    # plt.plot(
-    #     spec.wave,
-    #     spec.refl,
-    #     ls="-",
-    #     c="black",
-    # )
-
-    # for m in idx_nearest_neighbours:
-    #     plt.plot(
-    #         classy.defs.WAVE_GRID[spec.mask],
-    #         neighbours_spectra[m].T,
-    #         ls="--",
-    #         c="red",
-    #     )
-    spec.refl = (
-        spec.refl
-        / np.nanmean(spec.refl)
-        * np.nanmean(neighbours.loc[idx_nearest_neighbours, defs.WAVE_GRID_STR])
+    levels = np.nanmean(
+        neighbours[defs.WAVE_GRID_STR].values[idx_nearest_neighbours], axis=(1, 2)
     )
-    # plt.plot(
-    #     spec.wave,
-    #     spec.refl,
-    #     ls="-",
-    #     c="blue",
-    # )
-    # plt.show()
-    return alpha
 
-    # Create gamma_init by finding spectrum closest to the new one
-    data_complete = ml_master[defs.COLUMNS["spectra"]].values
+    for (_, spec), level in zip(spectra, levels):
+        spec.refl = spec.refl / np.nanmean(spec.refl) * level
 
-    gamma_init = []
-    alpha_init = []
-    for ind, spec in data.iterrows():
-        mask = np.isnan(spec)
-        reference = data_complete[:, ~mask]
-        reference_normed = reference[~np.isnan(reference).any(axis=1), :]
-
-        # Find closest complete spectra
-        closest_spectra_idx, distances = find_closest(np.exp(spec), reference_normed)
-
-        if True:  # only the best match
-            gamma_init.append(normalization["gamma"][closest_spectra_idx[0]])
-        else:  # mean gamma_init of best matches
-            gamma_inits = [normalization["gamma"][i] for i in closest_spectra_idx]
-            mean_gamma_inits = np.mean(
-                [normalization["gamma"][i] for i in closest_spectra_idx],
-                axis=0,
-            )
-            gamma_init.append(mean_gamma_inits)
-
-        alpha_init.append(normalization["alpha"][closest_spectra_idx[0]][0])
-
-        # Normalize spectrum to level of the match
-        norm_idx = np.where(~np.isnan(spec))[0][0]
-        norm_value = reference_normed[closest_spectra_idx[0]][norm_idx]
-
-        # the spectra to normalize are already log-transformed
-        diff = norm_value / spec[norm_idx]
-
-        data.loc[ind, defs.COLUMNS["spectra"]] *= diff
-
-    # ------
-    # Compute alpha_init by next-neighbour search
-    # Alpha of closest spectrum in clustering sample
-    # ml_master = classy.ml.get_master(
-    #     limit_missing=MODEL_PARAMETERS["max_missing_bins"]
-    # )
-    # # ml_master.loc[:, classy.ML_SETUP.COLUMNS["spectra"]] = np.log(
-    # #     ml_master[classy.ML_SETUP.COLUMNS["spectra"]]
-    # # )
-
-    # # Create alpha_init by finidng spectrum closest to the new one
-    # data_complete = ml_master[classy.ML_SETUP.COLUMNS["spectra"]].values
-
-    # for ind, spec in data.iterrows():
-
-    # Find closest complete spectra
-    # closest_spectra_idx, distances = find_closest(
-    #     np.exp(spec), data_complete
-    # )
-    alpha_init = np.array(alpha_init)[:, None]
-
-    # ------
-    # Normalize
-    data[defs.COLUMNS["spectra"]] = np.log(data[defs.COLUMNS["spectra"]])
-    X = data[defs.COLUMNS["spectra"]].values
-    X = np.ma.masked_array(X, mask=np.isnan(X))
-    alpha, gamma, _ = gem_mixnorm_eval(
+    return alphas
+
+
+def normalize_batch(X, nit_em=100, eps=1e-6):
+    """Normalize several spectra using the mixnorm GEM algorithm.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        The log-reflectance of the spectra on the wavelength grid of the taxonomy,
+        one row per spectrum. Missing bins are NaN.
+    nit_em : int
+        Maximum number of iterations of the GEM algorithm. Default is 100.
+    eps : float
+        Relative change of the log-likelihood of a spectrum below which it is
+        converged. Default is 1e-6.
+
+    Returns
+    -------
+    np.ndarray
+        The normalization constants to subtract from the log-reflectance. NaN for
+        spectra without observed bins.
+
+    Notes
+    -----
+    The normalization constants and the cluster assignments are initialized with
+    the mean of the five nearest reference spectra, shifted to the level of each
+    spectrum. The GEM algorithm is then run with the trained mixture parameters
+    for all spectra at once, stopping for each spectrum once it converged.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    alphas = np.full(len(X), np.nan)
+
+    is_observed = np.isfinite(X).any(axis=1)
+
+    if not is_observed.any():
+        return alphas
+
+    normalization, neighbours = index.data.load("mixnorm")
+    X = X[is_observed]
+
+    # Initialize with the nearest reference spectra at the level of each spectrum
+    idx_nearest_neighbours = find_nearest_neighbours(np.exp(X), N=5)
+
+    reference = np.log(neighbours[defs.WAVE_GRID_STR].values[idx_nearest_neighbours])
+    offsets = np.nanmean(X[:, None, :] - reference, axis=2)
+
+    alpha_init = (neighbours["alpha"].values[idx_nearest_neighbours] + offsets).mean(
+        axis=1
+    )
+    gamma_init = normalization["gamma"][idx_nearest_neighbours].mean(axis=1)
+
+    alpha, _, _ = gem_mixnorm_eval(
         X,
-        K=MODEL_PARAMETERS["k_norm"],
+        K=defs.MODEL_PARAMETERS["k_norm"],
         mus=normalization["mus"],
         sigmas=normalization["sigmas"],
         pis=normalization["pis"],
+        alpha_init=alpha_init[:, None],
         gamma_init=gamma_init,
-        alpha_init=alpha_init,
+        nit_em=nit_em,
+        eps=eps,
     )
 
-    # TMP
-    # Plot normalized spectra
-    if False:
-        import matplotlib.pyplot as plt
+    alphas[is_observed] = alpha[:, 0]
+    return alphas
 
-        data_classy, _ = classy.ml.load_data()
 
-        plt.plot(
-            classy.ML_SETUP.COLUMNS["spectra"],
-            data_classy[classy.ML_SETUP.COLUMNS["spectra"]].values.T,
-            ls="-",
-            c="lightgray",
-            alpha=0.4,
-        )
-        plt.plot(
-            classy.ML_SETUP.COLUMNS["spectra"],
-            data_classy.loc[
-                data_classy.class_sf.isin(["K", "L", "M"]),
-                classy.ML_SETUP.COLUMNS["spectra"],
-            ].values.T,
-            ls="-",
-            c="orange",
-            alpha=0.4,
-        )
-        plt.plot(classy.ML_SETUP.COLUMNS["spectra"], (X - alpha).T, ls="-", c="red")
-        plt.show()
+def find_nearest_neighbours(refls, N=5):
+    """Find the nearest neighbours of spectra among the mixnorm reference spectra.
+
+    Parameters
+    ----------
+    refls : np.ndarray
+        The reflectance of the spectra on the wavelength grid of the taxonomy, one
+        row per spectrum. Missing bins are NaN.
+    N : int
+        The number of nearest neighbours to return. Default is 5.
+
+    Returns
+    -------
+    np.ndarray
+        The indices of the nearest neighbours of each spectrum, ordered by
+        increasing distance. Shape is (len(refls), N).
+    """
+    _, neighbours = index.data.load("mixnorm")
+
+    if SEARCH.get("neighbours") is not neighbours:
+        SEARCH["neighbours"] = neighbours
+        SEARCH["search"] = NeighbourSearch(neighbours[defs.WAVE_GRID_STR].values)
+
+    return SEARCH["search"].query(refls, N)
+
+
+class NeighbourSearch:
+    def __init__(self, reference, min_tree=TREE_MIN_QUERIES):
+        """Nearest-neighbour search among reference spectra with missing bins.
+
+        Parameters
+        ----------
+        reference : np.ndarray
+            The reflectance of the reference spectra, one row per spectrum.
+            Missing bins are NaN.
+        min_tree : int
+            Minimum number of queries sharing the observed bins to build a KD-tree
+            of the reference spectra for them. None disables the trees.
+
+        Notes
+        -----
+        Spectra are compared in the L2-normalized bins they observe. Only reference
+        spectra which cover all of these bins are candidate neighbours. Queries with
+        the same observed bins are searched together.
+        """
+        self.reference = np.asarray(reference, dtype=float)
+        self.min_tree = min_tree
+
+        # Bitmasks of the observed bins of the reference spectra
+        self.observed = np.packbits(np.isfinite(self.reference), axis=1)
+
+        # observed bins : (candidates, others, normalized candidates, KD-tree)
+        self.patterns = {}
+
+    def query(self, refls, N):
+        """Find the nearest neighbours of spectra.
+
+        Parameters
+        ----------
+        refls : np.ndarray
+            The reflectance of the spectra, one row per spectrum. Missing bins are NaN.
+        N : int
+            The number of nearest neighbours to return.
+
+        Returns
+        -------
+        np.ndarray
+            The indices of the nearest reference spectra, ordered by increasing
+            distance. If fewer than N reference spectra cover the observed bins,
+            the remaining indices are taken in order from the other spectra.
+        """
+        refls = np.atleast_2d(np.asarray(refls, dtype=float))
+        masks = np.isfinite(refls)
+
+        nearest = np.empty((len(refls), N), dtype=int)
+        groups = {}
+
+        for i, mask in enumerate(masks):
+            groups.setdefault(mask.tobytes(), []).append(i)
+
+        for members in groups.values():
+            mask = masks[members[0]]
+            candidates, others, reference, tree = self._pattern(mask, len(members))
+
+            queries = preprocessing.normalize(refls[members][:, mask])
+            k = min(N, len(candidates))
+
+            if k == 0:
+                nearest[members] = others[:N]
+                continue
+
+            if tree is not None:
+                closest = tree.query(queries, k=k, return_distance=False)
+            else:
+                closest = _closest(queries, reference, k)
+
+            nearest[members, :k] = candidates[closest]
+            nearest[members, k:] = others[: N - k]
+
+        return nearest
+
+    def _pattern(self, mask, n_queries):
+        """Get the candidate neighbours of spectra observing the given bins."""
+        key = mask.tobytes()
+
+        if key not in self.patterns:
+            bits = np.packbits(mask)
+            is_candidate = ((self.observed & bits) == bits).all(axis=1)
+
+            candidates = np.flatnonzero(is_candidate)
+            reference = preprocessing.normalize(self.reference[candidates][:, mask])
+
+            self.patterns[key] = [
+                candidates,
+                np.flatnonzero(~is_candidate),
+                reference,
+                None,
+            ]
+
+        pattern = self.patterns[key]
+
+        # Frequent patterns are searched with a tree
+        if (
+            pattern[3] is None
+            and self.min_tree is not None
+            and n_queries >= self.min_tree
+            and len(pattern[0])
+        ):
+            pattern[3] = neighbors.KDTree(pattern[2])
+
+        return pattern
+
+
+def _closest(queries, reference, k):
+    """Find the k closest reference rows of each query row in L2 distance."""
+    distances = (
+        (queries**2).sum(axis=1)[:, None]
+        + (reference**2).sum(axis=1)[None, :]
+        - 2 * queries @ reference.T
+    )
+
+    if k < reference.shape[0]:
+        closest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        closest = np.broadcast_to(np.arange(reference.shape[0]), distances.shape)
 
-    spectrum.alpha = alpha
-    spectrum.refl = refl_normalized
+    order = np.argsort(np.take_along_axis(distances, closest, axis=1), axis=1)
+    return np.take_along_axis(closest, order, axis=1)
 
 
 def _find_nearest_neighbours(spec, neighbours, N):
@@ -185,43 +320,11 @@ def _find_nearest_neighbours(spec, neighbours, N):
         The indices of the nearest neighbours.
     """
 
-    # Mask the neighbours to the observed wavelength range
-    spec.mask = np.array([np.isfinite(r) for r in spec.refl])
-    neighbours = neighbours[:, spec.mask]
+    # The observed wavelength range
+    spec.mask = np.isfinite(spec.refl)
 
-    # We cannot compare with neighbours which do not have all bins observed
-    mask_neighbours = np.array(
-        [all(np.isfinite(r) for r in neighbour) for neighbour in neighbours]
-    )
-
-    # Normalize the spectrum and the neighbours using the L2 norm
-    refl_spec = preprocessing.normalize(spec.refl[spec.mask].reshape(1, -1))
-    neighbours[mask_neighbours] = preprocessing.normalize(neighbours[mask_neighbours])
-
-    # Find the closest neighbours in L2 distance
-    distances = np.linalg.norm(
-        refl_spec - neighbours, axis=1
-    )  # No masking here to get same shape as neighbours. Non-matching neighbours have NaN distance
-    closest_neighbours = distances.argsort()[:N]
-
-    if False:
-        import matplotlib.pyplot as plt
-
-        for m in closest_neighbours:
-            plt.plot(
-                classy.defs.WAVE_GRID[spec.mask],
-                refl_spec.T,
-                ls="-",
-                c="black",
-            )
-        plt.plot(
-            classy.defs.WAVE_GRID[spec.mask],
-            neighbours[closest_neighbours].T,
-            ls="--",
-            c="red",
-        )
-        plt.show()
-    return closest_neighbours
+    search = NeighbourSearch(neighbours, min_tree=None)
+    return search.query(spec.refl, N)[0]
 
 
 # ------
@@ -280,7 +383,7 @@ def gem_mixnorm(
 
     it = 0
     reldiff = eps + 1
-    loglik = -np.Inf
+    loglik = -np.inf
 
     # GEM algorithm (GM step followed by E step)
 
@@ -445,90 +548,93 @@ def gem_mixnorm_eval(
 
     INPUT
     ---------
-    X : numpy masked array, incomplete data matrix (each rox is a spectrum)
+    X : numpy masked array or array with NaN for missing bins, incomplete data matrix (each rox is a spectrum)
     K : number of clusters
     mus,sigmas,pis : fixed values of the parameters
     alpha_init : initial value for the shifts alpha, default is a vector of zeros
+    gamma_init : initial value for the cluster assignments, default is computed from alpha_init
     nit_em : maximum number of iterations for the EM algorithm
-    eps : convergence threshold to stop training
+    eps : convergence threshold to stop training, applied to each spectrum
 
     OUTPUT
     ----------
     alpha : values of the offsets after training
     gamma : cluster assignments, matrix of shape (np.shape(X)[0],K) with probabilities
-    loglik : value of the log-likelihood after convergence
+    loglik : value of the average log-likelihood after convergence
     """
+    observed = ~np.ma.getmaskarray(X) & np.isfinite(np.ma.getdata(X))
+    X = np.where(observed, np.ma.getdata(X), 0)
+    weights = observed.astype(float)
+
     n = X.shape[0]
-    d = X.shape[1]
     log_pis = np.log(pis)
 
+    # Terms of the Gaussian log-likelihoods which do not depend on alpha
+    precisions = 1 / sigmas**2
+    mus_precisions = mus * precisions
+
+    const = (
+        -weights @ (mus**2 * precisions) / 2
+        - weights @ np.log(sigmas)
+        - weights.sum(axis=1, keepdims=True) * np.log(2 * np.pi) / 2
+        + log_pis
+    )
+
+    def e_step(rows, alpha):
+        Xminusalpha = (X[rows] - alpha[rows]) * weights[rows]
+        return (
+            -(Xminusalpha**2) @ precisions / 2
+            + Xminusalpha @ mus_precisions
+            + const[rows]
+        )
+
     if alpha_init is None:
         alpha_init = np.zeros((n, 1))
         alpha_init[inds_baseline, 0] = 0
 
+    alpha = np.array(alpha_init, dtype=float).reshape(n, 1)
+
     if gamma_init is None:
-        Xminusalpha = X - alpha_init
-        logits = (
-            np.sum(
-                -((np.expand_dims(Xminusalpha, 2) - np.expand_dims(mus, 0)) ** 2)
-                / (2 * sigmas**2)
-                - np.log(sigmas)
-                - np.log(2 * np.pi) / 2,
-                1,
-            )
-        ) + log_pis  # a verifier
-        gamma_init = scisp.softmax(logits.data, 1)
+        gamma_init = scisp.softmax(e_step(np.arange(n), alpha), 1)
 
     # Initialisation
-    alpha = alpha_init
-    gamma = gamma_init
+    gamma = np.array(gamma_init, dtype=float)
 
+    loglik = np.full(n, -np.inf)
+    active = np.arange(n)
     it = 0
-    reldiff = eps + 1
-    loglik = -np.Inf
 
-    # GEM algorithm (M step followed by E step)
-    while (it <= nit_em) & (reldiff > eps):
+    # GEM algorithm (M step followed by E step), until each spectrum converged
+    while (it <= nit_em) & (active.size > 0):
         it = it + 1
 
         # M step
+        A = gamma[active] @ precisions.T
+        B = gamma[active] @ mus_precisions.T
+        alpha[active, 0] = (weights[active] * (X[active] * A - B)).sum(axis=1) / (
+            weights[active] * A
+        ).sum(axis=1)
 
-        alpha[:, 0] = np.ma.average(
-            a=np.expand_dims(X, 2) - mus,
-            weights=np.expand_dims(gamma, 1) / sigmas**2,
-            axis=(1, 2),
-        )
+        # E step
+        logits = e_step(active, alpha)
+        gamma[active] = scisp.softmax(logits, 1)
+
+        loglik_old = loglik[active]
+        loglik[active] = scisp.logsumexp(logits, 1)
 
         if it > 1:
-            loglik_old = loglik
-            loglik = np.mean(
-                scisp.logsumexp(logits.data, 1)
-            )  # the log-likelihood is computed after the M step, not after the E step
             reldiff = np.abs(
-                (loglik - loglik_old) / loglik
+                (loglik[active] - loglik_old) / loglik[active]
             )  # relative difference to check convergence
-
-        # E step
-        Xminusalpha = X - alpha
-
-        logits = (
-            np.sum(
-                -((np.expand_dims(Xminusalpha, 2) - np.expand_dims(mus, 0)) ** 2)
-                / (2 * sigmas**2)
-                - np.log(sigmas)
-                - np.log(2 * np.pi) / 2,
-                1,
-            )
-        ) + log_pis  # a verifier
-        gamma = scisp.softmax(logits.data, 1)
+            active = active[reldiff > eps]
 
         if (it > 1) & (verbose == True):
             print("---")
             print("Iteration", it)
             print("Average log-likelihood")
-            print(loglik)
+            print(np.mean(loglik))
 
-    return alpha, gamma, loglik
+    return alpha, gamma, np.mean(loglik)
 
 
 def normalize_l2(data):
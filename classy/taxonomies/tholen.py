@@ -8,6 +8,7 @@ import rocks
 
 from classy import config
 from classy import core
+from classy import index
 from classy.utils.logging import logger
 from classy import preprocessing
 from classy import utils
@@ -58,9 +59,14 @@ def preprocess(spec):
     spec : classy.Spectrum
         The spectrum to classify.
     """
+    if not index.preprocessed.load("tholen", [spec]):
+        return
+
     spec.resample(WAVE, fill_value="extrapolate")
     spec.normalize(at=0.55)
 
+    index.preprocessed.store("tholen", [spec])
+
 
 # ------
 # Functions for classification
@@ -7,8 +7,10 @@ import pandas as pd
 import numpy as np
 
 from .logging import logger
+from . import cache  # noqa
 from . import download  # noqa
 from . import progress  # noqa
+from . import store  # noqa
 
 
 def find_nearest(array, value):
@@ -0,0 +1,54 @@
+"""Process-level cache of tabular files read from the classy data directory."""
+
+import pandas as pd
+
+# path : ((mtime, size), DataFrame)
+CACHE = {}
+
+# With copy-on-write, shallow copies are independent of the cached frame
+COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3 or (
+    getattr(pd.options.mode, "copy_on_write", False) is True
+)
+
+
+def read(path, reader):
+    """Read a file through the process cache.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the file to read.
+    reader : callable
+        Function which reads the file at path and returns a pd.DataFrame.
+
+    Returns
+    -------
+    pd.DataFrame
+        Copy of the cached file contents. Modifying it does not affect the cache.
+
+    Notes
+    -----
+    The file is read again if its modification time or size changed since
+    it was cached.
+    """
+    stat = path.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    if path not in CACHE or CACHE[path][0] != key:
+        CACHE[path] = (key, reader(path))
+
+    return CACHE[path][1].copy(deep=not COPY_ON_WRITE)
+
+
+def invalidate(path=None):
+    """Remove a file from the process cache.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the file to remove. Default is None, which clears the full cache.
+    """
+    if path is None:
+        CACHE.clear()
+    else:
+        CACHE.pop(path, None)
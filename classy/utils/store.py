@@ -0,0 +1,210 @@
+"""Keyed tables of the classy data directory stored in SQLite files."""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Seconds to wait for other processes to release the lock on a file
+TIMEOUT = 60
+
+# Maximum number of keys per lookup query
+CHUNKSIZE = 400
+
+
+def connect(path):
+    """Open a connection to a store.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the SQLite file.
+
+    Returns
+    -------
+    sqlite3.Connection
+        The connection to the store.
+
+    Notes
+    -----
+    The store uses the default rollback journal. Writers lock the file and other
+    processes wait up to ``TIMEOUT`` seconds for the lock to be released.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return sqlite3.connect(path, timeout=TIMEOUT)
+
+
+def read(path, table, index, keys=None):
+    """Read entries from a store.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the SQLite file.
+    table : str
+        The name of the table.
+    index : list of str
+        The columns identifying the entries.
+    keys : list of tuple
+        The keys of the entries to read. Default is None, which reads all entries.
+
+    Returns
+    -------
+    pd.DataFrame
+        The entries, indexed by the index columns. Empty if the store or the
+        table do not exist.
+    """
+    empty = pd.DataFrame(
+        index=(
+            pd.MultiIndex.from_arrays([[]] * len(index), names=index)
+            if len(index) > 1
+            else pd.Index([], name=index[0])
+        )
+    )
+
+    if not path.is_file():
+        return empty
+
+    con = connect(path)
+
+    try:
+        if not _has_table(con, table):
+            return empty
+
+        if keys is None:
+            entries = pd.read_sql_query(f'SELECT * FROM "{table}"', con)
+        else:
+            keys = [key if isinstance(key, tuple) else (key,) for key in keys]
+            row = f"({', '.join(['?'] * len(index))})"
+
+            entries = [
+                pd.read_sql_query(
+                    f'SELECT * FROM "{table}" WHERE ({_columns(index)}) '
+                    f"IN (VALUES {', '.join([row] * len(chunk))})",
+                    con,
+                    params=[_to_python(value) for key in chunk for value in key],
+                )
+                for chunk in _chunks(keys)
+            ]
+            entries = pd.concat(entries) if entries else pd.DataFrame(columns=index)
+    finally:
+        con.close()
+
+    return entries.set_index(index)
+
+
+def upsert(path, table, entries):
+    """Insert or update entries of a store.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the SQLite file.
+    table : str
+        The name of the table.
+    entries : pd.DataFrame
+        The entries, indexed by the columns identifying them.
+
+    Notes
+    -----
+    All entries are written in a single transaction. Columns of existing
+    entries which are not in ``entries`` are left unchanged. The table and
+    missing columns are created on the fly.
+    """
+    _write(path, table, entries, replace=False)
+
+
+def replace(path, table, entries):
+    """Replace all entries of a store.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The path to the SQLite file.
+    table : str
+        The name of the table.
+    entries : pd.DataFrame
+        The entries, indexed by the columns identifying them.
+    """
+    _write(path, table, entries, replace=True)
+
+
+def _write(path, table, entries, replace):
+    """Write entries to a store in a single transaction."""
+    index = list(entries.index.names)
+    entries = entries.reset_index()
+    columns = list(entries.columns)
+
+    con = connect(path)
+
+    try:
+        with con:
+            # Lock the store for writing before reading its layout
+            con.execute("BEGIN IMMEDIATE")
+
+            con.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                f"({_columns(index)}, PRIMARY KEY ({_columns(index)}))"
+            )
+
+            existing = [row[1] for row in con.execute(f'PRAGMA table_info("{table}")')]
+
+            for column in columns:
+                if column not in existing:
+                    con.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+
+            if replace:
+                con.execute(f'DELETE FROM "{table}"')
+
+            values = [column for column in columns if column not in index]
+            update = ", ".join(
+                f"{_quote(column)} = excluded.{_quote(column)}" for column in values
+            )
+            update = f"DO UPDATE SET {update}" if values else "DO NOTHING"
+
+            con.executemany(
+                f'INSERT INTO "{table}" ({_columns(columns)}) '
+                f"VALUES ({', '.join(['?'] * len(columns))}) "
+                f"ON CONFLICT ({_columns(index)}) {update}",
+                (
+                    [_to_python(value) for value in row]
+                    for row in entries.itertuples(index=False, name=None)
+                ),
+            )
+    finally:
+        con.close()
+
+
+def _has_table(con, table):
+    """Check whether a table exists in a store."""
+    return (
+        con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        is not None
+    )
+
+
+def _chunks(keys):
+    """Split keys into chunks to respect the limit of query parameters."""
+    for start in range(0, len(keys), CHUNKSIZE):
+        yield keys[start : start + CHUNKSIZE]
+
+
+def _quote(column):
+    return f'"{column}"'
+
+
+def _columns(columns):
+    return ", ".join(_quote(column) for column in columns)
+
+
+def _to_python(value):
+    """Convert a value to a type supported by SQLite."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
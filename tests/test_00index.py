@@ -19,7 +19,7 @@ def test_00build_pds():
     classy.sources.pds._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [
         ("S3OS2", 820),
@@ -44,7 +44,7 @@ def test_00build_cds():
     classy.sources.cds._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for host, count in [("CDS", 93)]:
         assert len(idx[idx.host == host]) == count
@@ -61,7 +61,7 @@ def test_00build_m4ast():
     classy.sources.m4ast._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [("M4AST", 123)]:
         assert len(idx[idx.source == source]) == count
@@ -79,7 +79,7 @@ def test_00build_akari():
     classy.sources.akari._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [("AKARI", 64)]:
         assert len(idx[idx.source == source]) == count
@@ -97,7 +97,7 @@ def test_00build_smass():
     classy.sources.smass._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [("SMASS", 2256)]:
         assert len(idx[idx.source == source]) == count
@@ -117,7 +117,7 @@ def test_00build_mithneos():
     classy.sources.mithneos._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [("MITHNEOS", 1911)]:
         assert len(idx[idx.source == source]) == count
@@ -136,7 +136,7 @@ def test_00build_gaia():
     classy.sources.gaia._build_index()
 
     # Assert based on number of spectra indexed
-    idx = pd.read_csv(pytest.PATH_TEST / "index.csv")
+    idx = pd.read_parquet(pytest.PATH_TEST / "index.parquet")
 
     for source, count in [("Gaia", 60518)]:
         assert len(idx[idx.source == source]) == count
@@ -246,3 +246,63 @@ def test_query():
     # Fail if unknown column is provided
     with pytest.raises(ValueError):
         spectra = classy.index.query(unknown_column=23)
+
+
+def test_index_csv_migration(tmp_path, monkeypatch):
+    """Ensure that CSV indices are migrated to the typed Parquet index."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    pd.DataFrame(
+        {
+            "filename": ["smass/a.txt", "gaia/part00.csv/b"],
+            "name": ["Ceres", "Vesta"],
+            "number": [1, None],
+            "source": ["SMASS", "Gaia"],
+            "host": ["SMASS", "Gaia"],
+            "module": ["smass", "gaia"],
+            "N": [100, 16],
+        }
+    ).to_csv(tmp_path / "index.csv", index=False)
+
+    idx = classy.index.load()
+
+    assert not (tmp_path / "index.csv").is_file()
+    assert (tmp_path / "index.parquet").is_file()
+
+    assert idx.index.name == "filename"
+    assert idx.number.dtype == "Int64"
+    assert pd.isna(idx.loc["gaia/part00.csv/b", "number"])
+
+    for column in classy.index.CATEGORICAL:
+        assert isinstance(idx[column].dtype, pd.CategoricalDtype)
+
+    assert len(classy.index.query(source="SMASS")) == 1
+
+
+def test_index_cache(tmp_path, monkeypatch):
+    """Ensure that the cached index is invalidated on save and protected from callers."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    classy.index.save(
+        pd.DataFrame(
+            {
+                "name": ["Ceres"],
+                "number": [1],
+                "source": ["SMASS"],
+                "host": ["SMASS"],
+                "module": ["smass"],
+                "N": [100],
+            },
+            index=pd.Index(["smass/a.txt"], name="filename"),
+        )
+    )
+
+    idx = classy.index.load()
+    idx.loc["smass/a.txt", "name"] = "Vesta"
+    assert classy.index.load().loc["smass/a.txt", "name"] == "Ceres"
+
+    idx = classy.index.load()
+    idx.loc["smass/b.txt"] = idx.loc["smass/a.txt"]
+    classy.index.save(idx)
+
+    assert len(classy.index.load()) == 2
@@ -6,7 +6,6 @@ import pytest
 
 import classy
 
-
 PATH_TEST_DATA = Path().home() / "astro/cclassy/tests/data/"
 
 
@@ -111,3 +110,422 @@ DEMEO_CLASSES = {
 # @pytest.mark.parametrize("name, class_expected", DEMEO_CLASSES)
 # def test_demeo_classification(name, class_expected):
 #     """Classify asteroids in DeMeo+ 2009 and verify the result."""
+
+
+def test_mahlke_batch():
+    """Classify spectra in the Mahlke system one-by-one and as batch."""
+    wave = np.array(classy.taxonomies.mahlke.WAVE)
+
+    def create_spectra():
+        return [
+            classy.Spectrum(wave, 1 + slope * (wave - 0.55), pV=pV)
+            for slope, pV in [(0.1, 0.05), (0.4, 0.25), (-0.05, np.nan), (0.2, 0.1)]
+        ]
+
+    single = create_spectra()
+    for spec in single:
+        spec.classify(taxonomy="mahlke")
+
+    batch = classy.Spectra(create_spectra())
+    batch.classify(taxonomy="mahlke")
+
+    for spec_single, spec_batch in zip(single, batch):
+        assert spec_single.class_mahlke == spec_batch.class_mahlke
+        assert spec_single.prob == pytest.approx(spec_batch.prob)
+        assert np.allclose(spec_single.scores, spec_batch.scores)
+        assert np.allclose(spec_batch.wave, wave)
+
+
+def test_demeo_batch():
+    """Classify spectra in the DeMeo system one-by-one and as batch."""
+    wave = np.array(classy.taxonomies.demeo.WAVE)
+
+    params = [(-0.15, 0), (-0.15, 0.15), (-0.05, 0.15), (0.1, 0.05), (1.6, 0.15)]
+    expected = ["B", "V", "O", "Q", "Qw"]
+
+    def create_spectra():
+        return [
+            classy.Spectrum(wave, 1 + slope * (wave - 0.55) + amp * np.sin(6 * wave))
+            for slope, amp in params + [(0.1, 0)]
+        ]
+
+    single = create_spectra()
+    for spec in single:
+        spec.classify(taxonomy="demeo")
+
+    batch = classy.Spectra(create_spectra())
+    batch.classify(taxonomy="demeo")
+
+    for spec_single, spec_batch in zip(single, batch):
+        assert spec_single.class_demeo == spec_batch.class_demeo
+        assert np.allclose(spec_single.scores_demeo, spec_batch.scores_demeo)
+        assert spec_single.slope == pytest.approx(spec_batch.slope)
+
+    assert [spec.class_demeo for spec in batch][:-1] == expected
+
+
+def _demeo_reference(spec, corr):
+    """The DeMeo+ 2009 decision tree for a single spectrum, branch by branch."""
+    pc1, pc2, pc3, pc4, pc5 = spec.scores_demeo
+    slope = spec.slope[0]
+    weathered = lambda class_: f"{class_}w" if slope >= 0.25 else class_
+
+    alpha, beta, gamma = -3 * pc2 - 0.28, -3 * pc2 + 0.35, -3 * pc2 + 1.0
+    delta, theta = -3 * pc2 + 1.5, -3 * pc2 + 0.7
+    epsilon, zeta, eta = pc2 / 3 + 0.55, pc2 / 3 - 0.10, pc2 / 3 - 0.40
+
+    if (pc1 < -0.3) and (pc3 >= 0.2) and (slope >= 0.4):
+        if 0.55 <= slope < 1.5:
+            return "A"
+        elif 0.4 <= slope < 0.55:
+            return "Sa"
+
+    if pc1 > alpha:
+        if pc1 >= gamma:
+            return weathered("V")
+        if pc1 <= eta and pc1 >= theta and pc1 < delta:
+            return "O"
+        if pc1 <= eta and pc1 >= alpha and pc1 < theta:
+            return weathered("Q")
+        if pc1 >= eta and pc1 >= gamma and pc1 < delta:
+            return "R"
+        if pc1 < beta and pc1 > zeta:
+            return weathered("S")
+        if pc1 >= alpha and pc1 < beta and pc1 > eta and pc1 <= zeta:
+            return weathered("Sq")
+        if pc1 >= beta and pc1 < gamma and pc1 > eta and pc1 <= epsilon:
+            return weathered("Sr")
+        if pc1 >= beta and pc1 > epsilon and pc1 < gamma:
+            return weathered("Sv")
+        return "S"
+
+    if 0.38 <= slope < 1.5 and -0.44 < pc1 < 0.4:
+        return "A" if corr["A"] > corr["D"] else "D"
+    if 0.25 < slope < 0.38 and -0.28 < pc2 < -0.2 and -0.2 < pc3 < -0.12:
+        return "T"
+    if 0.07 < pc1 < 1.0 and -0.5 < pc2 < -0.15:
+        return "Xe" if spec.e.is_present else "L"
+    if -0.075 < pc3 < 0.14 and -0.2 <= pc2 < 0.1 and -0.8 < pc1 < 0.1:
+        return "Xe" if spec.e.is_present else "K"
+
+    if -0.2 < slope < 0 and -1.2 < pc1 < 0 and pc4 < 0:
+        return "B"
+    if 0.2 < slope < 0.38:
+        if spec.k.is_present:
+            return "Xk"
+        if spec.e.is_present:
+            return "C"
+        return "C" if corr["C"] > corr["X"] else "X"
+    if 0.01 < pc4 < 0.14 and -0.75 < pc1 < -0.27 and spec.refl[0] < 0.92:
+        return "Cgh" if spec.h.is_present else "Xk"
+    if 0.01 < pc4 < 0.14 and -0.75 < pc1 < -0.27:
+        if spec.h.is_present:
+            return "Ch"
+        return "Xk" if spec.k.is_present else "X"
+    if -0.04 < pc4 < 0.02 and -0.07 < pc5 < -0.04:
+        return "Cb"
+    if -0.85 < pc1 < -0.45 and -0.06 < pc5 < 0.02:
+        if spec.h.is_present:
+            return "Ch"
+        return "Xk" if spec.k.is_present else "C"
+    if 0.02 <= pc5 < 0.1 and -0.6 < pc1 < -0.16:
+        if spec.h.is_present:
+            return "Cgh"
+        return "Xk" if spec.k.is_present else "Cg"
+    if -0.45 <= pc1 < 0.1 and -0.06 < pc5 < 0.05:
+        if spec.h.is_present:
+            return "Ch"
+        if spec.e.is_present:
+            return "Xe"
+        return "Xk" if spec.k.is_present else "Xc"
+    if -0.1 <= pc1 < 0.3 and -0.5 < pc2 < -0.2:
+        return "Xe" if spec.e.is_present else "L"
+    return "CX"
+
+
+# (pc1, pc2, pc3, pc4, pc5), slope, refl[0], present features,
+# classes with the closer templates, expected class
+DEMEO_REGIONS = [
+    # Vis-IR step 1
+    ((-0.5, 0, 0.3, 0, 0), 0.6, 1, "", "", "A"),
+    ((-0.5, 0, 0.3, 0, 0), 0.45, 1, "", "", "Sa"),
+    # Vis-IR step 2
+    ((1.2, 0, 0, 0, 0), 0.1, 1, "", "", "V"),
+    ((1.2, 0, 0, 0, 0), 0.3, 1, "", "", "Vw"),
+    ((-0.6, 0.5, 0, 0, 0), 0.1, 1, "", "", "O"),
+    ((-1.0, 0.5, 0, 0, 0), 0.1, 1, "", "", "Q"),
+    ((-1.0, 0.5, 0, 0, 0), 0.3, 1, "", "", "Qw"),
+    ((0.1, 0, 0, 0, 0), 0.1, 1, "", "", "S"),
+    ((0.1, 0, 0, 0, 0), 0.3, 1, "", "", "Sw"),
+    ((-0.2, 0, 0, 0, 0), 0.1, 1, "", "", "Sq"),
+    ((-0.2, 0, 0, 0, 0), 0.3, 1, "", "", "Sqw"),
+    ((0.45, 0, 0, 0, 0), 0.1, 1, "", "", "Sr"),
+    ((0.45, 0, 0, 0, 0), 0.3, 1, "", "", "Srw"),
+    ((0.8, 0, 0, 0, 0), 0.1, 1, "", "", "Sv"),
+    ((0.8, 0, 0, 0, 0), 0.3, 1, "", "", "Svw"),
+    # Vis-IR step 3
+    ((-0.35, 0, 0, 0, 0), 0.5, 1, "", "A", "A"),
+    ((-0.35, 0, 0, 0, 0), 0.5, 1, "", "D", "D"),
+    ((0, -0.25, -0.15, 0, 0), 0.3, 1, "", "", "T"),
+    ((0.3, -0.3, 0.5, 0, 0), 0.1, 1, "", "", "L"),
+    ((0.3, -0.3, 0.5, 0, 0), 0.1, 1, "e", "", "Xe"),
+    ((-0.5, 0, 0, 0, 0), 0.1, 1, "", "", "K"),
+    ((-0.5, 0, 0, 0, 0), 0.1, 1, "e", "", "Xe"),
+    # C- and X-complexes
+    ((-0.5, 0, 0.3, -0.05, 0), -0.1, 1, "", "", "B"),
+    ((-0.5, 0, 0.3, 0, 0), 0.3, 1, "k", "", "Xk"),
+    ((-0.5, 0, 0.3, 0, 0), 0.3, 1, "e", "", "C"),
+    ((-0.5, 0, 0.3, 0, 0), 0.3, 1, "", "C", "C"),
+    ((-0.5, 0, 0.3, 0, 0), 0.3, 1, "", "X", "X"),
+    ((-0.5, 0, 0.3, 0.05, 0), 0.1, 0.9, "h", "", "Cgh"),
+    ((-0.5, 0, 0.3, 0.05, 0), 0.1, 0.9, "", "", "Xk"),
+    ((-0.5, 0, 0.3, 0.05, 0), 0.1, 1, "h", "", "Ch"),
+    ((-0.5, 0, 0.3, 0.05, 0), 0.1, 1, "k", "", "Xk"),
+    ((-0.5, 0, 0.3, 0.05, 0), 0.1, 1, "", "", "X"),
+    ((-0.5, 0, 0.3, 0, -0.05), 0.1, 1, "", "", "Cb"),
+    ((-0.6, 0, 0.3, -0.1, 0), 0.1, 1, "h", "", "Ch"),
+    ((-0.6, 0, 0.3, -0.1, 0), 0.1, 1, "k", "", "Xk"),
+    ((-0.6, 0, 0.3, -0.1, 0), 0.1, 1, "", "", "C"),
+    ((-0.3, 0, 0.3, -0.1, 0.05), 0.1, 1, "h", "", "Cgh"),
+    ((-0.3, 0, 0.3, -0.1, 0.05), 0.1, 1, "k", "", "Xk"),
+    ((-0.3, 0, 0.3, -0.1, 0.05), 0.1, 1, "", "", "Cg"),
+    ((-0.35, 0, 0.3, -0.1, 0), 0.1, 1, "h", "", "Ch"),
+    ((-0.35, 0, 0.3, -0.1, 0), 0.1, 1, "e", "", "Xe"),
+    ((-0.35, 0, 0.3, -0.1, 0), 0.1, 1, "k", "", "Xk"),
+    ((-0.35, 0, 0.3, -0.1, 0), 0.1, 1, "", "", "Xc"),
+    ((0, -0.3, 0.3, -0.1, 0.2), 0.1, 1, "e", "", "Xe"),
+    ((0, -0.3, 0.3, -0.1, 0.2), 0.1, 1, "", "", "L"),
+    ((-1.5, 0, 0.3, -0.1, 0.2), 0.1, 1, "", "", "CX"),
+]
+
+
+def _demeo_spectra(scores, slope, refl, features, closest):
+    """Create stand-ins of preprocessed spectra for the DeMeo decision tree."""
+    from types import SimpleNamespace
+
+    spectra = []
+
+    for i, (scores_, slope_, refl_) in enumerate(zip(scores, slope, refl)):
+        spec = SimpleNamespace(
+            name=f"spec{i}", scores_demeo=scores_, slope=(slope_, 1), refl=refl_
+        )
+
+        for feature in "ehk":
+            setattr(spec, feature, SimpleNamespace(is_present=feature in features[i]))
+
+        spec.corr = {class_: float(class_ in closest[i]) for class_ in "ADCX"}
+        spectra.append(spec)
+
+    return spectra
+
+
+def test_demeo_decision_tree(monkeypatch):
+    """The vectorized DeMeo decision tree follows the branches of DeMeo+ 2009."""
+    demeo = classy.taxonomies.demeo
+
+    monkeypatch.setattr(
+        demeo,
+        "_compute_template_correlation",
+        lambda spec, classes: [spec.corr[class_] for class_ in classes],
+    )
+
+    scores, slope, refl0, features, closest, expected = zip(*DEMEO_REGIONS)
+
+    scores = np.array(scores)
+    slope = np.array(slope)
+    refl = np.ones((len(scores), len(demeo.WAVE)))
+    refl[:, 0] = refl0
+
+    spectra = _demeo_spectra(scores, slope, refl, features, closest)
+    classes = demeo.decision_tree(spectra, refl, scores, slope)
+
+    assert list(classes) == list(expected)
+    assert list(classes) == [_demeo_reference(spec, spec.corr) for spec in spectra]
+
+    # Random spectra around the decision boundaries
+    rng = np.random.default_rng(0)
+    N = 5000
+
+    scores = rng.normal(0, 0.5, (N, 5)) * [1, 0.3, 0.3, 0.1, 0.05]
+    slope = rng.uniform(-0.4, 1.8, N)
+    refl = rng.uniform(0.8, 1.1, (N, len(demeo.WAVE)))
+    features = ["".join(rng.choice(list("ehk"), rng.integers(0, 3))) for _ in range(N)]
+    closest = [rng.choice(["AC", "AX", "DC", "DX"]) for _ in range(N)]
+
+    spectra = _demeo_spectra(scores, slope, refl, features, closest)
+    classes = demeo.decision_tree(spectra, refl, scores, slope)
+
+    assert list(classes) == [_demeo_reference(spec, spec.corr) for spec in spectra]
+
+
+def test_model_registry():
+    """Model artifacts are loaded once per process and served from the registry."""
+    classy.index.data.clear()
+    assert classy.index.data.stats().empty
+
+    classy.index.data.warm(["gmm", "mixnorm"])
+    stats = classy.index.data.stats()
+    assert set(stats.resource) == {"gmm", "mixnorm"}
+    assert (stats.hits == 0).all()
+
+    gmm, classes = classy.index.data.load("gmm", cluster=29)
+    assert gmm is classy.index.data.load("gmm", cluster=29)[0]
+
+    stats = classy.index.data.stats().set_index(["resource", "cluster"])
+    assert stats.loc[("gmm", 29), "hits"] == 2
+
+    with pytest.raises(ValueError):
+        classy.index.data.warm(["unknown"])
+
+    classy.index.data.clear()
+    assert classy.index.data.stats().empty
+
+
+def test_neighbour_search():
+    """The batched neighbour search matches the search of single spectra."""
+    from sklearn import preprocessing
+
+    from classy.taxonomies.mahlke import mixnorm
+
+    rng = np.random.default_rng(0)
+
+    reference = rng.uniform(0.5, 1.5, (300, 20))
+    reference[rng.uniform(size=reference.shape) < 0.1] = np.nan
+    reference[:100, 12:] = np.nan
+
+    refls = rng.uniform(0.5, 1.5, (60, 20))
+    refls[::2, 10:] = np.nan
+    refls[1::4, :3] = np.nan
+
+    def search(refl, N=5):
+        mask = np.isfinite(refl)
+        neighbours = reference[:, mask].copy()
+        valid = np.isfinite(neighbours).all(axis=1)
+        neighbours[valid] = preprocessing.normalize(neighbours[valid])
+        distances = np.linalg.norm(
+            preprocessing.normalize(refl[mask].reshape(1, -1)) - neighbours, axis=1
+        )
+        return distances.argsort()[:N]
+
+    expected = np.array([search(refl) for refl in refls])
+
+    for min_tree in [None, 1]:
+        nearest = mixnorm.NeighbourSearch(reference, min_tree=min_tree).query(refls, 5)
+        assert np.array_equal(nearest, expected)
+
+    # Fewer candidates than neighbours
+    reference = np.ones((6, 4))
+    reference[[0, 2, 3, 5], 1] = np.nan
+    reference[4] = [1, 2, 3, 4]
+
+    nearest = mixnorm.NeighbourSearch(reference).query([[1, 1, 1, np.nan]], 4)
+    assert nearest.tolist() == [[1, 4, 0, 2]]
+
+
+def test_mixnorm_normalize_batch():
+    """The GEM normalization recovers the alphas of the reference spectra."""
+    from classy.taxonomies.mahlke import defs, mixnorm
+
+    normalization, neighbours = classy.index.data.load("mixnorm")
+
+    rows = np.arange(0, len(neighbours), 100)
+    X = np.log(neighbours[defs.WAVE_GRID_STR].values[rows])
+    shift = np.linspace(-1, 1, len(rows))
+
+    alphas = mixnorm.normalize_batch(X + shift[:, None])
+    assert np.median(np.abs(alphas - shift - neighbours.alpha.values[rows])) < 1e-4
+
+    # Masked arrays and NaN are equivalent, rows without data are not normalized
+    X[1, :20] = np.nan
+    X[2] = np.nan
+
+    alphas = mixnorm.normalize_batch(X)
+    assert np.isnan(alphas[2])
+    assert np.isfinite(alphas[[0, 1]]).all()
+
+    gem = [
+        mixnorm.gem_mixnorm_eval(
+            data,
+            K=defs.MODEL_PARAMETERS["k_norm"],
+            mus=normalization["mus"],
+            sigmas=normalization["sigmas"],
+            pis=normalization["pis"],
+        )[0]
+        for data in [X[:2], np.ma.masked_invalid(X[:2])]
+    ]
+    assert np.allclose(*gem)
+
+
+def test_mcfa_numpy(tmp_path):
+    """The NumPy MCFA model matches the model of the mcfa package."""
+    from classy.index.data import _get_path_data
+    from classy.taxonomies.mahlke import mcfa
+
+    # The shipped parameters are the exported pickle of the mcfa package
+    mcfa.export(_get_path_data() / "mcfa/mcfa.pkl", tmp_path / "mcfa.npz")
+
+    with np.load(tmp_path / "mcfa.npz") as exported, np.load(
+        _get_path_data() / "mcfa/mcfa.npz"
+    ) as shipped:
+        for param in mcfa.PARAMETERS:
+            assert np.array_equal(exported[param], shipped[param])
+
+    model = classy.index.data.load("mcfa")
+    assert isinstance(model, mcfa.MCFA)
+
+    rng = np.random.default_rng(0)
+    Y = model.mean_data[rng.integers(0, model.n_components, 20)]
+    Y = Y + rng.normal(0, 0.05, Y.shape)
+    Y[::3, -1] = np.nan
+    Y[1::4, 30:53] = np.nan
+
+    tau = model.predict_proba(Y)
+    assert np.allclose(tau.sum(axis=1), 1)
+
+    imputed = model.impute(Y)
+    assert np.isfinite(imputed).all()
+    assert np.array_equal(imputed[~np.isnan(Y)], Y[~np.isnan(Y)])
+
+    latent = model.transform(imputed)
+    assert latent.shape == (20, model.n_factors)
+
+    reference = pytest.importorskip("mcfa").from_file(
+        _get_path_data() / "mcfa/mcfa.pkl"
+    )
+
+    assert np.allclose(tau, reference.predict_proba(Y), atol=1e-4)
+    assert np.allclose(imputed, reference.impute(Y), atol=1e-4)
+    assert np.allclose(latent, reference.transform(imputed), atol=1e-4)
+
+
+def test_mcfa_patterns(monkeypatch):
+    """Samples with the same observed features share the factorizations."""
+    from classy.taxonomies.mahlke import mcfa
+
+    model = classy.index.data.load("mcfa")
+    model.factorizations.clear()
+
+    rng = np.random.default_rng(1)
+    Y = model.mean_data[rng.integers(0, model.n_components, 30)]
+    Y = Y + rng.normal(0, 0.05, Y.shape)
+    Y[:10, 30:] = np.nan
+    Y[10:20, :20] = np.nan
+
+    tau = model.predict_proba(Y)
+    assert len(model.factorizations) == 3
+
+    # Scoring each sample on its own gives the same responsibilities
+    for y, tau_y in zip(Y, tau):
+        assert np.allclose(model.predict_proba(y), tau_y)
+
+    imputed = model.impute(Y)
+
+    for y, imputed_y in zip(Y, imputed):
+        assert np.allclose(model.impute(y), imputed_y)
+
+    # Only the most recent patterns are kept
+    monkeypatch.setattr(classy.config, "MCFA_CACHE_SIZE", 1)
+    model.predict_proba(Y[:10])
+
+    assert list(model.factorizations) == [np.packbits(np.isfinite(Y[0])).tobytes()]
+    assert len(mcfa._group_patterns(np.isfinite(Y))) == 3
@@ -177,14 +177,57 @@ def test_adding_spectra():
 
 # ------
 # Spectra functionality
-def test_export():
+def test_export(monkeypatch):
     """Test export functionality"""
 
     def mock_to_csv(*args, **kwargs):
         pass
 
-    pd.DataFrame.to_csv = mock_to_csv
+    monkeypatch.setattr(pd.DataFrame, "to_csv", mock_to_csv)
 
     spectra = classy.Spectra(31)
     spectra.classify()
     spectra.export("testing.csv")
+
+
+def test_resolve_targets_from_bft(tmp_path, monkeypatch):
+    """Targets are resolved from the local ssoBFT and cached with a size limit."""
+    import rocks
+
+    bft = pd.DataFrame({column: [np.nan] * 3 for column in rocks.bft.COLUMNS})
+    bft["id"] = ["Ceres", "Vesta", "Pallas"]
+    bft["name"] = ["Ceres", "Vesta", "Pallas"]
+    bft["number"] = [1, 4, 2]
+    bft["albedo.value"] = [0.09, 0.42, np.nan]
+    bft["taxonomy.class"] = ["C", "V", "B"]
+    bft["children"] = None
+    bft.to_parquet(tmp_path / "bft.parquet")
+
+    monkeypatch.setattr(rocks.bft, "PATH", tmp_path / "bft.parquet")
+    monkeypatch.setattr(classy.config, "TARGET_CACHE_SIZE", 2)
+    classy.index.targets.clear()
+
+    targets = classy.index.targets.resolve(["Vesta", "Ceres", "Vesta"])
+
+    assert set(targets) == {"Ceres", "Vesta"}
+    assert targets["Vesta"].number == 4
+    assert targets["Vesta"].albedo.value == 0.42
+    assert targets["Ceres"].taxonomy.class_.value == "C"
+
+    # Targets are shared between spectra
+    spec = classy.Spectrum(wave=[0.5, 0.6], refl=[1, 1.1], target="Ceres")
+    assert spec.target is targets["Ceres"]
+
+    # The least recently used target is evicted
+    classy.index.targets.get("Pallas")
+    assert list(classy.index.targets.CACHE) == ["Ceres", "Pallas"]
+
+    # Unreadable ssoBFTs are not used for the lookup
+    (tmp_path / "bft.parquet").write_text("not parquet")
+    assert classy.index.targets._lookup_bft(["Vesta"]) == {}
+
+    # ssoBFTs without the requested columns are not used either
+    bft.drop(columns="albedo.value").to_parquet(tmp_path / "bft.parquet")
+    assert classy.index.targets._lookup_bft(["Vesta"]) == {}
+
+    classy.index.targets.clear()
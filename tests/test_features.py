@@ -1,3 +1,8 @@
+import numpy as np
+import pandas as pd
+
+import classy
+
 SPECTRA = [
     ("smass2_13.txt", "h"),
     ("smass2_19.txt", "h"),
@@ -32,3 +37,207 @@ def test_is_covered():
     # ]:
     #     feature = Feature("e", wave, np.ones(wave.shape))
     #     assert feature.is_observed == is_covered
+
+
+def test_polyfit_batch():
+    """Batched polynomial fits and band centers match the individual ones."""
+    rng = np.random.default_rng(1)
+
+    shared = np.linspace(0.8, 1.2, 40)
+    waves = [shared] * 3 + [np.sort(rng.uniform(0.8, 1.2, 40)) for _ in range(2)]
+    values = [
+        1 - 0.1 * np.exp(-0.5 * ((wave - 0.95) / 0.05) ** 2) + rng.normal(0, 0.002, 40)
+        for wave in waves
+    ]
+
+    coeffs = classy.features.polyfit_batch(waves, values, 4)
+
+    for coeffs_, wave, value in zip(coeffs, waves, values):
+        assert np.allclose(coeffs_, np.polyfit(wave, value, 4))
+
+    centers = classy.features.compute_centers(coeffs, 0.85, 1.15)
+    assert np.allclose(centers, 0.95, atol=0.01)
+
+    # No minimum within the limits
+    assert np.isnan(classy.features.compute_centers([[0, 0, 1, 0, 0]], 0.1, 1))
+    assert np.isnan(classy.features.compute_centers([[0, 0, 0, 1, 0]], 0.1, 1))
+
+
+def test_fit_features_auto(tmp_path, monkeypatch):
+    """Features are fit without user interaction and stored in one write."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    rng = np.random.default_rng(0)
+    wave = np.linspace(0.45, 1.1, 120)
+
+    spectra = []
+    for i, depth in enumerate([0.05, 0.0, 0.05, 0.0]):
+        refl = (
+            1
+            + 0.2 * wave
+            - depth * np.exp(-0.5 * ((wave - 0.7) / 0.04) ** 2)
+            + rng.normal(0, 0.002, len(wave))
+        )
+        spectra.append(
+            classy.Spectrum(
+                wave + 0.001 * (i == 2),
+                refl,
+                filename=f"spec{i}.csv",
+                shortbib="",
+                bibcode="",
+            )
+        )
+
+    spectra = classy.Spectra(spectra)
+    spectra.fit_features(feature="h", auto=True)
+
+    assert [spec.h.is_present for spec in spectra] == [True, False, True, False]
+    assert all(not spec.h.is_candidate for spec in spectra)
+    assert abs(spectra[0].h.center - 0.7) < 0.01
+
+    # The batched fit matches the fit of the individual feature
+    feature = classy.features.Feature(
+        "h", classy.Spectrum(spectra[0].wave, spectra[0].refl)
+    )
+    feature.compute_continuum()
+    feature.compute_fit(classy.features.DEG_POLY)
+
+    assert np.isclose(feature.center, spectra[0].h.center)
+    assert np.isclose(feature.depth, spectra[0].h.depth)
+
+    # Parameters are stored and loaded for new spectra
+    stored = classy.features.load()
+    assert len(stored) == 4
+
+    spec = classy.Spectrum(wave, spectra[0].refl, filename="spec0.csv")
+    assert spec.h.is_present
+    assert not spec.h.is_candidate
+    assert spec.e.is_candidate
+
+
+def test_fit_features_auto_sparse(tmp_path, monkeypatch):
+    """Features with too few valid points in their window are not fit."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    wave = np.linspace(0.45, 1.1, 120)
+    sparse = np.concatenate([[0.45, 0.6], np.linspace(0.62, 0.78, 4), [0.85, 1.1]])
+
+    spectra = classy.Spectra(
+        [
+            classy.Spectrum(wave, np.ones(len(wave)), filename="dense.csv"),
+            classy.Spectrum(wave, np.ones(len(wave)), filename="nan.csv"),
+            classy.Spectrum(sparse, np.ones(len(sparse)), filename="sparse.csv"),
+        ]
+    )
+    spectra[1].refl[(wave > 0.6) & (wave < 0.8)] = np.nan
+
+    assert all(spec.h.is_covered for spec in spectra)
+
+    spectra.fit_features(feature="h", auto=True, progress=False)
+
+    assert not spectra[0].h.is_candidate
+
+    for spec in spectra[1:]:
+        assert not spec.h.is_present
+        assert np.isnan(spec.h.center) and np.isnan(spec.h.depth)
+
+    # Only the fitted feature is stored
+    assert list(classy.features.load().index) == [("dense.csv", "h")]
+    assert classy.features.fit_batch([spectra[1].h, spectra[2].h]) == []
+
+
+def test_fit_features_auto_smoothing(tmp_path, monkeypatch):
+    """Spectra are smoothed with their stored parameters before the fit."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    rng = np.random.default_rng(0)
+    wave = np.linspace(0.45, 1.1, 120)
+
+    spectra = classy.Spectra(
+        [
+            classy.Spectrum(
+                wave,
+                1
+                - 0.05 * np.exp(-0.5 * ((wave - 0.7) / 0.04) ** 2)
+                + rng.normal(0, 0.01, len(wave)),
+                filename=f"spec{i}.csv",
+            )
+            for i in range(2)
+        ]
+    )
+
+    classy.preprocessing.store_smoothing(
+        pd.DataFrame(
+            {
+                "smooth": True,
+                "method": "savgol",
+                "deg_savgol": 3,
+                "window_savgol": 11,
+                "deg_spline": 3,
+                "wave_min": 0.5,
+                "wave_max": 1.05,
+                "number": 1,
+            },
+            index=pd.Index(["spec0.csv"], name="filename"),
+        )
+    )
+
+    expected = spectra[0].copy()
+    expected.smooth()
+
+    spectra.fit_features(feature="h", auto=True)
+
+    assert spectra[0].is_smoothed and not spectra[1].is_smoothed
+    assert np.array_equal(spectra[0].wave, expected.wave)
+    assert np.allclose(spectra[0].refl, expected.refl)
+
+    feature = classy.features.Feature(
+        "h", classy.Spectrum(expected.wave, expected.refl)
+    )
+    feature.compute_continuum()
+    feature.compute_fit(classy.features.DEG_POLY)
+
+    assert np.isclose(feature.center, spectra[0].h.center)
+
+
+def test_feature_index(tmp_path, monkeypatch):
+    """Legacy CSV indices are migrated and entries are upserted by key."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    legacy = pd.DataFrame(
+        {
+            "filename": ["a.csv", "a.csv", "b.csv"],
+            "feature": ["e", "h", "h"],
+            "is_present": [True, False, True],
+            "center": [0.5, np.nan, 0.7],
+            "number": [1, np.nan, 2],
+        }
+    )
+    legacy.to_csv(tmp_path / "features.csv", index=False)
+
+    features = classy.features.load()
+    assert len(features) == 3
+    assert (tmp_path / "features.db").is_file()
+    assert features.is_present.dtype == bool
+    assert np.isnan(features.loc[("a.csv", "h"), "center"])
+
+    entry = classy.features.lookup([("b.csv", "h")])
+    assert entry.loc[("b.csv", "h"), "number"] == 2
+    assert classy.features.lookup([("c.csv", "h")]).empty
+
+    update = pd.DataFrame(
+        {
+            "filename": ["a.csv", "c.csv"],
+            "feature": ["h", "k"],
+            "is_present": [True, False],
+            "depth": [2.0, 0.0],
+        }
+    ).set_index(["filename", "feature"])
+    classy.utils.store.upsert(tmp_path / "features.db", "features", update)
+    classy.utils.cache.invalidate()
+
+    features = classy.features.load()
+    assert len(features) == 4
+    assert features.loc[("a.csv", "h"), "is_present"]
+    assert features.loc[("a.csv", "h"), "depth"] == 2.0
+    assert features.loc[("a.csv", "e"), "center"] == 0.5
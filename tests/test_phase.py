@@ -0,0 +1,125 @@
+"""Test the phase angle queries against a local stand-in for Miriade."""
+
+import asyncio
+import threading
+
+from aiohttp import web
+import numpy as np
+import pandas as pd
+import pytest
+
+import classy
+from classy.index import phase
+
+
+@pytest.fixture
+def miriade(monkeypatch, tmp_path):
+    """Serve phase angles equal to the day of month of each uploaded epoch."""
+    requests = []
+
+    async def ephemcc(request):
+        data = await request.post()
+        epochs = data["epochs"].file.read().decode().split("\n")
+        requests.append((request.query["-name"], epochs))
+
+        # The first two queries of an asteroid fail to test the retries
+        if (
+            request.query["-name"] == "a:Flaky"
+            and [name for name, _ in requests].count("a:Flaky") < 3
+        ):
+            return web.Response(status=503)
+        if request.query["-name"] == "a:Unknown":
+            return web.json_response({"error": "unknown target"})
+
+        return web.json_response(
+            {"data": [{"phase": float(epoch[8:10])} for epoch in epochs]}
+        )
+
+    app = web.Application()
+    app.router.add_post("/ephemcc_query.php", ephemcc)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(
+        classy.config, "MIRIADE_URL", f"http://127.0.0.1:{port}/ephemcc_query.php"
+    )
+    monkeypatch.setattr(classy.config, "MIRIADE_BACKOFF", 0.01)
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    yield requests
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_get_phases(miriade):
+    """Epochs are queried once per asteroid and mapped back to the observations."""
+    obs = pd.DataFrame(
+        {
+            "name": ["Ceres", "Ceres", "Flaky", "Ceres", "Unknown"],
+            "date_obs": [
+                "2020-01-10T00:00:00",
+                "2020-01-02T00:00:00,2020-01-04T00:00:00",
+                "2021-05-07T00:00:00",
+                "2020-01-10T00:00:00",
+                "2021-05-07T00:00:00",
+            ],
+        },
+        index=[10, 11, 12, 13, 14],
+    )
+
+    phases = phase.get_phases(obs)
+
+    assert phases.index.tolist() == obs.index.tolist()
+    assert phases.loc[[10, 11, 12, 13], "phase"].tolist() == [10, 3, 7, 10]
+    assert phases.loc[[10, 11, 12, 13], "err_phase"].tolist() == [0, 1, 0, 0]
+    assert np.isnan(phases.loc[14, "phase"])
+
+    # One query per asteroid with the unique sorted epochs, plus the retries
+    names = [name for name, _ in miriade]
+    assert names.count("a:Ceres") == 1
+    assert names.count("a:Flaky") == 3
+    assert names.count("a:Unknown") == 1
+
+    epochs = dict(miriade)["a:Ceres"]
+    assert epochs == [
+        "2020-01-02T00:00:00",
+        "2020-01-04T00:00:00",
+        "2020-01-10T00:00:00",
+    ]
+
+
+def test_ephemeris_cache(miriade):
+    """Only epochs which are not in the ephemeris cache are queried."""
+    obs = pd.DataFrame(
+        {
+            "name": ["Ceres", "Vesta"],
+            "date_obs": ["2020-01-10T00:00:00", "2020-02-03T00:00:00"],
+        }
+    )
+
+    phase.get_phases(obs)
+    assert len(miriade) == 2
+
+    phases = phase.get_phases(obs)
+    assert len(miriade) == 2
+    assert phases.phase.tolist() == [10, 3]
+
+    # Only the new epoch is queried, also by the synchronous queries
+    assert phase.get_phase_angles(
+        "Ceres", ["2020-01-12T00:00:00", "2020-01-10T00:00:00"]
+    ) == [12, 10]
+    assert miriade[-1] == ("a:Ceres", ["2020-01-12T00:00:00"])
+
+    phase.clear_cache()
+    phase.get_phases(obs)
+    assert len(miriade) == 5
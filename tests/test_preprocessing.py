@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 import pytest
 
 import classy
@@ -63,3 +64,247 @@ def test_slope_removal():
     spec.remove_slope()
     assert hasattr(spec, "slope")
     assert np.round(spec.slope[0], 3) == pytest.approx(0.068)
+
+
+@pytest.mark.parametrize("fill_value", [np.nan, "extrapolate"])
+def test_resample_batch(fill_value):
+    """Batch resampling matches resampling each spectrum with interp1d."""
+    rng = np.random.default_rng(0)
+    grid = classy.taxonomies.mahlke.WAVE
+
+    waves, refls = [], []
+    for _ in range(50):
+        lower = rng.uniform(0.3, 1.0)
+        wave = np.sort(rng.uniform(lower, lower + rng.uniform(0.1, 2), 100))
+        waves.append(wave)
+        refls.append(rng.uniform(0.8, 1.2, 100))
+
+    # Spectrum on the grid itself, with points exactly on the edges
+    waves.append(np.array(grid))
+    refls.append(rng.uniform(0.8, 1.2, len(grid)))
+
+    wave, refl, offsets = classy.preprocessing.pack(waves, refls)
+    wave_input, refl_input = wave.copy(), refl.copy()
+
+    refl_grid = classy.preprocessing.resample_batch(
+        wave, refl, offsets, grid, fill_value=fill_value
+    )
+
+    assert refl_grid.shape == (len(waves), len(grid))
+    assert np.array_equal(wave, wave_input) and np.array_equal(refl, refl_input)
+
+    kwargs = (
+        {"fill_value": "extrapolate"}
+        if fill_value == "extrapolate"
+        else {"fill_value": np.nan, "bounds_error": False}
+    )
+
+    for wave_, refl_, refl_grid_ in zip(waves, refls, refl_grid):
+        expected = classy.preprocessing.resample(wave_, refl_, grid, **kwargs)
+        assert np.allclose(refl_grid_, expected, equal_nan=True)
+
+    assert np.allclose(refl_grid[-1], refls[-1])
+
+
+@pytest.mark.parametrize("translate_to", [None, 0.55])
+def test_remove_slope_batch(translate_to):
+    """Batch slope removal matches removing the slope of each spectrum."""
+    rng = np.random.default_rng(0)
+
+    waves, refls = [], []
+    for _ in range(20):
+        wave = np.sort(rng.uniform(0.45, 2.45, rng.integers(10, 200)))
+        waves.append(wave)
+        refls.append(1 + rng.uniform(-0.2, 0.5) * wave + rng.normal(0, 0.02, len(wave)))
+
+    wave, refl, offsets = classy.preprocessing.pack(waves, refls)
+    refl_input = refl.copy()
+
+    refl_flat, slopes = classy.preprocessing.remove_slope_batch(
+        wave, refl, offsets, translate_to=translate_to
+    )
+
+    assert slopes.shape == (len(waves), 2)
+    assert np.array_equal(refl, refl_input)
+
+    for i, (wave_, refl_) in enumerate(zip(waves, refls)):
+        expected, slope = classy.preprocessing.remove_slope(
+            wave_, refl_.copy(), translate_to
+        )
+
+        assert np.allclose(slopes[i], slope)
+        assert np.allclose(refl_flat[offsets[i] : offsets[i + 1]], expected)
+
+
+def test_savitzky_golay_batch():
+    """Batch Savitzky-Golay filtering matches filtering each spectrum."""
+    rng = np.random.default_rng(0)
+
+    refls, windows, orders = [], [], []
+    for i in range(60):
+        refl = rng.uniform(0.8, 1.2, rng.integers(30, 120))
+        if i % 4 == 0:
+            refl[rng.integers(0, len(refl), 3)] = np.nan
+
+        refls.append(refl)
+        windows.append(int(rng.choice([5, 6, 11, 21])))
+        orders.append(int(rng.choice([2, 3])))
+
+    smoothed = classy.preprocessing.savitzky_golay_batch(refls, windows, orders)
+
+    for refl, window, order, result in zip(refls, windows, orders, smoothed):
+        expected = classy.preprocessing.savitzky_golay(
+            refl.copy(), window_length=window, polyorder=order
+        )
+        np.testing.assert_allclose(result, expected, rtol=1e-10, atol=1e-12)
+
+    # Default parameters
+    for refl, result in zip(refls, classy.preprocessing.savitzky_golay_batch(refls)):
+        np.testing.assert_allclose(
+            result, classy.preprocessing.savitzky_golay(refl.copy()), atol=1e-12
+        )
+
+
+def test_smooth_stored_parameters(tmp_path, monkeypatch):
+    """Spectra are smoothed in bulk with the parameters of the smoothing index."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    rng = np.random.default_rng(0)
+    wave = np.linspace(0.45, 2.45, 200)
+
+    spectra = classy.Spectra(
+        [
+            classy.Spectrum(wave, rng.uniform(0.8, 1.2, 200), filename=f"spec{i}.csv")
+            for i in range(4)
+        ]
+    )
+
+    smoothing = pd.DataFrame(
+        {
+            "smooth": [True, True, False, True],
+            "method": ["savgol", "savgol", "savgol", "spline"],
+            "deg_savgol": [3, 2, 3, 3],
+            "window_savgol": [11, 21, 11, 11],
+            "deg_spline": 3,
+            "wave_min": [0.5, 0.45, 0.6, 0.45],
+            "wave_max": 2.0,
+            "number": 1,
+        },
+        index=pd.Index([f"spec{i}.csv" for i in range(4)], name="filename"),
+    )
+    classy.preprocessing.store_smoothing(smoothing)
+
+    expected = [spec.copy() for spec in spectra]
+    for spec in expected:
+        spec.smooth()
+
+    spectra.smooth(progress=False)
+
+    for spec, expected_ in zip(spectra, expected):
+        assert spec.is_smoothed
+        assert np.array_equal(spec.wave, expected_.wave)
+        np.testing.assert_allclose(spec.refl, expected_.refl, atol=1e-12)
+
+
+def test_convex_hull_batch(monkeypatch):
+    """The upper-hull continua match the convex hull computed with qhull."""
+    from scipy.spatial import ConvexHull
+
+    rng = np.random.default_rng(0)
+
+    spectra = []
+    for i in range(30):
+        wave = np.sort(rng.uniform(0.45, 2.45, rng.integers(5, 150)))
+        refl = (
+            1 + 0.1 * np.sin(wave * rng.uniform(1, 10)) + rng.normal(0, 0.02, len(wave))
+        )
+        if i % 3 == 0:
+            refl[rng.integers(0, len(wave), 2)] = np.nan
+        spectra.append(classy.Spectrum(wave, refl))
+
+    spectra = classy.Spectra(spectra)
+    spectra.compute_continuum()
+
+    for spec in spectra:
+        x = spec.wave[~np.isnan(spec.refl)]
+        y = spec.refl[~np.isnan(spec.refl)]
+
+        points = np.c_[x, y]
+        augmented = np.concatenate(
+            [points, [(x[0], np.min(y) - 1), (x[-1], np.min(y) - 1)]], axis=0
+        )
+        hull = ConvexHull(augmented)
+        vertices = points[np.sort([v for v in hull.vertices if v < len(points)])]
+
+        assert np.array_equal(spec.continuum.wave, vertices[:, 0])
+        assert np.array_equal(spec.continuum.refl, vertices[:, 1])
+
+        # The continuum is on or above the spectrum
+        assert np.all(spec.continuum(x) >= y - 1e-12)
+
+    spec = spectra[1].copy()
+    spec.remove_continuum()
+    np.testing.assert_allclose(
+        spec.refl, spectra[1].refl / spectra[1].continuum(spectra[1].wave)
+    )
+
+    # The scan alone finds the same hulls as after the vectorized passes
+    waves = [spec.wave for spec in spectra]
+    refls = [spec.refl for spec in spectra]
+    monkeypatch.setattr(classy.preprocessing, "HULL_PASSES", 0)
+
+    for spec, continuum in zip(
+        spectra, classy.preprocessing.compute_convex_hull_batch(waves, refls)
+    ):
+        assert np.array_equal(continuum.wave, spec.continuum.wave)
+
+    # Spectra without valid reflectances have continua without vertices
+    empty, single = classy.preprocessing.compute_convex_hull_batch(
+        [np.array([0.5, 0.6]), np.array([0.5, 0.6])],
+        [np.full(2, np.nan), np.array([1, np.nan])],
+    )
+    assert len(empty.wave) == 0 and np.isnan(empty([0.5, 0.6])).all()
+    assert len(single.wave) == 1
+
+
+def test_smoothing_index(tmp_path, monkeypatch):
+    """Legacy CSV indices are migrated and entries are upserted by filename."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    pd.DataFrame(
+        {
+            "filename": ["a.csv", "b.csv"],
+            "smooth": [True, False],
+            "method": "savgol",
+            "deg_savgol": 3,
+            "window_savgol": 11,
+            "deg_spline": 3,
+            "wave_min": 0.45,
+            "wave_max": 2.0,
+            "number": [1, 2],
+        }
+    ).to_csv(tmp_path / "smoothing.csv", index=False)
+
+    spec = classy.Spectrum(np.linspace(0.45, 2.0, 50), np.ones(50), filename="a.csv")
+    assert spec.has_smoothing_parameters
+    assert spec.load_smoothing_parameters()["window_savgol"] == 11
+    assert (tmp_path / "smoothing.db").is_file()
+
+    classy.preprocessing.upsert_smoothing(
+        pd.DataFrame(
+            {"smooth": True, "window_savgol": 21},
+            index=pd.Index(["b.csv"], name="filename"),
+        )
+    )
+
+    smoothing = classy.preprocessing.load_smoothing()
+    assert len(smoothing) == 2
+    assert smoothing.smooth.dtype == bool
+    assert smoothing.loc["b.csv", "smooth"]
+    assert smoothing.loc["b.csv", "window_savgol"] == 21
+    assert smoothing.loc["b.csv", "method"] == "savgol"
+
+    assert classy.preprocessing.lookup_smoothing(["c.csv"]).empty
+    assert not classy.Spectrum(
+        np.linspace(0.45, 2.0, 50), np.ones(50), filename="c.csv"
+    ).has_smoothing_parameters
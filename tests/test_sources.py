@@ -1,5 +1,8 @@
 """Test source retrieval and access."""
+import shutil
+
 import numpy as np
+import pandas as pd
 import pytest
 
 import classy
@@ -37,3 +40,324 @@ def create_one_of_each():
 #     """For each shortbib, access one spectrum and some metadata."""
 #
 #     classy.Spectra(name, shortbib=shortbib)
+
+
+def _write_gaia_part(PATH):
+    """Write a synthetic Gaia archive part with three asteroids."""
+    wave = np.arange(374, 1035, 44)
+    rng = np.random.default_rng(0)
+
+    part = []
+    for number, denomination in [(1, "Ceres"), (4, "Vesta"), (np.nan, "2000 AB1")]:
+        part.append(
+            pd.DataFrame(
+                {
+                    "source_id": 42,
+                    "solution_id": 7,
+                    "number_mp": number,
+                    "denomination": denomination,
+                    "nb_samples": 16,
+                    "num_of_spectra": 3,
+                    "reflectance_spectrum": rng.uniform(0.8, 1.2, 16),
+                    "reflectance_spectrum_err": rng.uniform(0.01, 0.02, 16),
+                    "wavelength": wave,
+                    "reflectance_spectrum_flag": rng.integers(0, 3, 16),
+                }
+            )
+        )
+    part = pd.concat(part)
+    part.loc[part.wavelength == wave[-1], "reflectance_spectrum"] = np.nan
+
+    # Shuffle rows, the store has to sort them by wavelength
+    part.sample(frac=1, random_state=1).to_csv(
+        PATH / "00.csv.gz", compression="gzip", index=False
+    )
+    return part
+
+
+def test_gaia_store(tmp_path, monkeypatch):
+    """Gaia spectra are read from the memory-mapped store of their part."""
+    monkeypatch.setattr(classy.sources.gaia, "PATH", tmp_path)
+    classy.sources.gaia._load_store.cache_clear()
+
+    part = _write_gaia_part(tmp_path)
+    wave = np.unique(part.wavelength)
+
+    for denomination, expected in part.groupby("denomination"):
+        idx = pd.Series(
+            {"name": denomination, "number": expected.number_mp.values[0]},
+            name=f"gaia/part00/{denomination}.csv",
+        )
+        data = classy.sources.gaia._load_virtual_file(idx)
+
+        assert len(data) == 15
+        assert np.allclose(data.wave, wave[:-1] / 1000)
+        assert np.allclose(data.refl, expected.reflectance_spectrum.values[:-1])
+        assert np.array_equal(data.flag, expected.reflectance_spectrum_flag[:-1])
+        assert (data.denomination == denomination).all()
+
+    # Full loading chain including the Tinaut-Ruano+ 2023 correction
+    idx["host"], idx["module"] = "Gaia", "gaia"
+    data, meta = classy.sources.load_data(idx)
+
+    assert np.isclose(
+        data.refl.values[0], expected.reflectance_spectrum.values[0] * 1.07
+    )
+    assert meta["denomination"] == denomination
+
+    assert (tmp_path / "part00/meta.parquet").is_file()
+
+    # Rebuilding replaces the files, memory maps of the previous store stay valid
+    store = classy.sources.gaia._load_store("00")
+    refl = np.array(store["refl"])
+
+    part["reflectance_spectrum"] *= 2
+    classy.sources.gaia._build_store(part, tmp_path / "part00")
+
+    assert np.array_equal(store["refl"], refl, equal_nan=True)
+    assert not list((tmp_path / "part00").glob(".*.tmp"))
+
+    classy.sources.gaia._load_store.cache_clear()
+    assert np.allclose(
+        classy.sources.gaia._load_store("00")["refl"], 2 * refl, equal_nan=True
+    )
+    classy.sources.gaia._load_store.cache_clear()
+
+
+def test_load_spectra(tmp_path, monkeypatch):
+    """Bulk loading gives the same spectra in the same order as row-wise loading."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+    monkeypatch.setattr(classy.sources.gaia, "PATH", tmp_path / "gaia")
+    classy.sources.gaia._load_store.cache_clear()
+
+    (tmp_path / "gaia").mkdir()
+    _write_gaia_part(tmp_path / "gaia")
+
+    (tmp_path / "smass/smass2").mkdir(parents=True)
+    for number in [13, 19]:
+        shutil.copy(
+            pytest.PATH_DATA / f"smass2_{number}.txt",
+            tmp_path / f"smass/smass2/a{number}.spfit",
+        )
+
+    filenames = [
+        "gaia/part00/Vesta.csv",
+        "smass/smass2/a13.spfit",
+        "gaia/part00/2000 AB1.csv",
+        "smass/smass2/a19.spfit",
+        "gaia/part00/Ceres.csv",
+    ]
+    idx = pd.DataFrame(
+        {
+            "name": ["Vesta", "Egeria", "2000 AB1", "Egeria", "Ceres"],
+            "number": [4, 13, np.nan, 13, 1],
+            "host": ["Gaia", "SMASS", "Gaia", "SMASS", "Gaia"],
+            "module": ["gaia", "smass", "gaia", "smass", "gaia"],
+            "source": ["Gaia", "SMASS", "Gaia", "SMASS", "Gaia"],
+            "shortbib": "",
+            "bibcode": "",
+            "date_obs": "",
+            "phase": np.nan,
+        },
+        index=pd.Index(filenames, name="filename"),
+    )
+
+    spectra = classy.sources.load_spectra(idx, skip_target=True)
+
+    assert [spec.filename for spec in spectra] == filenames
+
+    for spec, (_, entry) in zip(spectra, idx.iterrows()):
+        expected = classy.sources.load_spectrum(entry, skip_target=True)
+
+        assert np.array_equal(spec.wave, expected.wave)
+        assert np.array_equal(spec.refl, expected.refl)
+        assert np.array_equal(spec.flag, expected.flag)
+
+    classy.sources.gaia._load_store.cache_clear()
+
+
+def test_load_spectra_workers(tmp_path, monkeypatch):
+    """Parallel loading keeps the index order and skips spectra that fail."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    (tmp_path / "smass/smass2").mkdir(parents=True)
+    for number in [13, 19, 48, 51]:
+        shutil.copy(
+            pytest.PATH_DATA / f"smass2_{number}.txt",
+            tmp_path / f"smass/smass2/a{number}.spfit",
+        )
+
+    filenames = [f"smass/smass2/a{number}.spfit" for number in [51, 13, 99, 48, 19]]
+    idx = pd.DataFrame(
+        {
+            "name": "",
+            "host": "SMASS",
+            "module": "smass",
+            "source": "SMASS",
+            "shortbib": "",
+            "bibcode": "",
+            "date_obs": "",
+        },
+        index=pd.Index(filenames, name="filename"),
+    )
+
+    spectra = classy.sources.load_spectra(idx, skip_target=True, workers=2)
+
+    # a99 does not exist
+    assert [spec.filename for spec in spectra] == [
+        f for f in filenames if "a99" not in f
+    ]
+
+    for spec in spectra:
+        expected = classy.sources.load_spectrum(idx.loc[spec.filename], True)
+        assert np.array_equal(spec.refl, expected.refl)
+
+    # Errors other than missing or unreadable files are raised
+    def _transform_data(*args):
+        raise TypeError("Reader is broken.")
+
+    monkeypatch.setattr(classy.sources, "_transform_data", _transform_data)
+
+    with pytest.raises(TypeError):
+        classy.sources.load_spectra(idx, skip_target=True, workers=1)
+
+
+def _write_smass_spectra(PATH):
+    """Copy two SMASS spectra into a data directory and return their index."""
+    (PATH / "smass/smass2").mkdir(parents=True)
+    for number in [13, 19]:
+        shutil.copy(
+            pytest.PATH_DATA / f"smass2_{number}.txt",
+            PATH / f"smass/smass2/a{number}.spfit",
+        )
+
+    return pd.DataFrame(
+        {
+            "name": ["Egeria", "Fortuna"],
+            "host": "SMASS",
+            "module": "smass",
+            "source": "SMASS",
+            "shortbib": "",
+            "bibcode": "",
+            "date_obs": "",
+            "N": [100, 200],
+        },
+        index=pd.Index(
+            [f"smass/smass2/a{number}.spfit" for number in [13, 19]], name="filename"
+        ),
+    )
+
+
+def test_lazy_spectra(tmp_path, monkeypatch):
+    """Lazy spectra only load their data on first access."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+
+    idx = _write_smass_spectra(tmp_path)
+    spectra = classy.Spectra(idx, skip_target=True, lazy=True)
+
+    assert len(spectra) == 2
+    assert [spec.N for spec in spectra] == [100, 200]
+    assert spectra[0].name == "SMASS/Egeria"
+
+    export = spectra.export(columns=["name", "filename", "class_mahlke"])
+    assert list(export.columns) == ["name", "filename"]
+    assert not any(spec._is_loaded for spec in spectra)
+
+    # Skipped targets are looked up without loading the data
+    assert not hasattr(spectra[1], "target")
+    assert not spectra[1]._is_loaded
+
+    expected = classy.sources.load_spectrum(idx.iloc[0], skip_target=True)
+
+    assert np.array_equal(spectra[0].refl, expected.refl)
+    assert spectra[0]._is_loaded
+    assert not spectra[1]._is_loaded
+
+    # Target resolution is skipped
+    assert not hasattr(spectra[0], "target")
+
+    # Spectra with missing files lack the data attributes
+    (tmp_path / "smass/smass2/a19.spfit").unlink()
+
+    assert not hasattr(spectra[1], "refl")
+    assert getattr(spectra[1], "wave", None) is None
+    assert not spectra[1]._is_loaded
+
+
+@pytest.mark.parametrize("taxonomy", ["mahlke", "demeo", "tholen"])
+def test_preprocessed_cache(tmp_path, monkeypatch, taxonomy):
+    """Cached preprocessed spectra are restored without loading their data."""
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+    monkeypatch.setattr(classy.config, "CACHE_PREPROCESSED", True)
+    classy.index.preprocessed.clear()
+
+    idx = _write_smass_spectra(tmp_path)
+    system = getattr(classy.taxonomies, taxonomy)
+
+    spectra = classy.Spectra(idx, skip_target=True, lazy=True)
+    for spec in spectra:
+        system.preprocess(spec)
+
+    # Single spectra are written to the cache file when flushing
+    assert not (tmp_path / f"preprocessed/{taxonomy}.npz").is_file()
+
+    classy.index.preprocessed.flush()
+    assert (tmp_path / f"preprocessed/{taxonomy}.npz").is_file()
+
+    cached = classy.Spectra(idx, skip_target=True, lazy=True)
+    assert all(classy.index.preprocessed.contains(taxonomy, spec) for spec in cached)
+
+    for spec, expected in zip(cached, spectra):
+        system.preprocess(spec)
+
+        assert not spec._is_loaded
+        assert np.array_equal(spec.wave, expected.wave)
+        assert np.allclose(spec.refl, expected.refl, equal_nan=True)
+
+        if taxonomy == "demeo":
+            assert spec.slope == expected.slope
+
+    # Modified spectra are preprocessed again
+    spec = classy.Spectra(idx.iloc[:1], skip_target=True)[0]
+    assert classy.index.preprocessed.contains(taxonomy, spec)
+
+    spec.truncate(wave_max=0.8)
+    assert not classy.index.preprocessed.contains(taxonomy, spec)
+
+    # Lazy spectra are reset to the data on file
+    cached[0].reset_data()
+
+    assert not cached[0]._is_loaded
+    assert np.array_equal(cached[0].wave, spec._wave_original)
+
+
+def test_preprocessed_cache_lock(tmp_path, monkeypatch):
+    """Flushing merges the entries written by other processes in the meantime."""
+    import threading
+
+    monkeypatch.setattr(classy.config, "PATH_DATA", tmp_path)
+    classy.index.preprocessed.clear()
+
+    def entry():
+        return {"key": "key", "wave": np.linspace(0.5, 2, 10), "refl": np.ones(10)}
+
+    classy.index.preprocessed.PENDING["mahlke"] = {"a.csv": entry()}
+    classy.index.preprocessed.flush()
+
+    # Another process holds the lock and adds an entry while this one flushes
+    classy.index.preprocessed.PENDING["mahlke"] = {"b.csv": entry()}
+    writer = threading.Thread(target=classy.index.preprocessed.flush)
+
+    with classy.index.preprocessed._lock("mahlke"):
+        writer.start()
+        writer.join(timeout=0.5)
+        assert writer.is_alive()
+
+        classy.index.preprocessed._merge("mahlke", {"c.csv": entry()})
+
+    writer.join()
+
+    with np.load(tmp_path / "preprocessed/mahlke.npz") as data:
+        assert sorted(data["filename"]) == ["a.csv", "b.csv", "c.csv"]
+
+    assert not list((tmp_path / "preprocessed").glob("*.tmp"))